@@ -1,8 +1,8 @@
-import { useEffect, useState } from "react";
+import { useState } from "react";
 
-import axios from "axios";
-
-import { getCookie } from "../utils/cookies";
+// Thumbnails of new uploads are made in the background, so a missing one is retried for a while
+const THUMBNAIL_RETRIES = 5;
+const THUMBNAIL_RETRY_DELAY_MS = 2000;
 
 // Simple spinner component
 const Spinner = () => (
@@ -20,44 +20,31 @@ const formatDate = dateString => {
   });
 };
 
-function ImageCard({ imageUid }) {
-  const [imageDetail, setImageDetail] = useState(null);
-  const [loadingInfo, setLoadingInfo] = useState(true);
+// imageInfo is undefined while the page metadata is loading, and null if it cannot be found
+function ImageCard({ imageUid, imageInfo }) {
   const [thumbLoading, setThumbLoading] = useState(true);
+  const [thumbAttempt, setThumbAttempt] = useState(0);
 
-  useEffect(() => {
-    const fetchImageInfo = async () => {
-      const access_token = getCookie("access_token");
-      try {
-        const res = await axios.get(`${import.meta.env.VITE_SERVER_URL}/image/info/${imageUid}`, {
-          headers: { Authorization: `Bearer ${access_token}` },
-        });
-
-        setImageDetail({
-          title: res.data.title || "Untitled",
-          file_name: res.data.file_name || "",
-          labels: res.data.labels || [],
-          created_at: res.data.created_at || "",
-          thumbnail_url: `${import.meta.env.VITE_SERVER_URL}/image/thumbnail/${imageUid}`,
-        });
-      } catch (err) {
-        console.error(`Error fetching info for ${imageUid}:`, err);
-        setImageDetail({
+  const imageDetail =
+    imageInfo === null
+      ? {
           title: "Error loading image",
           file_name: "",
           labels: [],
           created_at: "",
           thumbnail_url: "",
-        });
-      } finally {
-        setLoadingInfo(false);
-      }
-    };
-
-    fetchImageInfo();
-  }, [imageUid]);
+        }
+      : imageInfo && {
+          title: imageInfo.title || "Untitled",
+          file_name: imageInfo.file_name || "",
+          labels: imageInfo.labels || [],
+          created_at: imageInfo.created_at || "",
+          thumbnail_url:
+            `${import.meta.env.VITE_SERVER_URL}/image/thumbnail/${imageUid}` +
+            (thumbAttempt > 0 ? `?attempt=${thumbAttempt}` : ""),
+        };
 
-  if (loadingInfo || !imageDetail) {
+  if (!imageDetail) {
     // Placeholder while fetching metadata
     return (
       <div className="border border-green-700 bg-gray-900 bg-opacity-30 overflow-hidden animate-pulse">
@@ -90,7 +77,12 @@ function ImageCard({ imageUid }) {
           alt={imageDetail.title}
           className="w-full h-full object-cover bg-gray-800"
           onLoad={() => setThumbLoading(false)}
-          onError={() => setThumbLoading(true)}
+          onError={() => {
+            setThumbLoading(true);
+            if (thumbAttempt < THUMBNAIL_RETRIES) {
+              setTimeout(() => setThumbAttempt(attempt => attempt + 1), THUMBNAIL_RETRY_DELAY_MS);
+            }
+          }}
         />
       </div>
 
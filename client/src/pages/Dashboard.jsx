@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 
 import axios from "axios";
 import { Upload } from "lucide-react";
@@ -21,11 +21,14 @@ function Dashboard() {
 
   const imagesPerPage = 30;
   const [imageUIDs, setImageUIDs] = useState([]);
+  const [imagesInfo, setImagesInfo] = useState({});
   const [page, setPage] = useState(1);
   const [totalPages, setTotalPages] = useState(1);
   const [sortBy, setSortBy] = useState("created_at");
   const [sortOrder, setSortOrder] = useState("desc");
   const [toggledLabels, setToggledLabels] = useState([]);
+  // Cursor of each page reached so far, reset whenever the sorting or label filter changes
+  const cursors = useRef({ key: null, pages: {} });
 
   useEffect(() => {
     pageInitialize();
@@ -35,17 +38,26 @@ function Dashboard() {
     const access_token = getCookie("access_token");
     try {
       const response = await axios.get(`${import.meta.env.VITE_SERVER_URL}/user/info`, {
-        params: { keys: "image_count,labels" },
+        params: { keys: "image_count" },
         headers: { Authorization: `Bearer ${access_token}` },
       });
       setImageCount(response.data.image_count);
-      setAllLabels(response.data.labels);
+      await fetchLabelFacets();
       setInitializing(false);
     } catch (error) {
       console.error("Error fetching user info while page initialize:", error);
     }
   };
 
+  // Fetch every label of the user along with how many images carry it
+  const fetchLabelFacets = async () => {
+    const access_token = getCookie("access_token");
+    const response = await axios.get(`${import.meta.env.VITE_SERVER_URL}/user/labels`, {
+      headers: { Authorization: `Bearer ${access_token}` },
+    });
+    setAllLabels(response.data.labels);
+  };
+
   useEffect(() => {
     if (imageCount > 0) {
       setTotalPages(Math.ceil(imageCount / imagesPerPage));
@@ -64,16 +76,48 @@ function Dashboard() {
     const access_token = getCookie("access_token");
     try {
       const labels = toggledLabels.length > 0 ? toggledLabels.join(",") : "";
+      const key = [sortBy, sortOrder, labels].join("|");
+      if (cursors.current.key !== key) {
+        cursors.current = { key: key, pages: {} };
+      }
+      // Seek with the cursor left by the previous page; fall back to the page number without one
+      const cursor = cursors.current.pages[page];
+      const position = page === 1 ? {} : cursor ? { cursor: cursor } : { page: page };
       const response = await axios.get(`${import.meta.env.VITE_SERVER_URL}/user/images`, {
-        params: { page: page, sort_by: sortBy, sort_order: sortOrder, labels: labels },
+        params: { ...position, sort_by: sortBy, sort_order: sortOrder, labels: labels },
         headers: { Authorization: `Bearer ${access_token}` },
       });
+      if (response.data.next_cursor) {
+        cursors.current.pages[page + 1] = response.data.next_cursor;
+      }
       setImageUIDs(response.data.image_uid);
+      fetchImagesInfo(response.data.image_uid);
     } catch (error) {
       console.error("Error fetching images:", error);
     }
   };
 
+  // Fetch the metadata of every image on the page in one request
+  const fetchImagesInfo = async uids => {
+    const access_token = getCookie("access_token");
+    setImagesInfo({});
+    try {
+      const response = await axios.post(
+        `${import.meta.env.VITE_SERVER_URL}/image/info/batch`,
+        { image_uids: uids },
+        { headers: { Authorization: `Bearer ${access_token}` } }
+      );
+      const info = { ...response.data.images };
+      response.data.missing.forEach(uid => {
+        info[uid] = null;
+      });
+      setImagesInfo(info);
+    } catch (error) {
+      console.error("Error fetching image info:", error);
+      setImagesInfo(Object.fromEntries(uids.map(uid => [uid, null])));
+    }
+  };
+
   const toggleLabel = label => {
     setToggledLabels(prev => {
       if (prev.includes(label)) {
@@ -116,11 +160,11 @@ function Dashboard() {
       });
 
       const response = await axios.get(`${import.meta.env.VITE_SERVER_URL}/user/info`, {
-        params: { keys: "image_count,labels" },
+        params: { keys: "image_count" },
         headers: { Authorization: `Bearer ${access_token}` },
       });
       setImageCount(response.data.image_count);
-      setAllLabels(response.data.labels);
+      await fetchLabelFacets();
 
       // Close modal - this will trigger the modal's closing animation
       closeModal();
@@ -215,7 +259,7 @@ function Dashboard() {
               {/* Images Grid */}
               <div className="grid grid-cols-3 gap-4">
                 {imageUIDs.map(uid => (
-                  <ImageCard key={uid} imageUid={uid} />
+                  <ImageCard key={uid} imageUid={uid} imageInfo={imagesInfo[uid]} />
                 ))}
               </div>
 
@@ -245,7 +289,7 @@ function Dashboard() {
                 <div className="space-y-2">
                   {allLabels.length > 0 ? (
                     <div className="flex flex-wrap gap-2">
-                      {allLabels.map((label, index) => (
+                      {allLabels.map(({ label, count }, index) => (
                         <button
                           key={index}
                           onClick={() => toggleLabel(label)}
@@ -255,7 +299,7 @@ function Dashboard() {
                               : "bg-transparent border-green-700 text-green-500 hover:border-green-500 hover:bg-green-900 hover:bg-opacity-10"
                           }`}
                         >
-                          {label}
+                          {label} <span className="opacity-60">{count}</span>
                         </button>
                       ))}
                     </div>
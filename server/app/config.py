@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -11,11 +12,21 @@ STORAGE_PROVIDER = os.getenv("STORAGE_PROVIDER", "supabase")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+SUPABASE_POSTGREST_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_POSTGREST_TIMEOUT_SECONDS", 10))
+SUPABASE_STORAGE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_STORAGE_TIMEOUT_SECONDS", 20))
 
 JWT_SECRET = os.getenv("JWT_SECRET", "")
 JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = 15
 JWT_REFRESH_TOKEN_EXPIRE_DAYS = 7
+# bcrypt cost factor of new password hashes; each step doubles the time to hash. Hashes of a
+# different cost are replaced on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Passwords are hashed and checked on a small thread pool, so bursts of logins queue there
+# instead of holding up the event loop.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 64))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", 1))
 
 GOOGLE_OAUTH_CLIENT_ID = os.getenv("GOOGLE_OAUTH_CLIENT_ID", "")
 GOOGLE_OAUTH_CLIENT_SECRET = os.getenv("GOOGLE_OAUTH_CLIENT_SECRET", "")
@@ -26,7 +37,85 @@ POSTGRES_USER = os.getenv("POSTGRES_USER", "")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "")
 POSTGRES_DB = os.getenv("POSTGRES_DB", "")
 POSTGRES_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", 1))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10))
+POSTGRES_POOL_TIMEOUT_SECONDS = float(os.getenv("POSTGRES_POOL_TIMEOUT_SECONDS", 30))
+
+# Database file of the "sqlite" provider. ":memory:" keeps it in memory for the life of the worker.
+SQLITE_PATH = os.getenv("SQLITE_PATH", "termipics.db")
 
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "")
+MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
+# Setting the region lets presigned urls be computed locally, without asking for the bucket location.
+MINIO_REGION = os.getenv("MINIO_REGION", "us-east-1")
+MINIO_BUCKET = os.getenv("MINIO_BUCKET", "images")
+MINIO_MAX_POOL_CONNECTIONS = int(os.getenv("MINIO_MAX_POOL_CONNECTIONS", 20))
+# Originals larger than one part are sent as a multipart upload, several parts at a time.
+MINIO_PART_SIZE = int(os.getenv("MINIO_PART_SIZE", 8 * 1024 * 1024))
+MINIO_PARALLEL_UPLOADS = int(os.getenv("MINIO_PARALLEL_UPLOADS", 4))
+
+# Root of the sharded directory tree used by the "filesystem" storage provider.
+FILESYSTEM_STORAGE_DIR = os.getenv("FILESYSTEM_STORAGE_DIR", "storage")
+
+# "proxy" streams image bytes through the API, "redirect" sends clients to a signed storage url.
+IMAGE_SERVING_MODE = os.getenv("IMAGE_SERVING_MODE", "proxy")
+SIGNED_URL_EXPIRES_IN_SECONDS = int(os.getenv("SIGNED_URL_EXPIRES_IN_SECONDS", 60))
+# Signed urls are reused until this many seconds before they expire.
+SIGNED_URL_EXPIRY_MARGIN_SECONDS = int(os.getenv("SIGNED_URL_EXPIRY_MARGIN_SECONDS", 10))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", 10000))
+
+ORIGINAL_CACHE_CONTROL = os.getenv("ORIGINAL_CACHE_CONTROL", "public, max-age=86400")
+THUMBNAIL_CACHE_CONTROL = os.getenv(
+    "THUMBNAIL_CACHE_CONTROL", "public, max-age=31536000, immutable"
+)
+
+THUMBNAIL_CACHE_MEMORY_BYTES = int(os.getenv("THUMBNAIL_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+# Set to an empty string to disable the on-disk tier.
+THUMBNAIL_CACHE_DIR = os.getenv(
+    "THUMBNAIL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "termipics", "thumbnails")
+)
+THUMBNAIL_CACHE_DISK_BYTES = int(os.getenv("THUMBNAIL_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", 5))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", 30))
+HTTP_STREAM_CHUNK_SIZE = int(os.getenv("HTTP_STREAM_CHUNK_SIZE", 64 * 1024))
+
+# Uploads are spooled to disk in chunks and rejected once they grow past MAX_UPLOAD_BYTES.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", tempfile.gettempdir())
+# POST /image/upload/bulk takes up to BULK_UPLOAD_MAX_FILES files in one request body of at most
+# MAX_BULK_UPLOAD_BYTES, and processes BULK_UPLOAD_CONCURRENCY of them at a time.
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 200))
+MAX_BULK_UPLOAD_BYTES = int(os.getenv("MAX_BULK_UPLOAD_BYTES", 1024 * 1024 * 1024))
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", 4))
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", os.cpu_count() or 1))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", 32))
+IMAGE_QUEUE_RETRY_AFTER_SECONDS = int(os.getenv("IMAGE_QUEUE_RETRY_AFTER_SECONDS", 5))
+# Thumbnails, and deferred transcoding, run as background jobs once an upload is answered. A
+# failed job is attempted up to IMAGE_JOB_MAX_ATTEMPTS times in all, with exponential backoff.
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", IMAGE_WORKERS))
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv("IMAGE_JOB_MAX_ATTEMPTS", 5))
+IMAGE_JOB_RETRY_BASE_SECONDS = float(os.getenv("IMAGE_JOB_RETRY_BASE_SECONDS", 1))
+IMAGE_JOB_HISTORY_SIZE = int(os.getenv("IMAGE_JOB_HISTORY_SIZE", 10000))
+IMAGE_JOB_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("IMAGE_JOB_SHUTDOWN_TIMEOUT_SECONDS", 30))
+# When uploaded JPEGs are converted to progressive for streaming: "always" before the upload is
+# answered, "deferred" to the image job that runs after it is stored, or "never".
+TRANSCODE_POLICY = os.getenv("TRANSCODE_POLICY", "deferred")
+# jpegtran (libjpeg-turbo) makes the conversion lossless. Pillow is used when it is not installed.
+JPEGTRAN_PATH = os.getenv("JPEGTRAN_PATH", "jpegtran")
+# Thumbnail quality tier: "fast", "balanced" or "max". See THUMBNAIL_TIERS in app/utils/image.py.
+THUMBNAIL_QUALITY = os.getenv("THUMBNAIL_QUALITY", "balanced")
+# Encodings thumbnails are stored in besides PNG, which every thumbnail has. GET /image/thumbnail
+# picks one by the request's Accept header. Lossy encodings use THUMBNAIL_ENCODE_QUALITY.
+THUMBNAIL_FORMATS = [
+    media_type.strip()
+    for media_type in os.getenv("THUMBNAIL_FORMATS", "image/webp,image/jpeg").split(",")
+    if media_type.strip()
+]
+THUMBNAIL_ENCODE_QUALITY = int(os.getenv("THUMBNAIL_ENCODE_QUALITY", 80))
@@ -4,50 +4,89 @@ The database client objects and handler objects.
 We don't deal with the database error here. They'll be handled in the api routes.
 """
 
+import json
+import sqlite3
 from abc import ABC, abstractmethod
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+from contextlib import asynccontextmanager, contextmanager
 from datetime import UTC, datetime
+from functools import wraps
 from typing import Any, Optional, Union
 from uuid import uuid4
 
+import psycopg
+from postgrest.types import CountMethod
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+from starlette.concurrency import run_in_threadpool
 from supabase.client import Client as SupabaseClient
 
 from app.config import DATABASE_PROVIDER
 from app.models import Image, User
-from app.utils.auth import hash_password
-from app.utils.supabase import supabase_client
+from app.utils.memory import (
+    MemoryDatabase,
+    close_memory_database,
+    memory_database,
+    start_memory_database,
+)
+from app.utils.postgres import close_postgres_pool, postgres_pool, start_postgres_pool
+from app.utils.sqlite import (
+    SQLiteDatabase,
+    close_sqlite_database,
+    sqlite_database,
+    start_sqlite_database,
+)
+from app.utils.supabase import close_supabase_database, start_supabase_client, supabase_client
 
-type DatabaseClient = Union[SupabaseClient]
+type DatabaseClient = Union[SupabaseClient, AsyncConnectionPool, SQLiteDatabase, MemoryDatabase]
+
+IMAGES_PER_PAGE = 30
 
 
 class UnknownDatabaseProvider(Exception):
     pass
 
 
+def in_threadpool[**P, R](method: Callable[P, R]) -> Callable[P, Awaitable[R]]:
+    """
+    Turn a handler method of a blocking client into the async method TableOperator declares.
+    The call runs in the threadpool, so the query holds a worker thread rather than the event
+    loop.
+    """
+
+    @wraps(method)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        return await run_in_threadpool(method, *args, **kwargs)
+
+    return wrapper
+
+
 class TableOperator(ABC):
     def __init__(self, client) -> None:
         self.client = client
 
     @abstractmethod
-    def is_email_exists(self, email: str, auth_provider: str) -> bool:
+    async def is_email_exists(self, email: str, auth_provider: str) -> bool:
         pass
 
     @abstractmethod
-    def is_username_exists(self, username: str, auth_provider: str) -> bool:
+    async def is_username_exists(self, username: str, auth_provider: str) -> bool:
         pass
 
     @abstractmethod
-    def insert_new_user(
+    async def insert_new_user(
         self,
         email: str,
         username: str,
         auth_provider: str,
-        password: Optional[str] = None,
+        hashed_password: Optional[str] = None,
         avatar: Optional[str] = None,
     ) -> str:
         pass
 
     @abstractmethod
-    def get_user_uid(
+    async def get_user_uid(
         self,
         auth_provider: str,
         *,
@@ -72,44 +111,323 @@ class TableOperator(ABC):
         pass
 
     @abstractmethod
-    def get_user_info(
+    async def get_user_info(
         self, keys: list[str], *, user_uid: Optional[str] = None, email: Optional[str] = None
     ) -> dict:
         pass
 
     @abstractmethod
-    def update_user_info(self, user_uid: str, data: dict[str, Any]) -> None:
+    async def update_user_info(self, user_uid: str, data: dict[str, Any]) -> None:
         pass
 
     @abstractmethod
-    def is_image_exists(self, image_uid: str) -> bool:
+    async def is_image_exists(self, image_uid: str) -> bool:
         pass
 
     @abstractmethod
-    def insert_new_image(
-        self, user_uid: str, title: str, file_name: str, format: str, size: int, labels: list[str]
+    async def insert_new_image(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
     ) -> str:
         pass
 
     @abstractmethod
-    def get_image_info(self, image_uid: str, keys: list[str]) -> dict:
+    async def record_image_upload(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        """
+        Record a newly uploaded image in one atomic operation: insert the image, increment the
+        owner's image_count, count its labels in the owner's label index and bump last_active.
+        Concurrent uploads of the same user never lose counts. thumbnail_types lists the media
+        types the thumbnail was stored in, PNG only if not given. storage_key names the stored
+        original and thumbnails, the image UID if not given; is_stored records them as already
+        in storage, for an upload that reuses the files of an identical image.
+
+        Returns:
+            str: UID of the new image.
+        """
         pass
 
     @abstractmethod
-    def update_image_info(self, image_uid: str, data: dict[str, Any]) -> None:
+    async def get_image_info(self, image_uid: str, keys: list[str]) -> dict:
         pass
 
     @abstractmethod
-    def filter_images(
+    async def find_image(self, image_uid: str, keys: list[str]) -> Optional[dict]:
+        """
+        Retrieve the info of an image that has not been deleted, checking its existence and
+        fetching its fields in a single query.
+
+        Args:
+            image_uid (str): UID of the image.
+            keys (list[str]): Image fields to retrieve.
+
+        Returns:
+            Optional[dict]: The requested fields, or None if the image does not exist or has been
+            deleted.
+        """
+        pass
+
+    @abstractmethod
+    async def get_images_info(self, image_uids: list[str], keys: list[str]) -> dict[str, dict]:
+        """
+        Retrieve the info of multiple images in a single query.
+
+        Args:
+            image_uids (list[str]): UIDs of the images to look up.
+            keys (list[str]): Image fields to retrieve.
+
+        Returns:
+            dict[str, dict]: Image UID mapped to its requested fields. UIDs that cannot be found
+            are left out of the mapping.
+        """
+        pass
+
+    @abstractmethod
+    async def update_image_info(self, image_uid: str, data: dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def filter_images(
         self, user_uid: str, page: int, sort_by: str, sort_order: str, labels: list[str]
     ) -> list[str]:
         pass
 
+    @abstractmethod
+    async def seek_images(
+        self,
+        user_uid: str,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+        after: Optional[tuple[Any, str]] = None,
+    ) -> list[tuple[Any, str]]:
+        """
+        Retrieve the next page of a user's images by seeking past the last one already seen,
+        ordered by (sort_by, image_uid). Unlike filter_images, deep pages cost the same as the
+        first one and do not shift when images are added in the meantime.
+
+        Args:
+            user_uid (str): Owner of the images.
+            sort_by (str): Column to order by.
+            sort_order (str): "asc" or "desc".
+            labels (Optional[list[str]]): Only keep images having any of these labels.
+            after (Optional[tuple[Any, str]]): (sort value, image UID) of the last image of the
+                previous page, or None for the first page.
+
+        Returns:
+            list[tuple[Any, str]]: (sort value, image UID) of up to IMAGES_PER_PAGE images.
+        """
+        pass
+
+    @abstractmethod
+    async def record_image_uploads(self, user_uid: str, uploads: list[dict[str, Any]]) -> list[str]:
+        """
+        Record a batch of uploaded images of one user in a single atomic write, with the same
+        bookkeeping as record_image_upload done once for the whole batch.
+
+        Args:
+            user_uid (str): Owner of the images.
+            uploads (list[dict[str, Any]]): One dict per image, holding the title, file_name,
+                content_type, size, labels, content_hash, thumbnail_types, storage_key and
+                is_stored arguments of record_image_upload.
+
+        Returns:
+            list[str]: UIDs of the new images, in the order of uploads.
+        """
+        pass
+
+    @abstractmethod
+    async def get_label_counts(
+        self, user_uid: str, labels: Optional[list[str]] = None
+    ) -> dict[str, int]:
+        """
+        Read the owner's label index: how many of their images carry each label.
+
+        Args:
+            user_uid (str): Owner of the images.
+            labels (Optional[list[str]]): Only count these labels. All labels if None.
+
+        Returns:
+            dict[str, int]: Label mapped to its number of images, most used first. Labels no
+            image carries any more are left out.
+        """
+        pass
+
+    @abstractmethod
+    async def update_image_labels(self, image_uid: str, labels: list[str]) -> bool:
+        """
+        Replace the labels of an image and adjust the owner's label index in one atomic
+        operation.
+
+        Returns:
+            bool: False if the image does not exist or has been deleted.
+        """
+        pass
+
+    @abstractmethod
+    async def delete_image(self, image_uid: str) -> bool:
+        """
+        Soft delete an image, removing it from the owner's image_count and label index in one
+        atomic operation.
+
+        Returns:
+            bool: False if the image does not exist or has already been deleted.
+        """
+        pass
+
+    @abstractmethod
+    async def find_stored_image(self, storage_key: str, keys: list[str]) -> Optional[dict]:
+        """
+        Find a live image whose original and thumbnails are stored under storage_key, so an
+        upload of the same content can share them instead of processing and storing it again.
+
+        Returns:
+            Optional[dict]: The requested fields of any such image, or None if there is none.
+        """
+        pass
+
+    @abstractmethod
+    async def count_storage_references(self, storage_key: str) -> int:
+        """
+        Count the live images whose files are stored under storage_key. The files can be
+        removed from storage once the last of them is deleted.
+        """
+        pass
+
+    @abstractmethod
+    async def find_unprocessed_images(self, keys: list[str]) -> list[dict]:
+        """
+        Retrieve the live images whose original is stored but whose thumbnails are not, e.g.
+        because the job making them was dropped at shutdown or lost in a crash.
+
+        Returns:
+            list[dict]: The requested fields of each such image.
+        """
+        pass
+
+    async def plan_label_filter(self, user_uid: str, labels: list[str]) -> Optional[list[str]]:
+        """
+        Use the label index to cut a label filter down before images are queried. Labels no live
+        image carries are dropped, so a filter on them alone needs no image query at all. The
+        others are ordered from the most to the least common, so a backend testing them one by
+        one recognizes a matching image with the fewest tests.
+
+        Returns:
+            Optional[list[str]]: None if no image can match, otherwise the labels to filter on,
+            empty if there is no filter.
+        """
+        if not labels:
+            return []
+        counts = await self.get_label_counts(user_uid, list(dict.fromkeys(labels)))
+        if not counts:
+            return None
+        return sorted(counts, key=lambda label: (-counts[label], label))
+
+
+def build_new_user(
+    email: str,
+    username: str,
+    auth_provider: str,
+    hashed_password: Optional[str] = None,
+    avatar: Optional[str] = None,
+) -> User:
+    """
+    Build the row of a newly registered user. Shared by every TableOperator implementation.
+    Email users come with their password already hashed, as hashing is too slow to run here.
+    """
+    user_uid = str(uuid4())
+    created_at = datetime.now(UTC).isoformat()
+    last_active = created_at
+
+    if auth_provider == "email":
+        if not hashed_password:
+            raise ValueError("Password is required for email registration")
+        return User(
+            user_uid=user_uid,
+            email=email,
+            username=username,
+            password=hashed_password,
+            auth_provider="email",
+            created_at=created_at,
+            last_active=last_active,
+            labels=[],
+        )
+    elif auth_provider == "google":
+        return User(
+            user_uid=user_uid,
+            email=email,
+            username=username,
+            auth_provider="google",
+            created_at=created_at,
+            last_active=last_active,
+            avatar=avatar,
+            labels=[],
+        )
+    else:
+        raise ValueError("Invalid auth provider")
+
+
+def build_new_image(
+    user_uid: str,
+    title: str,
+    file_name: str,
+    content_type: str,
+    size: int,
+    labels: list[str],
+    content_hash: Optional[str] = None,
+    thumbnail_types: Optional[list[str]] = None,
+    storage_key: Optional[str] = None,
+    is_stored: bool = False,
+) -> Image:
+    """
+    Build the row of a newly uploaded image. Shared by every TableOperator implementation.
+    """
+    image_uid = str(uuid4())
+    created_at = datetime.now(UTC).isoformat()
+    return Image(
+        image_uid=image_uid,
+        user_uid=user_uid,
+        title=title,
+        file_name=file_name,
+        content_type=content_type,
+        size=size,
+        content_hash=content_hash,
+        labels=labels,
+        thumbnail_types=["image/png"] if thumbnail_types is None else thumbnail_types,
+        storage_key=storage_key or image_uid,
+        is_uploaded=is_stored,
+        is_thumbnail_uploaded=is_stored,
+        created_at=created_at,
+        updated_at=created_at,
+        is_deleted=False,
+    )
+
 
 class SupabaseTable(TableOperator):
     def __init__(self, client: SupabaseClient) -> None:
         super().__init__(client)
 
+    @in_threadpool
     def is_email_exists(self, email: str, auth_provider: str) -> bool:
         response = (
             self.client.table("users")
@@ -120,6 +438,7 @@ class SupabaseTable(TableOperator):
         )
         return len(response.data) > 0
 
+    @in_threadpool
     def is_username_exists(self, username: str, auth_provider: str) -> bool:
         response = (
             self.client.table("users")
@@ -130,48 +449,20 @@ class SupabaseTable(TableOperator):
         )
         return len(response.data) > 0
 
+    @in_threadpool
     def insert_new_user(
         self,
         email: str,
         username: str,
         auth_provider: str,
-        password: Optional[str] = None,
+        hashed_password: Optional[str] = None,
         avatar: Optional[str] = None,
     ) -> str:
-        user_uid = str(uuid4())
-        created_at = datetime.now(UTC).isoformat()
-        last_active = created_at
-
-        if auth_provider == "email":
-            if not password:
-                raise ValueError("Password is required for email registration")
-            hashed_password = hash_password(password)
-            new_user = User(
-                user_uid=user_uid,
-                email=email,
-                username=username,
-                password=hashed_password,
-                auth_provider="email",
-                created_at=created_at,
-                last_active=last_active,
-                labels=[],
-            )
-        elif auth_provider == "google":
-            new_user = User(
-                user_uid=user_uid,
-                email=email,
-                username=username,
-                auth_provider="google",
-                created_at=created_at,
-                last_active=last_active,
-                avatar=avatar,
-                labels=[],
-            )
-        else:
-            raise ValueError("Invalid auth provider")
+        new_user = build_new_user(email, username, auth_provider, hashed_password, avatar)
         self.client.table("users").insert(new_user.model_dump()).execute()
-        return user_uid
+        return new_user.user_uid
 
+    @in_threadpool
     def get_user_uid(
         self,
         auth_provider: str,
@@ -193,6 +484,7 @@ class SupabaseTable(TableOperator):
             return ""
         return response.data[0]["user_uid"]
 
+    @in_threadpool
     def get_user_info(
         self, keys: list[str], *, user_uid: Optional[str] = None, email: Optional[str] = None
     ) -> dict:
@@ -204,9 +496,11 @@ class SupabaseTable(TableOperator):
             return {}
         return {key: response.data[0].get(key) for key in keys}
 
+    @in_threadpool
     def update_user_info(self, user_uid: str, data: dict[str, Any]) -> None:
         self.client.table("users").update(data).eq("user_uid", user_uid).execute()
 
+    @in_threadpool
     def insert_new_image(
         self,
         user_uid: str,
@@ -215,40 +509,204 @@ class SupabaseTable(TableOperator):
         content_type: str,
         size: int,
         labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
     ) -> str:
-        image_uid = str(uuid4())
-        created_at = datetime.now(UTC).isoformat()
-        updated_at = created_at
-        new_image = Image(
-            image_uid=image_uid,
-            user_uid=user_uid,
-            title=title,
-            file_name=file_name,
-            content_type=content_type,
-            size=size,
-            labels=labels,
-            created_at=created_at,
-            updated_at=updated_at,
-            is_deleted=False,
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
         )
         self.client.table("images").insert(new_image.model_dump()).execute()
-        return image_uid
+        return new_image.image_uid
+
+    @in_threadpool
+    def record_image_upload(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        # Runs sql/record_image_upload.sql, a single transaction on the database side.
+        self.client.rpc(
+            "record_image_upload",
+            {
+                "p_image_uid": new_image.image_uid,
+                "p_user_uid": user_uid,
+                "p_title": title,
+                "p_file_name": file_name,
+                "p_content_type": content_type,
+                "p_size": size,
+                "p_content_hash": content_hash,
+                "p_labels": labels,
+                "p_thumbnail_types": new_image.thumbnail_types,
+                "p_storage_key": new_image.storage_key,
+                "p_is_stored": is_stored,
+                "p_created_at": new_image.created_at,
+            },
+        ).execute()
+        return new_image.image_uid
+
+    @in_threadpool
+    def record_image_uploads(self, user_uid: str, uploads: list[dict[str, Any]]) -> list[str]:
+        new_images = [build_new_image(user_uid, **upload) for upload in uploads]
+        # Runs sql/record_image_uploads.sql, a single transaction on the database side.
+        self.client.rpc(
+            "record_image_uploads",
+            {
+                "p_user_uid": user_uid,
+                "p_images": [new_image.model_dump() for new_image in new_images],
+            },
+        ).execute()
+        return [new_image.image_uid for new_image in new_images]
+
+    @in_threadpool
+    def get_label_counts(self, user_uid: str, labels: Optional[list[str]] = None) -> dict[str, int]:
+        query = (
+            self.client.table("user_labels")
+            .select("label,image_count")
+            .eq("user_uid", user_uid)
+            .gt("image_count", 0)
+        )
+        if labels is not None:
+            query = query.in_("label", labels)
+        response = query.order("image_count", desc=True).order("label").execute()
+        return {item["label"]: item["image_count"] for item in response.data}
+
+    @in_threadpool
+    def update_image_labels(self, image_uid: str, labels: list[str]) -> bool:
+        response = self.client.rpc(
+            "update_image_labels",
+            {
+                "p_image_uid": image_uid,
+                "p_labels": labels,
+                "p_updated_at": datetime.now(UTC).isoformat(),
+            },
+        ).execute()
+        return bool(response.data)
+
+    @in_threadpool
+    def delete_image(self, image_uid: str) -> bool:
+        response = self.client.rpc(
+            "delete_image",
+            {"p_image_uid": image_uid, "p_updated_at": datetime.now(UTC).isoformat()},
+        ).execute()
+        return bool(response.data)
+
+    @in_threadpool
+    def find_stored_image(self, storage_key: str, keys: list[str]) -> Optional[dict]:
+        response = (
+            self.client.table("images")
+            .select(*keys)
+            .eq("storage_key", storage_key)
+            .eq("is_deleted", False)
+            .eq("is_uploaded", True)
+            .eq("is_thumbnail_uploaded", True)
+            .limit(1)
+            .execute()
+        )
+        if not response.data:
+            return None
+        return {key: response.data[0].get(key) for key in keys}
+
+    @in_threadpool
+    def count_storage_references(self, storage_key: str) -> int:
+        response = (
+            self.client.table("images")
+            .select("image_uid", count=CountMethod.exact, head=True)
+            .eq("storage_key", storage_key)
+            .eq("is_deleted", False)
+            .execute()
+        )
+        return response.count or 0
 
+    @in_threadpool
+    def find_unprocessed_images(self, keys: list[str]) -> list[dict]:
+        response = (
+            self.client.table("images")
+            .select(*keys)
+            .eq("is_deleted", False)
+            .eq("is_uploaded", True)
+            .eq("is_thumbnail_uploaded", False)
+            .execute()
+        )
+        return [{key: item.get(key) for key in keys} for item in response.data]
+
+    @in_threadpool
     def is_image_exists(self, image_uid: str) -> bool:
         response = (
             self.client.table("images").select("image_uid").eq("image_uid", image_uid).execute()
         )
         return len(response.data) > 0
 
+    @in_threadpool
     def get_image_info(self, image_uid: str, keys: list[str]) -> dict:
         response = self.client.table("images").select(*keys).eq("image_uid", image_uid).execute()
         if not response.data:
             return {}
         return {key: response.data[0].get(key) for key in keys}
 
+    @in_threadpool
+    def find_image(self, image_uid: str, keys: list[str]) -> Optional[dict]:
+        response = (
+            self.client.table("images")
+            .select(*keys)
+            .eq("image_uid", image_uid)
+            .eq("is_deleted", False)
+            .limit(1)
+            .execute()
+        )
+        if not response.data:
+            return None
+        return {key: response.data[0].get(key) for key in keys}
+
+    @in_threadpool
+    def get_images_info(self, image_uids: list[str], keys: list[str]) -> dict[str, dict]:
+        if not image_uids:
+            return {}
+        columns = keys if "image_uid" in keys else ["image_uid", *keys]
+        response = (
+            self.client.table("images")
+            .select(*columns)
+            .in_("image_uid", image_uids)
+            .eq("is_deleted", False)
+            .execute()
+        )
+        return {item["image_uid"]: {key: item.get(key) for key in keys} for item in response.data}
+
+    @in_threadpool
     def update_image_info(self, image_uid: str, data: dict[str, Any]) -> None:
         self.client.table("images").update(data).eq("image_uid", image_uid).execute()
 
+    @in_threadpool
     def filter_images(
         self,
         user_uid: str,
@@ -258,7 +716,7 @@ class SupabaseTable(TableOperator):
         labels: Optional[list[str]],
     ) -> list[str]:
         desc = True if sort_order == "desc" else False
-        images_per_page = 30
+        images_per_page = IMAGES_PER_PAGE
         start = (page - 1) * images_per_page
         end = start + images_per_page - 1
         if labels:
@@ -266,6 +724,7 @@ class SupabaseTable(TableOperator):
                 self.client.table("images")
                 .select("image_uid")
                 .eq("user_uid", user_uid)
+                .eq("is_deleted", False)
                 .overlaps("labels", labels)
                 .order(sort_by, desc=desc)
                 .range(start, end)
@@ -276,6 +735,7 @@ class SupabaseTable(TableOperator):
                 self.client.table("images")
                 .select("image_uid")
                 .eq("user_uid", user_uid)
+                .eq("is_deleted", False)
                 .order(sort_by, desc=desc)
                 .range(start, end)
                 .execute()
@@ -284,10 +744,1231 @@ class SupabaseTable(TableOperator):
             return []
         return [item["image_uid"] for item in response.data]
 
+    @in_threadpool
+    def seek_images(
+        self,
+        user_uid: str,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+        after: Optional[tuple[Any, str]] = None,
+    ) -> list[tuple[Any, str]]:
+        desc = sort_order == "desc"
+        query = (
+            self.client.table("images")
+            .select(f"image_uid,{sort_by}")
+            .eq("user_uid", user_uid)
+            .eq("is_deleted", False)
+        )
+        if labels:
+            query = query.overlaps("labels", labels)
+        if after is not None:
+            value, image_uid = _postgrest_quote(after[0]), _postgrest_quote(after[1])
+            op = "lt" if desc else "gt"
+            query = query.or_(
+                f"{sort_by}.{op}.{value},and({sort_by}.eq.{value},image_uid.{op}.{image_uid})"
+            )
+        response = (
+            query.order(sort_by, desc=desc)
+            .order("image_uid", desc=desc)
+            .limit(IMAGES_PER_PAGE)
+            .execute()
+        )
+        return [(item[sort_by], item["image_uid"]) for item in response.data]
+
+
+class PostgresTable(TableOperator):
+    """
+    Talk to Postgres directly through a connection pool, skipping PostgREST's HTTP round trip.
+
+    Hot read queries are executed with prepare=True, so each pooled connection parses and
+    plans them once and then reuses the plan.
+
+    The pool is async, so a query, or a wait for a free connection, suspends the request on the
+    event loop instead of holding a worker thread.
+    """
+
+    def __init__(self, client: AsyncConnectionPool) -> None:
+        super().__init__(client)
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[psycopg.AsyncConnection]:
+        # The pool is created outside the event loop, so the first query of the worker opens it.
+        if self.client.closed:
+            await self.client.open()
+        async with self.client.connection() as conn:
+            yield conn
+
+    async def _fetch_one(
+        self, query: sql.Composable, params: tuple, prepare: Optional[bool] = None
+    ) -> Optional[dict[str, Any]]:
+        async with self._connection() as conn:
+            cursor = await conn.execute(query, params, prepare=prepare)
+            row = await cursor.fetchone()
+        return _to_json_row(row) if row is not None else None
+
+    async def _fetch_all(
+        self, query: sql.Composable, params: tuple, prepare: Optional[bool] = None
+    ) -> list[dict[str, Any]]:
+        async with self._connection() as conn:
+            cursor = await conn.execute(query, params, prepare=prepare)
+            rows = await cursor.fetchall()
+        return [_to_json_row(row) for row in rows]
+
+    async def _insert(self, table: str, data: dict[str, Any]) -> None:
+        query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(map(sql.Identifier, data)),
+            sql.SQL(", ").join(sql.Placeholder() * len(data)),
+        )
+        async with self._connection() as conn:
+            await conn.execute(query, tuple(data.values()))
+
+    async def _update(self, table: str, key: str, value: str, data: dict[str, Any]) -> None:
+        query = sql.SQL("UPDATE {} SET {} WHERE {} = %s").format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(
+                sql.SQL("{} = %s").format(sql.Identifier(column)) for column in data
+            ),
+            sql.Identifier(key),
+        )
+        async with self._connection() as conn:
+            await conn.execute(query, (*data.values(), value))
+
+    async def is_email_exists(self, email: str, auth_provider: str) -> bool:
+        query = sql.SQL("SELECT 1 FROM users WHERE email = %s AND auth_provider = %s LIMIT 1")
+        return await self._fetch_one(query, (email, auth_provider)) is not None
+
+    async def is_username_exists(self, username: str, auth_provider: str) -> bool:
+        query = sql.SQL("SELECT 1 FROM users WHERE username = %s AND auth_provider = %s LIMIT 1")
+        return await self._fetch_one(query, (username, auth_provider)) is not None
+
+    async def insert_new_user(
+        self,
+        email: str,
+        username: str,
+        auth_provider: str,
+        hashed_password: Optional[str] = None,
+        avatar: Optional[str] = None,
+    ) -> str:
+        new_user = build_new_user(email, username, auth_provider, hashed_password, avatar)
+        await self._insert("users", new_user.model_dump())
+        return new_user.user_uid
+
+    async def get_user_uid(
+        self,
+        auth_provider: str,
+        *,
+        email: Optional[str] = None,
+        username: Optional[str] = None,
+    ) -> str:
+        if bool(email) == bool(username):
+            raise ValueError("Must provide exactly one of email or username")
+        field, value = ("email", email) if email else ("username", username)
+        query = sql.SQL("SELECT user_uid FROM users WHERE {} = %s AND auth_provider = %s").format(
+            sql.Identifier(field)
+        )
+        row = await self._fetch_one(query, (value, auth_provider))
+        if row is None:
+            return ""
+        return row["user_uid"]
+
+    async def get_user_info(
+        self, keys: list[str], *, user_uid: Optional[str] = None, email: Optional[str] = None
+    ) -> dict:
+        if bool(user_uid) == bool(email):
+            raise ValueError("Must provide exactly one of email or username")
+        field, value = ("user_uid", user_uid) if user_uid else ("email", email)
+        query = sql.SQL("SELECT {} FROM users WHERE {} = %s LIMIT 1").format(
+            sql.SQL(", ").join(map(sql.Identifier, keys)), sql.Identifier(field)
+        )
+        row = await self._fetch_one(query, (value,), prepare=True)
+        if row is None:
+            return {}
+        return {key: row.get(key) for key in keys}
+
+    async def update_user_info(self, user_uid: str, data: dict[str, Any]) -> None:
+        await self._update("users", "user_uid", user_uid, data)
+
+    async def insert_new_image(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        await self._insert("images", new_image.model_dump())
+        return new_image.image_uid
+
+    async def record_image_upload(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        row = new_image.model_dump()
+        # One statement, so the insert and both counter updates commit together in a single
+        # round trip. The row locks taken by the upserts serialize concurrent uploads of a user.
+        query = sql.SQL(
+            "WITH new_image AS ("
+            "INSERT INTO images ({}) VALUES ({}) RETURNING user_uid, created_at, labels"
+            "), counted AS ("
+            "INSERT INTO user_labels (user_uid, label, image_count)"
+            " SELECT DISTINCT new_image.user_uid, label, 1"
+            " FROM new_image, unnest(new_image.labels) AS label"
+            " ON CONFLICT (user_uid, label)"
+            " DO UPDATE SET image_count = user_labels.image_count + 1"
+            ") UPDATE users SET image_count = image_count + 1,"
+            " last_active = new_image.created_at"
+            " FROM new_image WHERE users.user_uid = new_image.user_uid"
+        ).format(
+            sql.SQL(", ").join(map(sql.Identifier, row)),
+            sql.SQL(", ").join(sql.Placeholder() * len(row)),
+        )
+        async with self._connection() as conn:
+            await conn.execute(query, tuple(row.values()), prepare=True)
+        return new_image.image_uid
+
+    async def record_image_uploads(self, user_uid: str, uploads: list[dict[str, Any]]) -> list[str]:
+        if not uploads:
+            return []
+        new_images = [build_new_image(user_uid, **upload) for upload in uploads]
+        rows = [new_image.model_dump() for new_image in new_images]
+        columns = list(rows[0])
+        # Same shape as record_image_upload, with every image inserted by one multi-row VALUES.
+        query = sql.SQL(
+            "WITH new_images AS ("
+            "INSERT INTO images ({}) VALUES {} RETURNING image_uid, user_uid, created_at, labels"
+            "), counted AS ("
+            "INSERT INTO user_labels (user_uid, label, image_count)"
+            " SELECT new_images.user_uid, label, count(DISTINCT new_images.image_uid)"
+            " FROM new_images, unnest(new_images.labels) AS label"
+            " GROUP BY new_images.user_uid, label"
+            " ON CONFLICT (user_uid, label)"
+            " DO UPDATE SET image_count = user_labels.image_count + excluded.image_count"
+            ") UPDATE users SET image_count = users.image_count + batch.image_count,"
+            " last_active = batch.last_active"
+            " FROM (SELECT user_uid, count(*) AS image_count, max(created_at) AS last_active"
+            " FROM new_images GROUP BY user_uid) AS batch"
+            " WHERE users.user_uid = batch.user_uid"
+        ).format(
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+            sql.SQL(", ").join(
+                sql.SQL("({})").format(sql.SQL(", ").join(sql.Placeholder() * len(columns)))
+                for _ in rows
+            ),
+        )
+        params = tuple(value for row in rows for value in row.values())
+        async with self._connection() as conn:
+            await conn.execute(query, params)
+        return [new_image.image_uid for new_image in new_images]
+
+    async def get_label_counts(
+        self, user_uid: str, labels: Optional[list[str]] = None
+    ) -> dict[str, int]:
+        query = sql.SQL(
+            "SELECT label, image_count FROM user_labels"
+            " WHERE user_uid = %s AND image_count > 0 AND (%s::text[] IS NULL OR label = ANY(%s::text[]))"
+            " ORDER BY image_count DESC, label"
+        )
+        rows = await self._fetch_all(query, (user_uid, labels, labels), prepare=True)
+        return {row["label"]: row["image_count"] for row in rows}
+
+    async def update_image_labels(self, image_uid: str, labels: list[str]) -> bool:
+        labels = list(dict.fromkeys(labels))
+        async with self._connection() as conn, conn.transaction():
+            cursor = await conn.execute(
+                "SELECT user_uid, labels FROM images"
+                " WHERE image_uid = %s AND is_deleted = false FOR UPDATE",
+                (image_uid,),
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return False
+            old_labels = set(row["labels"] or [])
+            await conn.execute(
+                "UPDATE images SET labels = %s, updated_at = %s WHERE image_uid = %s",
+                (labels, datetime.now(UTC), image_uid),
+            )
+            await _count_postgres_labels(
+                conn, row["user_uid"], [label for label in old_labels if label not in labels], -1
+            )
+            await _count_postgres_labels(
+                conn, row["user_uid"], [label for label in labels if label not in old_labels], 1
+            )
+        return True
+
+    async def delete_image(self, image_uid: str) -> bool:
+        async with self._connection() as conn, conn.transaction():
+            cursor = await conn.execute(
+                "UPDATE images SET is_deleted = true, updated_at = %s"
+                " WHERE image_uid = %s AND is_deleted = false RETURNING user_uid, labels",
+                (datetime.now(UTC), image_uid),
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return False
+            await _count_postgres_labels(conn, row["user_uid"], list(set(row["labels"] or [])), -1)
+            await conn.execute(
+                "UPDATE users SET image_count = image_count - 1 WHERE user_uid = %s",
+                (row["user_uid"],),
+            )
+        return True
+
+    async def find_stored_image(self, storage_key: str, keys: list[str]) -> Optional[dict]:
+        query = sql.SQL(
+            "SELECT {} FROM images WHERE storage_key = %s AND is_deleted = false"
+            " AND is_uploaded AND is_thumbnail_uploaded LIMIT 1"
+        ).format(sql.SQL(", ").join(map(sql.Identifier, keys)))
+        row = await self._fetch_one(query, (storage_key,), prepare=True)
+        if row is None:
+            return None
+        return {key: row.get(key) for key in keys}
+
+    async def count_storage_references(self, storage_key: str) -> int:
+        query = sql.SQL(
+            "SELECT count(*) AS count FROM images WHERE storage_key = %s AND is_deleted = false"
+        )
+        row = await self._fetch_one(query, (storage_key,), prepare=True)
+        return row["count"]
+
+    async def find_unprocessed_images(self, keys: list[str]) -> list[dict]:
+        query = sql.SQL(
+            "SELECT {} FROM images WHERE is_deleted = false"
+            " AND is_uploaded AND NOT is_thumbnail_uploaded"
+        ).format(sql.SQL(", ").join(map(sql.Identifier, keys)))
+        rows = await self._fetch_all(query, ())
+        return [{key: row.get(key) for key in keys} for row in rows]
+
+    async def is_image_exists(self, image_uid: str) -> bool:
+        query = sql.SQL("SELECT 1 FROM images WHERE image_uid = %s LIMIT 1")
+        return await self._fetch_one(query, (image_uid,)) is not None
+
+    async def get_image_info(self, image_uid: str, keys: list[str]) -> dict:
+        query = sql.SQL("SELECT {} FROM images WHERE image_uid = %s LIMIT 1").format(
+            sql.SQL(", ").join(map(sql.Identifier, keys))
+        )
+        row = await self._fetch_one(query, (image_uid,), prepare=True)
+        if row is None:
+            return {}
+        return {key: row.get(key) for key in keys}
+
+    async def find_image(self, image_uid: str, keys: list[str]) -> Optional[dict]:
+        query = sql.SQL(
+            "SELECT {} FROM images WHERE image_uid = %s AND is_deleted = false LIMIT 1"
+        ).format(sql.SQL(", ").join(map(sql.Identifier, keys)))
+        row = await self._fetch_one(query, (image_uid,), prepare=True)
+        if row is None:
+            return None
+        return {key: row.get(key) for key in keys}
+
+    async def get_images_info(self, image_uids: list[str], keys: list[str]) -> dict[str, dict]:
+        if not image_uids:
+            return {}
+        columns = keys if "image_uid" in keys else ["image_uid", *keys]
+        query = sql.SQL(
+            "SELECT {} FROM images WHERE image_uid = ANY(%s) AND is_deleted = false"
+        ).format(sql.SQL(", ").join(map(sql.Identifier, columns)))
+        rows = await self._fetch_all(query, (image_uids,), prepare=True)
+        return {row["image_uid"]: {key: row.get(key) for key in keys} for row in rows}
+
+    async def update_image_info(self, image_uid: str, data: dict[str, Any]) -> None:
+        await self._update("images", "image_uid", image_uid, data)
+
+    async def filter_images(
+        self,
+        user_uid: str,
+        page: int,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+    ) -> list[str]:
+        images_per_page = IMAGES_PER_PAGE
+        direction = sql.SQL("DESC" if sort_order == "desc" else "ASC")
+        # Keep one statement for both cases so a single prepared plan serves every call.
+        query = sql.SQL(
+            "SELECT image_uid FROM images"
+            " WHERE user_uid = %s AND is_deleted = false"
+            " AND (%s::text[] IS NULL OR labels && %s::text[])"
+            " ORDER BY {} {} LIMIT %s OFFSET %s"
+        ).format(sql.Identifier(sort_by), direction)
+        labels = labels or None
+        offset = (page - 1) * images_per_page
+        rows = await self._fetch_all(
+            query, (user_uid, labels, labels, images_per_page, offset), prepare=True
+        )
+        return [row["image_uid"] for row in rows]
+
+    async def seek_images(
+        self,
+        user_uid: str,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+        after: Optional[tuple[Any, str]] = None,
+    ) -> list[tuple[Any, str]]:
+        desc = sort_order == "desc"
+        column = sql.Identifier(sort_by)
+        # A row comparison lets Postgres seek straight into the (user_uid, sort_by, image_uid)
+        # index instead of walking past the earlier pages.
+        seek = sql.SQL("({}, image_uid) {} (%s, %s)").format(column, sql.SQL("<" if desc else ">"))
+        query = sql.SQL(
+            "SELECT image_uid, {} AS sort_value FROM images"
+            " WHERE user_uid = %s AND is_deleted = false"
+            " AND (%s::text[] IS NULL OR labels && %s::text[]) AND {}"
+            " ORDER BY {} {}, image_uid {} LIMIT %s"
+        ).format(
+            column,
+            seek if after is not None else sql.SQL("true"),
+            column,
+            sql.SQL("DESC" if desc else "ASC"),
+            sql.SQL("DESC" if desc else "ASC"),
+        )
+        labels = labels or None
+        params = (user_uid, labels, labels, *(after or ()), IMAGES_PER_PAGE)
+        rows = await self._fetch_all(query, params, prepare=True)
+        return [(row["sort_value"], row["image_uid"]) for row in rows]
+
+
+def _to_json_row(row: dict[str, Any]) -> dict[str, Any]:
+    """
+    Render timestamps as ISO 8601 strings, the way PostgREST returns them.
+    """
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
+
+
+class SQLiteTable(TableOperator):
+    """
+    Keep the tables in a local SQLite database, so the server runs without any network service.
+
+    Labels are stored as JSON arrays; the label filter matches the Postgres overlap operator
+    through json_each.
+    """
+
+    def __init__(self, client: SQLiteDatabase) -> None:
+        super().__init__(client)
+
+    def _fetch_one(self, query: str, params: tuple) -> Optional[dict[str, Any]]:
+        with self.client.connection() as conn:
+            row = conn.execute(query, params).fetchone()
+        return _from_sqlite_row(dict(row)) if row is not None else None
+
+    def _fetch_all(self, query: str, params: tuple) -> list[dict[str, Any]]:
+        with self.client.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [_from_sqlite_row(dict(row)) for row in rows]
+
+    def _execute(self, query: str, params: tuple) -> None:
+        with self.client.connection() as conn:
+            conn.execute(query, params)
+
+    def _insert(self, table: str, data: dict[str, Any]) -> None:
+        data = _to_sqlite_row(data)
+        columns = _column_list(table, data)
+        placeholders = ", ".join("?" * len(data))
+        self._execute(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(data.values())
+        )
+
+    def _update(self, table: str, key: str, value: str, data: dict[str, Any]) -> None:
+        data = _to_sqlite_row(data)
+        _column_list(table, data)
+        assignments = ", ".join(f'"{column}" = ?' for column in data)
+        self._execute(
+            f'UPDATE {table} SET {assignments} WHERE "{key}" = ?', (*data.values(), value)
+        )
+
+    @in_threadpool
+    def is_email_exists(self, email: str, auth_provider: str) -> bool:
+        query = "SELECT 1 FROM users WHERE email = ? AND auth_provider = ? LIMIT 1"
+        return self._fetch_one(query, (email, auth_provider)) is not None
+
+    @in_threadpool
+    def is_username_exists(self, username: str, auth_provider: str) -> bool:
+        query = "SELECT 1 FROM users WHERE username = ? AND auth_provider = ? LIMIT 1"
+        return self._fetch_one(query, (username, auth_provider)) is not None
+
+    @in_threadpool
+    def insert_new_user(
+        self,
+        email: str,
+        username: str,
+        auth_provider: str,
+        hashed_password: Optional[str] = None,
+        avatar: Optional[str] = None,
+    ) -> str:
+        new_user = build_new_user(email, username, auth_provider, hashed_password, avatar)
+        self._insert("users", new_user.model_dump())
+        return new_user.user_uid
+
+    @in_threadpool
+    def get_user_uid(
+        self,
+        auth_provider: str,
+        *,
+        email: Optional[str] = None,
+        username: Optional[str] = None,
+    ) -> str:
+        if bool(email) == bool(username):
+            raise ValueError("Must provide exactly one of email or username")
+        field, value = ("email", email) if email else ("username", username)
+        query = f"SELECT user_uid FROM users WHERE {field} = ? AND auth_provider = ? LIMIT 1"
+        row = self._fetch_one(query, (value, auth_provider))
+        if row is None:
+            return ""
+        return row["user_uid"]
+
+    @in_threadpool
+    def get_user_info(
+        self, keys: list[str], *, user_uid: Optional[str] = None, email: Optional[str] = None
+    ) -> dict:
+        if bool(user_uid) == bool(email):
+            raise ValueError("Must provide exactly one of email or username")
+        field, value = ("user_uid", user_uid) if user_uid else ("email", email)
+        query = f"SELECT {_column_list('users', keys)} FROM users WHERE {field} = ? LIMIT 1"
+        row = self._fetch_one(query, (value,))
+        if row is None:
+            return {}
+        return {key: row.get(key) for key in keys}
+
+    @in_threadpool
+    def update_user_info(self, user_uid: str, data: dict[str, Any]) -> None:
+        self._update("users", "user_uid", user_uid, data)
+
+    @in_threadpool
+    def insert_new_image(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        self._insert("images", new_image.model_dump())
+        return new_image.image_uid
+
+    @in_threadpool
+    def record_image_upload(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        data = _to_sqlite_row(new_image.model_dump())
+        columns = _column_list("images", data)
+        placeholders = ", ".join("?" * len(data))
+        with self.client.connection() as conn, _sqlite_transaction(conn):
+            conn.execute(
+                f"INSERT INTO images ({columns}) VALUES ({placeholders})", tuple(data.values())
+            )
+            _count_sqlite_labels(conn, user_uid, list(set(labels)), 1)
+            conn.execute(
+                "UPDATE users SET image_count = image_count + 1, last_active = ?"
+                " WHERE user_uid = ?",
+                (new_image.created_at, user_uid),
+            )
+        return new_image.image_uid
+
+    @in_threadpool
+    def record_image_uploads(self, user_uid: str, uploads: list[dict[str, Any]]) -> list[str]:
+        if not uploads:
+            return []
+        new_images = [build_new_image(user_uid, **upload) for upload in uploads]
+        rows = [_to_sqlite_row(new_image.model_dump()) for new_image in new_images]
+        columns = _column_list("images", rows[0])
+        placeholders = ", ".join("?" * len(rows[0]))
+        label_counts = Counter(label for upload in uploads for label in set(upload["labels"]))
+        with self.client.connection() as conn, _sqlite_transaction(conn):
+            conn.executemany(
+                f"INSERT INTO images ({columns}) VALUES ({placeholders})",
+                [tuple(row.values()) for row in rows],
+            )
+            conn.executemany(
+                "INSERT INTO user_labels (user_uid, label, image_count) VALUES (?, ?, ?)"
+                " ON CONFLICT (user_uid, label) DO UPDATE SET image_count = image_count + ?",
+                [(user_uid, label, count, count) for label, count in label_counts.items()],
+            )
+            conn.execute(
+                "UPDATE users SET image_count = image_count + ?, last_active = ?"
+                " WHERE user_uid = ?",
+                (len(new_images), new_images[-1].created_at, user_uid),
+            )
+        return [new_image.image_uid for new_image in new_images]
+
+    @in_threadpool
+    def get_label_counts(self, user_uid: str, labels: Optional[list[str]] = None) -> dict[str, int]:
+        query = "SELECT label, image_count FROM user_labels WHERE user_uid = ? AND image_count > 0"
+        params: list[Any] = [user_uid]
+        if labels is not None:
+            query += " AND label IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(labels))
+        query += " ORDER BY image_count DESC, label"
+        rows = self._fetch_all(query, tuple(params))
+        return {row["label"]: row["image_count"] for row in rows}
+
+    @in_threadpool
+    def update_image_labels(self, image_uid: str, labels: list[str]) -> bool:
+        labels = list(dict.fromkeys(labels))
+        with self.client.connection() as conn, _sqlite_transaction(conn):
+            row = conn.execute(
+                "SELECT user_uid, labels FROM images WHERE image_uid = ? AND is_deleted = 0",
+                (image_uid,),
+            ).fetchone()
+            if row is None:
+                return False
+            old_labels = set(json.loads(row["labels"]))
+            conn.execute(
+                "UPDATE images SET labels = ?, updated_at = ? WHERE image_uid = ?",
+                (json.dumps(labels), datetime.now(UTC).isoformat(), image_uid),
+            )
+            _count_sqlite_labels(
+                conn, row["user_uid"], [label for label in old_labels if label not in labels], -1
+            )
+            _count_sqlite_labels(
+                conn, row["user_uid"], [label for label in labels if label not in old_labels], 1
+            )
+        return True
+
+    @in_threadpool
+    def delete_image(self, image_uid: str) -> bool:
+        with self.client.connection() as conn, _sqlite_transaction(conn):
+            row = conn.execute(
+                "SELECT user_uid, labels FROM images WHERE image_uid = ? AND is_deleted = 0",
+                (image_uid,),
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                "UPDATE images SET is_deleted = 1, updated_at = ? WHERE image_uid = ?",
+                (datetime.now(UTC).isoformat(), image_uid),
+            )
+            _count_sqlite_labels(conn, row["user_uid"], list(set(json.loads(row["labels"]))), -1)
+            conn.execute(
+                "UPDATE users SET image_count = image_count - 1 WHERE user_uid = ?",
+                (row["user_uid"],),
+            )
+        return True
+
+    @in_threadpool
+    def find_stored_image(self, storage_key: str, keys: list[str]) -> Optional[dict]:
+        query = (
+            f"SELECT {_column_list('images', keys)} FROM images WHERE storage_key = ?"
+            " AND is_deleted = 0 AND is_uploaded = 1 AND is_thumbnail_uploaded = 1 LIMIT 1"
+        )
+        row = self._fetch_one(query, (storage_key,))
+        if row is None:
+            return None
+        return {key: row.get(key) for key in keys}
+
+    @in_threadpool
+    def count_storage_references(self, storage_key: str) -> int:
+        query = "SELECT count(*) AS count FROM images WHERE storage_key = ? AND is_deleted = 0"
+        return self._fetch_one(query, (storage_key,))["count"]
+
+    @in_threadpool
+    def find_unprocessed_images(self, keys: list[str]) -> list[dict]:
+        query = (
+            f"SELECT {_column_list('images', keys)} FROM images"
+            " WHERE is_deleted = 0 AND is_uploaded = 1 AND is_thumbnail_uploaded = 0"
+        )
+        rows = self._fetch_all(query, ())
+        return [{key: row.get(key) for key in keys} for row in rows]
+
+    @in_threadpool
+    def is_image_exists(self, image_uid: str) -> bool:
+        query = "SELECT 1 FROM images WHERE image_uid = ? LIMIT 1"
+        return self._fetch_one(query, (image_uid,)) is not None
+
+    @in_threadpool
+    def get_image_info(self, image_uid: str, keys: list[str]) -> dict:
+        query = f"SELECT {_column_list('images', keys)} FROM images WHERE image_uid = ? LIMIT 1"
+        row = self._fetch_one(query, (image_uid,))
+        if row is None:
+            return {}
+        return {key: row.get(key) for key in keys}
+
+    @in_threadpool
+    def find_image(self, image_uid: str, keys: list[str]) -> Optional[dict]:
+        query = (
+            f"SELECT {_column_list('images', keys)} FROM images"
+            " WHERE image_uid = ? AND is_deleted = 0 LIMIT 1"
+        )
+        row = self._fetch_one(query, (image_uid,))
+        if row is None:
+            return None
+        return {key: row.get(key) for key in keys}
+
+    @in_threadpool
+    def get_images_info(self, image_uids: list[str], keys: list[str]) -> dict[str, dict]:
+        if not image_uids:
+            return {}
+        columns = keys if "image_uid" in keys else ["image_uid", *keys]
+        placeholders = ", ".join("?" * len(image_uids))
+        query = (
+            f"SELECT {_column_list('images', columns)} FROM images"
+            f" WHERE image_uid IN ({placeholders}) AND is_deleted = 0"
+        )
+        rows = self._fetch_all(query, tuple(image_uids))
+        return {row["image_uid"]: {key: row.get(key) for key in keys} for row in rows}
+
+    @in_threadpool
+    def update_image_info(self, image_uid: str, data: dict[str, Any]) -> None:
+        self._update("images", "image_uid", image_uid, data)
+
+    @in_threadpool
+    def filter_images(
+        self,
+        user_uid: str,
+        page: int,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+    ) -> list[str]:
+        images_per_page = IMAGES_PER_PAGE
+        direction = "DESC" if sort_order == "desc" else "ASC"
+        query = "SELECT image_uid FROM images WHERE user_uid = ? AND is_deleted = 0"
+        params: list[Any] = [user_uid]
+        if labels:
+            # Walk the wanted labels in the planned order and stop at the first one carried.
+            query += (
+                " AND EXISTS (SELECT 1 FROM json_each(?) AS wanted"
+                " WHERE wanted.value IN (SELECT value FROM json_each(images.labels)))"
+            )
+            params.append(json.dumps(labels))
+        query += f" ORDER BY {_column_list('images', [sort_by])} {direction} LIMIT ? OFFSET ?"
+        params += [images_per_page, (page - 1) * images_per_page]
+        rows = self._fetch_all(query, tuple(params))
+        return [row["image_uid"] for row in rows]
+
+    @in_threadpool
+    def seek_images(
+        self,
+        user_uid: str,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+        after: Optional[tuple[Any, str]] = None,
+    ) -> list[tuple[Any, str]]:
+        desc = sort_order == "desc"
+        column = _column_list("images", [sort_by])
+        query = (
+            f"SELECT image_uid, {column} AS sort_value FROM images"
+            " WHERE user_uid = ? AND is_deleted = 0"
+        )
+        params: list[Any] = [user_uid]
+        if labels:
+            # Walk the wanted labels in the planned order and stop at the first one carried.
+            query += (
+                " AND EXISTS (SELECT 1 FROM json_each(?) AS wanted"
+                " WHERE wanted.value IN (SELECT value FROM json_each(images.labels)))"
+            )
+            params.append(json.dumps(labels))
+        if after is not None:
+            query += f" AND ({column}, image_uid) {'<' if desc else '>'} (?, ?)"
+            params += list(after)
+        direction = "DESC" if desc else "ASC"
+        query += f" ORDER BY {column} {direction}, image_uid {direction} LIMIT ?"
+        params.append(IMAGES_PER_PAGE)
+        rows = self._fetch_all(query, tuple(params))
+        return [(row["sort_value"], row["image_uid"]) for row in rows]
+
+
+class MemoryTable(TableOperator):
+    """
+    Keep the tables in process memory. Nothing is persisted and every worker has its own copy,
+    which makes it useful for measuring the server's own overhead and for hermetic load tests.
+    """
+
+    def __init__(self, client: MemoryDatabase) -> None:
+        super().__init__(client)
+
+    async def is_email_exists(self, email: str, auth_provider: str) -> bool:
+        return (email, auth_provider) in self.client.users_by_email
+
+    async def is_username_exists(self, username: str, auth_provider: str) -> bool:
+        return (username, auth_provider) in self.client.users_by_username
+
+    async def insert_new_user(
+        self,
+        email: str,
+        username: str,
+        auth_provider: str,
+        hashed_password: Optional[str] = None,
+        avatar: Optional[str] = None,
+    ) -> str:
+        new_user = build_new_user(email, username, auth_provider, hashed_password, avatar)
+        with self.client.lock:
+            self.client.users[new_user.user_uid] = new_user.model_dump()
+            self.client.users_by_email[(email, auth_provider)] = new_user.user_uid
+            self.client.users_by_username[(username, auth_provider)] = new_user.user_uid
+        return new_user.user_uid
+
+    async def get_user_uid(
+        self,
+        auth_provider: str,
+        *,
+        email: Optional[str] = None,
+        username: Optional[str] = None,
+    ) -> str:
+        if bool(email) == bool(username):
+            raise ValueError("Must provide exactly one of email or username")
+        if email:
+            return self.client.users_by_email.get((email, auth_provider), "")
+        return self.client.users_by_username.get((username, auth_provider), "")
+
+    async def get_user_info(
+        self, keys: list[str], *, user_uid: Optional[str] = None, email: Optional[str] = None
+    ) -> dict:
+        if bool(user_uid) == bool(email):
+            raise ValueError("Must provide exactly one of email or username")
+        with self.client.lock:
+            if email:
+                user = next(
+                    (user for user in self.client.users.values() if user["email"] == email), None
+                )
+            else:
+                user = self.client.users.get(user_uid)
+            if user is None:
+                return {}
+            return _pick(user, keys)
+
+    async def update_user_info(self, user_uid: str, data: dict[str, Any]) -> None:
+        with self.client.lock:
+            user = self.client.users.get(user_uid)
+            if user is None:
+                return
+            if "email" in data:
+                self.client.users_by_email.pop((user["email"], user["auth_provider"]), None)
+                self.client.users_by_email[(data["email"], user["auth_provider"])] = user_uid
+            if "username" in data:
+                self.client.users_by_username.pop((user["username"], user["auth_provider"]), None)
+                self.client.users_by_username[(data["username"], user["auth_provider"])] = user_uid
+            user.update(data)
+
+    async def insert_new_image(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        with self.client.lock:
+            self.client.images[new_image.image_uid] = new_image.model_dump()
+            self.client.images_by_user.setdefault(user_uid, set()).add(new_image.image_uid)
+            self.client.images_by_storage_key.setdefault(new_image.storage_key, set()).add(
+                new_image.image_uid
+            )
+        return new_image.image_uid
+
+    async def record_image_upload(
+        self,
+        user_uid: str,
+        title: str,
+        file_name: str,
+        content_type: str,
+        size: int,
+        labels: list[str],
+        content_hash: Optional[str] = None,
+        thumbnail_types: Optional[list[str]] = None,
+        storage_key: Optional[str] = None,
+        is_stored: bool = False,
+    ) -> str:
+        new_image = build_new_image(
+            user_uid,
+            title,
+            file_name,
+            content_type,
+            size,
+            labels,
+            content_hash,
+            thumbnail_types,
+            storage_key,
+            is_stored,
+        )
+        with self.client.lock:
+            self.client.images[new_image.image_uid] = new_image.model_dump()
+            self.client.images_by_user.setdefault(user_uid, set()).add(new_image.image_uid)
+            self.client.images_by_storage_key.setdefault(new_image.storage_key, set()).add(
+                new_image.image_uid
+            )
+            self.client.user_labels.setdefault(user_uid, Counter()).update(set(labels))
+            user = self.client.users.get(user_uid)
+            if user is not None:
+                user["image_count"] += 1
+                user["last_active"] = new_image.created_at
+        return new_image.image_uid
+
+    async def record_image_uploads(self, user_uid: str, uploads: list[dict[str, Any]]) -> list[str]:
+        new_images = [build_new_image(user_uid, **upload) for upload in uploads]
+        with self.client.lock:
+            counts = self.client.user_labels.setdefault(user_uid, Counter())
+            for new_image in new_images:
+                self.client.images[new_image.image_uid] = new_image.model_dump()
+                self.client.images_by_user.setdefault(user_uid, set()).add(new_image.image_uid)
+                self.client.images_by_storage_key.setdefault(new_image.storage_key, set()).add(
+                    new_image.image_uid
+                )
+                counts.update(set(new_image.labels))
+            user = self.client.users.get(user_uid)
+            if user is not None and new_images:
+                user["image_count"] += len(new_images)
+                user["last_active"] = new_images[-1].created_at
+        return [new_image.image_uid for new_image in new_images]
+
+    async def get_label_counts(
+        self, user_uid: str, labels: Optional[list[str]] = None
+    ) -> dict[str, int]:
+        with self.client.lock:
+            counts = self.client.user_labels.get(user_uid, Counter())
+            if labels is not None:
+                counts = Counter({label: counts[label] for label in labels})
+            ranked = sorted(+counts, key=lambda label: (-counts[label], label))
+            return {label: counts[label] for label in ranked}
+
+    async def update_image_labels(self, image_uid: str, labels: list[str]) -> bool:
+        labels = list(dict.fromkeys(labels))
+        with self.client.lock:
+            image = self.client.images.get(image_uid)
+            if image is None or image["is_deleted"]:
+                return False
+            counts = self.client.user_labels.setdefault(image["user_uid"], Counter())
+            counts.subtract(set(image["labels"]))
+            counts.update(labels)
+            image["labels"] = labels
+            image["updated_at"] = datetime.now(UTC).isoformat()
+        return True
+
+    async def delete_image(self, image_uid: str) -> bool:
+        with self.client.lock:
+            image = self.client.images.get(image_uid)
+            if image is None or image["is_deleted"]:
+                return False
+            image["is_deleted"] = True
+            image["updated_at"] = datetime.now(UTC).isoformat()
+            self.client.user_labels.setdefault(image["user_uid"], Counter()).subtract(
+                set(image["labels"])
+            )
+            user = self.client.users.get(image["user_uid"])
+            if user is not None:
+                user["image_count"] -= 1
+        return True
+
+    async def find_stored_image(self, storage_key: str, keys: list[str]) -> Optional[dict]:
+        with self.client.lock:
+            for image_uid in self.client.images_by_storage_key.get(storage_key, ()):
+                image = self.client.images[image_uid]
+                if (
+                    not image["is_deleted"]
+                    and image["is_uploaded"]
+                    and image["is_thumbnail_uploaded"]
+                ):
+                    return _pick(image, keys)
+        return None
+
+    async def count_storage_references(self, storage_key: str) -> int:
+        with self.client.lock:
+            return sum(
+                not self.client.images[image_uid]["is_deleted"]
+                for image_uid in self.client.images_by_storage_key.get(storage_key, ())
+            )
+
+    async def find_unprocessed_images(self, keys: list[str]) -> list[dict]:
+        with self.client.lock:
+            return [
+                _pick(image, keys)
+                for image in self.client.images.values()
+                if not image["is_deleted"]
+                and image["is_uploaded"]
+                and not image["is_thumbnail_uploaded"]
+            ]
+
+    async def is_image_exists(self, image_uid: str) -> bool:
+        return image_uid in self.client.images
+
+    async def get_image_info(self, image_uid: str, keys: list[str]) -> dict:
+        with self.client.lock:
+            image = self.client.images.get(image_uid)
+            if image is None:
+                return {}
+            return _pick(image, keys)
+
+    async def find_image(self, image_uid: str, keys: list[str]) -> Optional[dict]:
+        with self.client.lock:
+            image = self.client.images.get(image_uid)
+            if image is None or image["is_deleted"]:
+                return None
+            return _pick(image, keys)
+
+    async def get_images_info(self, image_uids: list[str], keys: list[str]) -> dict[str, dict]:
+        with self.client.lock:
+            return {
+                image_uid: _pick(image, keys)
+                for image_uid in image_uids
+                if (image := self.client.images.get(image_uid)) is not None
+                and not image["is_deleted"]
+            }
+
+    async def update_image_info(self, image_uid: str, data: dict[str, Any]) -> None:
+        with self.client.lock:
+            image = self.client.images.get(image_uid)
+            if image is not None:
+                image.update(data)
+
+    async def filter_images(
+        self,
+        user_uid: str,
+        page: int,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+    ) -> list[str]:
+        images_per_page = IMAGES_PER_PAGE
+        wanted = set(labels or [])
+        with self.client.lock:
+            images = [
+                image
+                for image_uid in self.client.images_by_user.get(user_uid, ())
+                if not (image := self.client.images[image_uid])["is_deleted"]
+            ]
+        if wanted:
+            images = [image for image in images if wanted.intersection(image["labels"])]
+        images.sort(key=lambda image: image[sort_by], reverse=sort_order == "desc")
+        start = (page - 1) * images_per_page
+        return [image["image_uid"] for image in images[start : start + images_per_page]]
+
+    async def seek_images(
+        self,
+        user_uid: str,
+        sort_by: str,
+        sort_order: str,
+        labels: Optional[list[str]],
+        after: Optional[tuple[Any, str]] = None,
+    ) -> list[tuple[Any, str]]:
+        desc = sort_order == "desc"
+        wanted = set(labels or [])
+        with self.client.lock:
+            images = [
+                image
+                for image_uid in self.client.images_by_user.get(user_uid, ())
+                if not (image := self.client.images[image_uid])["is_deleted"]
+            ]
+        keys = [
+            (image[sort_by], image["image_uid"])
+            for image in images
+            if not wanted or wanted.intersection(image["labels"])
+        ]
+        if after is not None:
+            after = tuple(after)
+            keys = [key for key in keys if (key < after if desc else key > after)]
+        keys.sort(reverse=desc)
+        return keys[:IMAGES_PER_PAGE]
+
+
+async def _count_postgres_labels(
+    conn: psycopg.AsyncConnection, user_uid: str, labels: list[str], delta: int
+) -> None:
+    """
+    Add delta to the image count of each label in the owner's label index.
+    """
+    if not labels:
+        return
+    await conn.execute(
+        "INSERT INTO user_labels (user_uid, label, image_count)"
+        " SELECT %s, label, greatest(%s, 0) FROM unnest(%s::text[]) AS label"
+        " ON CONFLICT (user_uid, label)"
+        " DO UPDATE SET image_count = user_labels.image_count + %s",
+        (user_uid, delta, labels, delta),
+    )
+
+
+def _count_sqlite_labels(
+    conn: sqlite3.Connection, user_uid: str, labels: list[str], delta: int
+) -> None:
+    """
+    Add delta to the image count of each label in the owner's label index.
+    """
+    conn.executemany(
+        "INSERT INTO user_labels (user_uid, label, image_count) VALUES (?, ?, max(?, 0))"
+        " ON CONFLICT (user_uid, label) DO UPDATE SET image_count = image_count + ?",
+        [(user_uid, label, delta, delta) for label in labels],
+    )
+
+
+@contextmanager
+def _sqlite_transaction(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Run the block in a write transaction, taking the write lock up front.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _postgrest_quote(value: Any) -> str:
+    """
+    Quote a value for a PostgREST logic filter, where commas, dots, colons and parentheses are
+    reserved.
+    """
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def _column_list(table: str, columns: Iterable[str]) -> str:
+    """
+    Quote column names for SQL that cannot take them as parameters, rejecting unknown ones.
+    """
+    known = (User if table == "users" else Image).model_fields
+    unknown = [column for column in columns if column not in known]
+    if unknown:
+        raise ValueError(f"Unknown {table} columns: {', '.join(unknown)}")
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def _to_sqlite_row(data: dict[str, Any]) -> dict[str, Any]:
+    return {
+        key: json.dumps(value) if isinstance(value, list) else value for key, value in data.items()
+    }
+
+
+def _from_sqlite_row(row: dict[str, Any]) -> dict[str, Any]:
+    for key in ("labels", "thumbnail_types"):
+        if key in row:
+            row[key] = json.loads(row[key])
+    for key in ("is_deleted", "is_premium", "is_uploaded", "is_thumbnail_uploaded"):
+        if key in row:
+            row[key] = bool(row[key])
+    return row
+
+
+def _pick(row: dict[str, Any], keys: list[str]) -> dict[str, Any]:
+    """
+    Copy the requested fields out of a stored row, so callers cannot mutate the table.
+    """
+    picked = {}
+    for key in keys:
+        value = row.get(key)
+        picked[key] = list(value) if isinstance(value, list) else value
+    return picked
+
 
 match DATABASE_PROVIDER:
     case "supabase":
         get_db_client = supabase_client
+        start_db_client = start_supabase_client
+        close_db_client = close_supabase_database
         get_db_handler = SupabaseTable
+    case "postgres":
+        get_db_client = postgres_pool
+        start_db_client = start_postgres_pool
+        close_db_client = close_postgres_pool
+        get_db_handler = PostgresTable
+    case "sqlite":
+        get_db_client = sqlite_database
+        start_db_client = start_sqlite_database
+        close_db_client = close_sqlite_database
+        get_db_handler = SQLiteTable
+    case "memory":
+        get_db_client = memory_database
+        start_db_client = start_memory_database
+        close_db_client = close_memory_database
+        get_db_handler = MemoryTable
     case _:
         raise UnknownDatabaseProvider(f"Unknown database provider: {DATABASE_PROVIDER}")
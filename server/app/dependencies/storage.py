@@ -1,52 +1,200 @@
+import inspect
+import os
+import shutil
 from abc import ABC, abstractmethod
-from typing import Union
+from collections.abc import Callable
+from datetime import timedelta
+from functools import wraps
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
 
 from fastapi import HTTPException, status
+from minio import Minio
+from minio.error import MinioException
 from postgrest.exceptions import APIError
+from storage3.utils import StorageException
 from supabase.client import Client as SupabaseClient
+from urllib3.exceptions import HTTPError
 
-from app.config import STORAGE_PROVIDER
-from app.utils.supabase import supabase_client
+from app.config import (
+    MINIO_BUCKET,
+    MINIO_PARALLEL_UPLOADS,
+    MINIO_PART_SIZE,
+    SIGNED_URL_CACHE_SIZE,
+    SIGNED_URL_EXPIRES_IN_SECONDS,
+    SIGNED_URL_EXPIRY_MARGIN_SECONDS,
+    STORAGE_PROVIDER,
+    THUMBNAIL_CACHE_DIR,
+    THUMBNAIL_CACHE_DISK_BYTES,
+    THUMBNAIL_CACHE_MEMORY_BYTES,
+)
+from app.utils.cache import DiskCache, MemoryCache, TieredCache, TTLCache
+from app.utils.filesystem import (
+    close_filesystem_root,
+    filesystem_root,
+    start_filesystem_root,
+    write_atomic,
+)
+from app.utils.minio import close_minio_client, minio_client, start_minio_client
+from app.utils.supabase import close_supabase_client, start_supabase_client, supabase_client
 
-type StorageClient = Union[SupabaseClient]
+type StorageClient = Union[SupabaseClient, Minio, Path]
+
+signed_url_cache = TTLCache(name="signed_url", maxsize=SIGNED_URL_CACHE_SIZE)
+# Thumbnails never change once uploaded, so they are cached by image UID and media type until
+# the image is deleted.
+thumbnail_cache = TieredCache(
+    name="thumbnail",
+    memory=MemoryCache(max_bytes=THUMBNAIL_CACHE_MEMORY_BYTES),
+    disk=DiskCache(directory=THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_DISK_BYTES)
+    if THUMBNAIL_CACHE_DIR
+    else None,
+)
 
 
 class UnknownStorageProvider(Exception):
     pass
 
 
+# Suffix of the object name of each thumbnail encoding. PNG thumbnails keep the bare storage key
+# they were stored under before there were other encodings.
+THUMBNAIL_SUFFIXES = {"image/png": "", "image/webp": ".webp", "image/jpeg": ".jpg"}
+
+
+def thumbnail_name(storage_key: str, media_type: str) -> str:
+    return f"{storage_key}{THUMBNAIL_SUFFIXES[media_type]}"
+
+
+def forget_thumbnail(storage_key: str) -> None:
+    """
+    Drop the cached signed urls of every encoding of a thumbnail that is being replaced or
+    deleted.
+    """
+    for media_type in THUMBNAIL_SUFFIXES:
+        signed_url_cache.invalidate(("thumbnail", storage_key, media_type))
+
+
+async def forget_cached_thumbnail(image_uid: str) -> None:
+    """
+    Drop the cached bytes of every encoding of the thumbnail of a deleted image, from the memory
+    tier of this worker and the disk tier it shares with the others. The memory tiers of other
+    workers keep theirs until evicted, so get_thumbnail checks the image is live before serving
+    cached bytes.
+    """
+    for media_type in THUMBNAIL_SUFFIXES:
+        await thumbnail_cache.invalidate((image_uid, media_type))
+
+
+def cache_signed_url(kind: str) -> Callable:
+    """
+    Reuse the signed url of an object until shortly before it expires, so hot images skip the
+    signing call to the storage provider.
+    """
+
+    def decorator(method: Callable[..., str]) -> Callable[..., str]:
+        signature = inspect.signature(method)
+
+        @wraps(method)
+        def wrapper(self, *args: str, **kwargs: str) -> str:
+            # Bind the arguments, so that defaults and keywords make the same key as the
+            # positional call.
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            key = (kind, *list(arguments.arguments.values())[1:])
+            url = signed_url_cache.get(key)
+            if url is None:
+                url = method(*arguments.args, **arguments.kwargs)
+                signed_url_cache.set(
+                    key, url, ttl=SIGNED_URL_EXPIRES_IN_SECONDS - SIGNED_URL_EXPIRY_MARGIN_SECONDS
+                )
+            return url
+
+        return wrapper
+
+    return decorator
+
+
 class StorageOperator(ABC):
+    """
+    Objects are named by the storage key of their image: the sha256 hex digest of the uploaded
+    file, shared by every image uploaded with the same content, or the image UID for images
+    uploaded before there were storage keys.
+
+    Uploads must overwrite an object already stored under the same name. Originals are replaced
+    in place once converted for streaming, uploads of the same content write the same objects,
+    and background jobs write them again when retried.
+    """
+
     def __init__(self, client):
         self.client = client
 
     @abstractmethod
-    def upload_original(self, image_uid: str, file: bytes, content_type: str):
+    def upload_original(self, storage_key: str, file: Union[bytes, BinaryIO], content_type: str):
+        """
+        Store the original image, replacing any stored under storage_key. A file object is read
+        in chunks, so large images do not have to be loaded in memory.
+        """
         pass
 
     @abstractmethod
-    def upload_thumbnail(self, image_uid: str, file: bytes):
+    def upload_thumbnail(self, storage_key: str, file: bytes, media_type: str = "image/png"):
+        """
+        Store one encoding of the thumbnail, replacing any stored under storage_key. Each media
+        type is kept as its own object.
+        """
         pass
 
     @abstractmethod
-    def get_original_url(self, image_uid: str) -> str:
+    def download_original(self, storage_key: str, path: str):
         """
-        Generate a temporarily available url to download the original image.
+        Copy the stored original image into a local file, e.g. to process it again.
         """
         pass
 
     @abstractmethod
-    def get_thumbnail_url(self, image_uid: str) -> str:
+    def get_original_url(self, storage_key: str) -> str:
         """
-        Generate a temporarily available url to download the thumbnail of the image.
+        Generate a temporarily available url to download the original image. Backends that
+        keep images on this machine raise NotImplementedError; see get_original_path.
         """
         pass
 
     @abstractmethod
-    def delete_original(self, image_uid: str):
+    def get_thumbnail_url(self, storage_key: str, media_type: str = "image/png") -> str:
+        """
+        Generate a temporarily available url to download the thumbnail of the image, in the
+        given encoding. Backends that keep images on this machine raise NotImplementedError;
+        see get_thumbnail_path.
+        """
         pass
 
+    def get_original_path(self, storage_key: str) -> Optional[str]:  # noqa: ARG002
+        """
+        Local path of the original image, for backends that keep images on this machine. Routes
+        serve such files directly instead of going through a url.
+        """
+        return None
+
+    def get_thumbnail_path(
+        self,
+        storage_key: str,  # noqa: ARG002
+        media_type: str = "image/png",  # noqa: ARG002
+    ) -> Optional[str]:
+        """
+        Local path of the thumbnail, for backends that keep images on this machine.
+        """
+        return None
+
     @abstractmethod
-    def delete_thumbnail(self, image_uid: str):
+    def delete_original(self, storage_key: str):
+        pass
+
+    @abstractmethod
+    def delete_thumbnail(self, storage_key: str):
+        """
+        Delete every encoding of the thumbnail.
+        """
         pass
 
 
@@ -54,66 +202,283 @@ class SupabaseStorage(StorageOperator):
     def __init__(self, client: SupabaseClient):
         super().__init__(client)
 
-    def upload_original(self, image_uid: str, file: bytes, content_type: str):
+    def upload_original(self, storage_key: str, file: Union[bytes, BinaryIO], content_type: str):
+        signed_url_cache.invalidate(("original", storage_key))
         try:
+            # Files are sent as a streamed multipart body. Supabase refuses to overwrite an existing
+            # object unless asked to upsert.
             self.client.storage.from_("images").upload(
-                path=f"original/{image_uid}",
+                path=f"original/{storage_key}",
                 file=file,
-                file_options={"content-type": content_type},
+                file_options={"content-type": content_type, "upsert": "true"},
             )
-        except APIError:
+        except (APIError, StorageException):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error connecting to database",
             )
 
-    def upload_thumbnail(self, image_uid: str, file: bytes):
+    def upload_thumbnail(self, storage_key: str, file: bytes, media_type: str = "image/png"):
+        forget_thumbnail(storage_key)
         try:
             self.client.storage.from_("images").upload(
-                path=f"thumbnail/{image_uid}",
+                path=f"thumbnail/{thumbnail_name(storage_key, media_type)}",
                 file=file,
-                file_options={"content-type": "image/png"},
+                file_options={"content-type": media_type, "upsert": "true"},
+            )
+        except (APIError, StorageException):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database",
             )
-        except APIError:
+
+    def download_original(self, storage_key: str, path: str):
+        try:
+            data = self.client.storage.from_("images").download(f"original/{storage_key}")
+        except (APIError, StorageException):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error connecting to database",
             )
+        write_atomic(path, data)
 
-    def get_original_url(self, image_uid: str) -> str:
+    @cache_signed_url("original")
+    def get_original_url(self, storage_key: str) -> str:
         try:
             response = self.client.storage.from_("images").create_signed_url(
-                path=f"original/{image_uid}", expires_in=60
+                path=f"original/{storage_key}", expires_in=SIGNED_URL_EXPIRES_IN_SECONDS
             )
             return response["signedURL"]
-        except APIError:
+        except (APIError, StorageException):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error connecting to database",
             )
 
-    def get_thumbnail_url(self, image_uid: str) -> str:
+    @cache_signed_url("thumbnail")
+    def get_thumbnail_url(self, storage_key: str, media_type: str = "image/png") -> str:
         try:
             response = self.client.storage.from_("images").create_signed_url(
-                path=f"thumbnail/{image_uid}", expires_in=60
+                path=f"thumbnail/{thumbnail_name(storage_key, media_type)}",
+                expires_in=SIGNED_URL_EXPIRES_IN_SECONDS,
             )
             return response["signedURL"]
-        except APIError:
+        except (APIError, StorageException):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error connecting to database",
             )
 
-    def delete_original(self, image_uid: str):
-        pass
+    def delete_original(self, storage_key: str):
+        signed_url_cache.invalidate(("original", storage_key))
+        try:
+            self.client.storage.from_("images").remove([f"original/{storage_key}"])
+        except (APIError, StorageException):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database",
+            )
 
-    def delete_thumbnail(self, image_uid: str):
-        pass
+    def delete_thumbnail(self, storage_key: str):
+        forget_thumbnail(storage_key)
+        try:
+            self.client.storage.from_("images").remove(
+                [
+                    f"thumbnail/{thumbnail_name(storage_key, media_type)}"
+                    for media_type in THUMBNAIL_SUFFIXES
+                ]
+            )
+        except (APIError, StorageException):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database",
+            )
+
+
+class MinioStorage(StorageOperator):
+    """
+    Store images in a MinIO (or any S3 compatible) bucket.
+
+    Originals larger than MINIO_PART_SIZE go up as a multipart upload with several parts in
+    flight at once. Presigned urls are signed locally, and the object store answers ranged GETs
+    on them, so the image routes can proxy byte ranges as they do for Supabase.
+    """
+
+    def __init__(self, client: Minio):
+        super().__init__(client)
+
+    def _put(self, path: str, file: Union[bytes, BinaryIO], content_type: str):
+        if isinstance(file, bytes):
+            data, length = BytesIO(file), len(file)
+        else:
+            data, length = file, os.fstat(file.fileno()).st_size - file.tell()
+        try:
+            self.client.put_object(
+                MINIO_BUCKET,
+                path,
+                data,
+                length=length,
+                content_type=content_type,
+                part_size=MINIO_PART_SIZE,
+                num_parallel_uploads=MINIO_PARALLEL_UPLOADS,
+            )
+        except (MinioException, HTTPError):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database",
+            )
+
+    def _presign(self, path: str) -> str:
+        return self.client.presigned_get_object(
+            MINIO_BUCKET, path, expires=timedelta(seconds=SIGNED_URL_EXPIRES_IN_SECONDS)
+        )
+
+    def _remove(self, path: str):
+        try:
+            self.client.remove_object(MINIO_BUCKET, path)
+        except (MinioException, HTTPError):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database",
+            )
+
+    def upload_original(self, storage_key: str, file: Union[bytes, BinaryIO], content_type: str):
+        signed_url_cache.invalidate(("original", storage_key))
+        self._put(f"original/{storage_key}", file, content_type)
+
+    def upload_thumbnail(self, storage_key: str, file: bytes, media_type: str = "image/png"):
+        forget_thumbnail(storage_key)
+        self._put(f"thumbnail/{thumbnail_name(storage_key, media_type)}", file, media_type)
+
+    def download_original(self, storage_key: str, path: str):
+        try:
+            self.client.fget_object(MINIO_BUCKET, f"original/{storage_key}", path)
+        except (MinioException, HTTPError):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database",
+            )
+
+    @cache_signed_url("original")
+    def get_original_url(self, storage_key: str) -> str:
+        return self._presign(f"original/{storage_key}")
+
+    @cache_signed_url("thumbnail")
+    def get_thumbnail_url(self, storage_key: str, media_type: str = "image/png") -> str:
+        return self._presign(f"thumbnail/{thumbnail_name(storage_key, media_type)}")
+
+    def delete_original(self, storage_key: str):
+        signed_url_cache.invalidate(("original", storage_key))
+        self._remove(f"original/{storage_key}")
+
+    def delete_thumbnail(self, storage_key: str):
+        forget_thumbnail(storage_key)
+        for media_type in THUMBNAIL_SUFFIXES:
+            self._remove(f"thumbnail/{thumbnail_name(storage_key, media_type)}")
+
+
+class FilesystemStorage(StorageOperator):
+    """
+    Store images on the local filesystem, under FILESYSTEM_STORAGE_DIR.
+
+    Files are sharded by the first characters of the storage key, e.g.
+    original/3f/a2/3fa2..., so no directory grows past a few hundred entries. Writes go to a
+    temporary file that is renamed into place, so readers never see a partial image. The image
+    routes serve these files with FileResponse, which also answers byte ranges.
+    """
+
+    def __init__(self, client: Path):
+        super().__init__(client)
+
+    def _path(self, kind: str, storage_key: str, name: Optional[str] = None) -> Path:
+        return self.client / kind / storage_key[:2] / storage_key[2:4] / (name or storage_key)
+
+    def _thumbnail_path(self, storage_key: str, media_type: str) -> Path:
+        return self._path("thumbnail", storage_key, thumbnail_name(storage_key, media_type))
+
+    def _write(self, path: Path, file: Union[bytes, BinaryIO]):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(str(path), file, fsync=True)
+        except OSError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error writing to storage",
+            )
+
+    def _remove(self, path: Path):
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error writing to storage",
+            )
+
+    # The content type is kept in the database and sent from there when the file is served.
+    def upload_original(
+        self,
+        storage_key: str,
+        file: Union[bytes, BinaryIO],
+        content_type: str,  # noqa: ARG002
+    ):
+        self._write(self._path("original", storage_key), file)
+
+    def upload_thumbnail(self, storage_key: str, file: bytes, media_type: str = "image/png"):
+        forget_thumbnail(storage_key)
+        self._write(self._thumbnail_path(storage_key, media_type), file)
+
+    def download_original(self, storage_key: str, path: str):
+        try:
+            shutil.copyfile(self._path("original", storage_key), path)
+        except OSError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error reading from storage",
+            )
+
+    # A file:// url is of no use to a client, so the routes must serve get_*_path instead.
+    def get_original_url(self, storage_key: str) -> str:
+        raise NotImplementedError(
+            f"FilesystemStorage serves original/{storage_key} by path, not by url"
+        )
+
+    def get_thumbnail_url(self, storage_key: str, media_type: str = "image/png") -> str:
+        raise NotImplementedError(
+            f"FilesystemStorage serves thumbnail/{thumbnail_name(storage_key, media_type)} by"
+            " path, not by url"
+        )
+
+    def get_original_path(self, storage_key: str) -> Optional[str]:
+        return str(self._path("original", storage_key))
+
+    def get_thumbnail_path(self, storage_key: str, media_type: str = "image/png") -> Optional[str]:
+        return str(self._thumbnail_path(storage_key, media_type))
+
+    def delete_original(self, storage_key: str):
+        self._remove(self._path("original", storage_key))
+
+    def delete_thumbnail(self, storage_key: str):
+        forget_thumbnail(storage_key)
+        for media_type in THUMBNAIL_SUFFIXES:
+            self._remove(self._thumbnail_path(storage_key, media_type))
 
 
 match STORAGE_PROVIDER:
     case "supabase":
         get_storage_client = supabase_client
+        start_storage_client = start_supabase_client
+        close_storage_client = close_supabase_client
         get_storage_handler = SupabaseStorage
+    case "minio":
+        get_storage_client = minio_client
+        start_storage_client = start_minio_client
+        close_storage_client = close_minio_client
+        get_storage_handler = MinioStorage
+    case "filesystem":
+        get_storage_client = filesystem_root
+        start_storage_client = start_filesystem_root
+        close_storage_client = close_filesystem_root
+        get_storage_handler = FilesystemStorage
     case _:
         raise UnknownStorageProvider(f"Unknown storage provider: {STORAGE_PROVIDER}")
@@ -1,14 +1,48 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.config import MAX_BULK_UPLOAD_BYTES
+from app.dependencies.db import close_db_client, start_db_client
+from app.dependencies.storage import close_storage_client, start_storage_client
 from app.routes.auth import router as auth_router
 from app.routes.image import router as image_router
+from app.routes.stats import router as stats_router
 from app.routes.user import router as user_router
+from app.utils.auth import password_executor
+from app.utils.http import close_http_client, start_http_client
+from app.utils.image import image_executor, image_jobs
+from app.utils.upload import UploadSizeLimitMiddleware
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    start_db_client()
+    start_storage_client()
+    start_http_client()
+    image_executor.start()
+    image_jobs.start()
+    password_executor.start()
+    try:
+        yield
+    finally:
+        password_executor.shutdown()
+        await image_jobs.shutdown()
+        image_executor.shutdown()
+        await close_http_client()
+        close_storage_client()
+        await close_db_client()
 
-app = FastAPI(swagger_ui_parameters={"defaultModelsExpandDepth": -1})
+
+app = FastAPI(lifespan=lifespan, swagger_ui_parameters={"defaultModelsExpandDepth": -1})
 app.include_router(auth_router, prefix="/auth")
 app.include_router(image_router, prefix="/image")
 app.include_router(user_router, prefix="/user")
+app.include_router(stats_router, prefix="/stats")
+app.add_middleware(
+    UploadSizeLimitMiddleware, path_limits={"/image/upload/bulk": MAX_BULK_UPLOAD_BYTES}
+)
 
 origins = [
     "http://localhost:5173",
@@ -24,7 +24,12 @@ class Image(BaseModel):
     file_name: str
     content_type: str
     size: int
+    content_hash: Optional[str] = None  # sha256 hex digest of the stored original.
     created_at: str
     updated_at: str
     labels: list[str]
+    thumbnail_types: list[str] = ["image/png"]  # media types the thumbnail is stored in.
+    storage_key: Optional[str] = None  # name of the stored files, shared by identical uploads.
+    is_uploaded: bool = False  # whether the original is in storage.
+    is_thumbnail_uploaded: bool = False  # whether every thumbnail_types encoding is in storage.
     is_deleted: bool = False
@@ -0,0 +1,41 @@
+"""
+Queue a job again for every stored image still without thumbnails, as a one-shot task.
+
+Jobs live in the server worker that took the upload, so those pending at shutdown, or lost in
+a crash, are never finished by the server itself. Run this while no server worker is running,
+e.g. after a crash or in the deploy step before the workers start:
+
+    python -m app.requeue
+
+With workers running it would redo the jobs they still have in flight.
+"""
+
+import asyncio
+import logging
+
+from app.dependencies.db import close_db_client, get_db_client, start_db_client
+from app.dependencies.storage import close_storage_client, get_storage_client, start_storage_client
+from app.utils.image import image_executor, image_jobs, requeue_image_jobs
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    start_db_client()
+    start_storage_client()
+    image_executor.start()
+    try:
+        count = await requeue_image_jobs(get_db_client(), get_storage_client())
+        logger.info("Requeued %d image jobs", count)
+        await image_jobs.join()
+        logger.info("Image jobs finished: %s", image_jobs.stats())
+    finally:
+        await image_jobs.shutdown()
+        image_executor.shutdown()
+        close_storage_client()
+        await close_db_client()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
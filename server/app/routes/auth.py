@@ -1,14 +1,19 @@
+from collections.abc import Callable
 from datetime import UTC, datetime
-from typing import Annotated
+from typing import Annotated, Any
 
 import httpx
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Body, HTTPException, status
 from fastapi.params import Depends
 from google.auth.transport import requests
 from google.oauth2 import id_token
 from postgrest.exceptions import APIError
 
-from app.config import GOOGLE_OAUTH_CLIENT_ID, GOOGLE_OAUTH_CLIENT_SECRET
+from app.config import (
+    GOOGLE_OAUTH_CLIENT_ID,
+    GOOGLE_OAUTH_CLIENT_SECRET,
+    PASSWORD_HASH_RETRY_AFTER_SECONDS,
+)
 from app.dependencies.db import DatabaseClient, get_db_client, get_db_handler
 from app.schemas import (
     AuthTokenResponse,
@@ -23,13 +28,44 @@ from app.schemas import (
 from app.utils.auth import (
     create_access_token,
     create_refresh_token,
+    hash_password,
+    needs_rehash,
+    password_executor,
     validate_token,
     verify_password,
 )
+from app.utils.executor import ExecutorSaturated
 
 router = APIRouter()
 
 
+async def run_password_job(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Hash or check a password on the password executor, turning a full queue into a 503.
+    """
+    try:
+        return await password_executor.submit(fn, *args)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins are being processed. Try again later.",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+        )
+
+
+async def rehash_password(user_uid: str, password: str, db_client: DatabaseClient) -> None:
+    """
+    Replace a password hash made at another cost than BCRYPT_ROUNDS, once the login that proved
+    the password has been answered. Left to a later login if the executor is busy.
+    """
+    try:
+        hashed_password = await password_executor.submit(hash_password, password)
+    except ExecutorSaturated:
+        return
+    db = get_db_handler(db_client)
+    await db.update_user_info(user_uid=user_uid, data={"password": hashed_password})
+
+
 @router.post("/signup", status_code=status.HTTP_201_CREATED, response_model=SignupResponse)
 async def signup(
     request: Annotated[SignupRequest, Body(...)],
@@ -53,14 +89,15 @@ async def signup(
             UID for the newly registered user.
     """
     db = get_db_handler(db_client)
-    if db.is_email_exists(email=request.email, auth_provider="email"):
+    if await db.is_email_exists(email=request.email, auth_provider="email"):
         raise HTTPException(status_code=400, detail="Email already registered")
-    if db.is_username_exists(username=request.username, auth_provider="email"):
+    if await db.is_username_exists(username=request.username, auth_provider="email"):
         raise HTTPException(status_code=400, detail="Username already taken")
-    user_uid = db.insert_new_user(
+    hashed_password = await run_password_job(hash_password, request.password)
+    user_uid = await db.insert_new_user(
         email=request.email,
         username=request.username,
-        password=request.password,
+        hashed_password=hashed_password,
         auth_provider="email",
     )
 
@@ -71,9 +108,11 @@ async def signup(
 async def login(
     request: Annotated[LoginRequest, Body(...)],
     db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+    background_tasks: BackgroundTasks,
 ):
     """
-    Login an user using email and password.
+    Login an user using email and password. A password hashed at another cost than the server's
+    is hashed again once the login is answered.
 
     Request body:
 
@@ -93,19 +132,24 @@ async def login(
     """
     db = get_db_handler(db_client)
     try:
-        user_creds = db.get_user_info(email=request.email, keys=["user_uid", "password"])
+        user_creds = await db.get_user_info(email=request.email, keys=["user_uid", "password"])
     except APIError:
         raise HTTPException(status_code=500, detail="Error connecting to database")
     if not user_creds:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if not verify_password(request.password, user_creds["password"]):
+    if not await run_password_job(verify_password, request.password, user_creds["password"]):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
 
     user_uid = user_creds["user_uid"]
+    if needs_rehash(user_creds["password"]):
+        background_tasks.add_task(rehash_password, user_uid, request.password, db_client)
     access_token = create_access_token(user_uid=user_uid)
     refresh_token = create_refresh_token(user_uid=user_uid)
     try:
-        db.update_user_info(user_uid=user_uid, data={"last_active": datetime.now(UTC).isoformat()})
+        await db.update_user_info(
+            user_uid=user_uid,
+            data={"last_active": datetime.now(UTC).isoformat()},
+        )
     except APIError:
         raise HTTPException(status_code=500, detail="Error connecting to database")
 
@@ -169,12 +213,15 @@ async def continue_with_google(
     email = id_info.get("email")
 
     db = get_db_handler(db_client)
-    if db.is_email_exists(email, auth_provider="google"):
-        user_uid = db.get_user_uid(email=email, auth_provider="google")
-        db.update_user_info(user_uid=user_uid, data={"last_active": datetime.now(UTC).isoformat()})
+    if await db.is_email_exists(email, auth_provider="google"):
+        user_uid = await db.get_user_uid(email=email, auth_provider="google")
+        await db.update_user_info(
+            user_uid=user_uid,
+            data={"last_active": datetime.now(UTC).isoformat()},
+        )
     else:
         username = email.split("@")[0]
-        user_uid = db.insert_new_user(
+        user_uid = await db.insert_new_user(
             email=email,
             username=username,
             auth_provider="google",
@@ -1,35 +1,259 @@
+import asyncio
+import logging
+import os
+from collections.abc import Iterable, Sequence
 from datetime import UTC, datetime
-from typing import Annotated
+from functools import partial
+from typing import Annotated, Any, Optional
 
-import requests
+import httpx
 from fastapi import (
     APIRouter,
+    Body,
     Depends,
     File,
     Form,
+    Header,
     HTTPException,
     Path,
+    Query,
     UploadFile,
     status,
 )
-from fastapi.responses import Response, StreamingResponse
+from fastapi.responses import FileResponse, RedirectResponse, Response
 from postgrest.exceptions import APIError
-
-from app.dependencies.db import DatabaseClient, get_db_client, get_db_handler
-from app.dependencies.storage import StorageClient, get_storage_client, get_storage_handler
-from app.schemas import ImageInfoResponse, ImageUploadResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.config import (
+    BULK_UPLOAD_CONCURRENCY,
+    BULK_UPLOAD_MAX_FILES,
+    IMAGE_QUEUE_RETRY_AFTER_SECONDS,
+    IMAGE_SERVING_MODE,
+    ORIGINAL_CACHE_CONTROL,
+    THUMBNAIL_CACHE_CONTROL,
+    TRANSCODE_POLICY,
+)
+from app.dependencies.db import DatabaseClient, TableOperator, get_db_client, get_db_handler
+from app.dependencies.storage import (
+    StorageClient,
+    forget_cached_thumbnail,
+    get_storage_client,
+    get_storage_handler,
+    thumbnail_cache,
+)
+from app.schemas import (
+    BulkUploadResponse,
+    BulkUploadResult,
+    ImageInfoBatchRequest,
+    ImageInfoBatchResponse,
+    ImageInfoResponse,
+    ImageInfoUpdateRequest,
+    ImageJobStatus,
+    ImageStatusResponse,
+    ImageUploadResponse,
+)
 from app.utils.auth import get_access_token, validate_token
+from app.utils.executor import ExecutorSaturated
+from app.utils.http import (
+    cache_headers,
+    fetch_url,
+    get_http_client,
+    if_range_matches,
+    is_not_modified,
+    make_etag,
+    negotiate_media_type,
+    parse_range,
+    stream_url,
+)
 from app.utils.image import (
-    enable_image_streaming,
-    generate_thumbnail,
+    THUMBNAIL_MEDIA_TYPES,
+    UnsupportedFormat,
+    image_executor,
+    image_jobs,
+    process_image,
+    process_original,
+    upload_original,
 )
+from app.utils.upload import spool_upload
 
 SUPPORTED_CONTENT_TYPES = {"image/png", "image/jpeg"}
+IMAGE_INFO_KEYS = ["title", "file_name", "labels", "created_at", "updated_at"]
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter()
 
 
+def should_redirect(redirect: Optional[bool]) -> bool:
+    """
+    Whether to redirect the client to storage instead of proxying the image. Falls back to the
+    deployment-wide IMAGE_SERVING_MODE when the client does not ask for either.
+    """
+    if redirect is None:
+        return IMAGE_SERVING_MODE == "redirect"
+    return redirect
+
+
+def serve_file(path: str, media_type: str, headers: dict[str, str]) -> FileResponse:
+    """
+    Serve an image kept on local storage. FileResponse answers Range and If-Range itself and
+    keeps our ETag and Last-Modified over the ones it would derive from the file.
+    """
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def check_content_type(file: UploadFile) -> str:
+    if file.content_type not in SUPPORTED_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported or missing content type."
+        )
+    return file.content_type
+
+
+def clean_labels(labels: Optional[str]) -> list[str]:
+    return [label.strip() for label in labels.split(",")] if labels else []
+
+
+async def prepare_upload(
+    file: UploadFile, content_type: str, db: TableOperator
+) -> tuple[Optional[str], set[str], dict[str, Any]]:
+    """
+    Spool an uploaded file to disk, checking its format and size and hashing it on the way. If
+    an image with the same content is already stored, the upload shares its files and nothing
+    else is done. Otherwise the file must be a readable image; it is converted for streaming
+    here only if TRANSCODE_POLICY is "always", and otherwise just its header is read.
+
+    Returns:
+        - image_path: the image to be stored, or None if its content is already stored
+        - temp_paths: temporary files to be removed by the caller, or handed to the image job
+        - upload: the content_type, size, content_hash, thumbnail_types, storage_key and
+          is_stored arguments of record_image_upload
+    """
+    spool_path, _, storage_key = await spool_upload(file, content_type)
+    try:
+        stored_image = await db.find_stored_image(
+            storage_key,
+            keys=["content_type", "size", "content_hash", "thumbnail_types"],
+        )
+    except APIError:
+        os.remove(spool_path)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to database.",
+        )
+    except BaseException:
+        os.remove(spool_path)
+        raise
+    if stored_image is not None:
+        # The same bytes make the same checked, converted and thumbnailed image.
+        os.remove(spool_path)
+        return None, set(), {**stored_image, "storage_key": storage_key, "is_stored": True}
+
+    try:
+        if TRANSCODE_POLICY == "always":
+            image_path, content_hash, size = await image_executor.submit(
+                process_original, spool_path, content_type, True, storage_key
+            )
+        else:
+            image_path, content_hash, size = await run_in_threadpool(
+                process_original, spool_path, content_type, False, storage_key
+            )
+    except ExecutorSaturated:
+        os.remove(spool_path)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many images are being processed. Try again later.",
+            headers={"Retry-After": str(IMAGE_QUEUE_RETRY_AFTER_SECONDS)},
+        )
+    except UnsupportedFormat:
+        os.remove(spool_path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported or corrupted image."
+        )
+    except BaseException:
+        os.remove(spool_path)
+        raise
+    upload = {
+        "content_type": content_type,
+        "size": size,
+        "content_hash": content_hash,
+        "thumbnail_types": [],
+        "storage_key": storage_key,
+    }
+    return image_path, {spool_path, image_path}, upload
+
+
+async def store_original(
+    image_uid: str,
+    storage_key: str,
+    image_path: str,
+    content_type: str,
+    db_client: DatabaseClient,
+    storage_client: StorageClient,
+) -> None:
+    """
+    Stream the original into storage and mark it uploaded, without blocking the event loop.
+    """
+    with open(image_path, "rb") as image:
+        await upload_original(
+            image, image_uid, storage_key, db_client, storage_client, content_type
+        )
+
+
+async def discard_uploads(db: TableOperator, image_uids: Iterable[str]) -> None:
+    """
+    Delete images whose original could not be stored, so that they neither show up in listings
+    nor count towards their owner's image_count.
+    """
+    for image_uid in image_uids:
+        try:
+            await db.delete_image(image_uid)
+        except APIError:
+            logger.exception("Could not discard image %s left without its original", image_uid)
+
+
+def queue_image_job(
+    image_uid: str,
+    storage_key: str,
+    image_path: str,
+    content_type: str,
+    temp_paths: set[str],
+    db_client: DatabaseClient,
+    storage_client: StorageClient,
+    shared_uids: Sequence[str] = (),
+) -> None:
+    """
+    Hand a stored upload over to a background job that makes its thumbnails, and converts it
+    for streaming if TRANSCODE_POLICY is "deferred". The job takes over removing temp_paths, and
+    finishes shared_uids, the images sharing the upload's files, along with it.
+    """
+    job_paths = set(temp_paths)
+    temp_paths.clear()
+    image_jobs.submit(
+        image_uid,
+        partial(
+            process_image,
+            image_uid,
+            storage_key,
+            image_path,
+            content_type,
+            TRANSCODE_POLICY == "deferred",
+            db_client,
+            storage_client,
+            shared_uids,
+        ),
+        finalize=partial(remove_files, job_paths),
+    )
+
+
+def remove_files(paths: Iterable[str]) -> None:
+    for path in paths:
+        os.remove(path)
+
+
 @router.post("/upload", status_code=status.HTTP_201_CREATED, response_model=ImageUploadResponse)
 async def upload_image(
     file: Annotated[UploadFile, File(...)],
@@ -42,6 +266,10 @@ async def upload_image(
     """
     Upload an image to TermiPics. Access token is required — this endpoint is only accessible to the user it belongs to.
 
+    The upload is answered once the original is stored. Thumbnails are made in the background;
+    GET /image/status/{image_uid} tells when they are ready. An image with the same content as
+    one already stored shares its files and is ready at once.
+
     Form body:
 
         - file (jpeg/png)
@@ -59,57 +287,220 @@ async def upload_image(
     payload = validate_token(access_token)
     user_uid = payload["sub"]
 
-    # 1. enable image streaming
-    if file.content_type not in SUPPORTED_CONTENT_TYPES:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported or missing content type."
-        )
+    content_type = check_content_type(file)
     file_name = file.filename
-    content_type = file.content_type
+    labels_cleaned = clean_labels(labels)
 
-    image = await file.read()
-    image = enable_image_streaming(image, content_type)
-    labels_cleaned = [label.strip() for label in labels.split(",")] if labels else []
-
-    # 2. insert new image into the database
+    # 1. spool the upload to disk, checking its format and size and hashing it on the way
     db = get_db_handler(db_client)
+    image_path, temp_paths, upload = await prepare_upload(file, content_type, db)
     try:
-        image_uid = db.insert_new_image(
-            user_uid=user_uid,
-            title=title,
-            file_name=file_name,
-            content_type=content_type,
-            size=len(image),
-            labels=labels_cleaned,
-        )
-        user_info = db.get_user_info(user_uid=user_uid, keys=["image_count", "labels"])
-        current_image_count = user_info.get("image_count")
-        user_labels = list(set(user_info.get("labels")) | set(labels_cleaned))
-        db.update_user_info(
-            user_uid=user_uid,
-            data={
-                "image_count": current_image_count + 1,
-                "last_active": datetime.now(UTC).isoformat(),
-                "labels": user_labels,
-            },
+        # 2. insert new image and update the owner's count and labels, atomically
+        try:
+            image_uid = await db.record_image_upload(
+                user_uid=user_uid,
+                title=title,
+                file_name=file_name,
+                labels=labels_cleaned,
+                **upload,
+            )
+        except APIError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database.",
+            )
+
+        if image_path is not None:
+            storage_key = upload["storage_key"]
+            # 3. stream the original into storage
+            try:
+                await store_original(
+                    image_uid, storage_key, image_path, content_type, db_client, storage_client
+                )
+            except (HTTPException, APIError) as e:
+                await discard_uploads(db, [image_uid])
+                if isinstance(e, HTTPException):
+                    raise
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Error connecting to database.",
+                )
+
+            # 4. make the thumbnails in the background
+            queue_image_job(
+                image_uid,
+                storage_key,
+                image_path,
+                content_type,
+                temp_paths,
+                db_client,
+                storage_client,
+            )
+    finally:
+        remove_files(temp_paths)
+
+    return ImageUploadResponse(image_uid=image_uid)
+
+
+@router.post("/upload/bulk", status_code=status.HTTP_201_CREATED, response_model=BulkUploadResponse)
+async def upload_images(
+    files: Annotated[list[UploadFile], File(...)],
+    titles: Annotated[list[str], Form(...)],
+    access_token: Annotated[str, Depends(get_access_token)],
+    db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+    storage_client: Annotated[StorageClient, Depends(get_storage_client)],
+    labels: Annotated[Optional[list[str]], Form()] = None,
+):
+    """
+    Upload many images to TermiPics in one request. Access token is required — this endpoint is only accessible to the user it belongs to.
+
+    The files are processed a few at a time and recorded in a single database write. A file
+    that cannot be processed or stored is reported in its result and does not fail the others. As with
+    single uploads, thumbnails are made in the background, and images whose content is already
+    stored, or repeated within the request, share its files.
+
+    Form body:
+
+        - files (list of jpeg/png)
+            The image files to be uploaded, at most BULK_UPLOAD_MAX_FILES of them.
+        - titles (list of str)
+            One title per file, in the same order as the files.
+        - labels (list of str, optional)
+            One entry of comma-separated labels per file, in the same order as the files.
+
+    Response:
+
+        - results (list)
+            One entry per file, in the same order as the files:
+            - file_name (str)
+            - image_uid (str): UID of the newly uploaded image, when it was uploaded
+            - error (str): why the file was not uploaded, otherwise
+    """
+    payload = validate_token(access_token)
+    user_uid = payload["sub"]
+
+    if len(files) > BULK_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BULK_UPLOAD_MAX_FILES} files can be uploaded at once.",
         )
-    except APIError:
+    if labels is None:
+        labels = [""] * len(files)
+    if len(titles) != len(files) or len(labels) != len(files):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error connecting to database.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected one title and one labels entry per file.",
         )
 
-    # 3. generate thumbnail
-    thumbnail = generate_thumbnail(image)
-    # 4. save image and thumbnail in storage
-    storage = get_storage_handler(storage_client)
-    storage.upload_original(image_uid=image_uid, file=image, content_type=content_type)
-    storage.upload_thumbnail(
-        image_uid=image_uid,
-        file=thumbnail,
-    )
+    results = [BulkUploadResult(file_name=file.filename) for file in files]
+    prepared: dict[int, tuple[Optional[str], set[str], dict[str, Any]]] = {}
+    semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+    db = get_db_handler(db_client)
 
-    return ImageUploadResponse(image_uid=image_uid)
+    async def prepare(index: int, file: UploadFile) -> None:
+        async with semaphore:
+            try:
+                content_type = check_content_type(file)
+                prepared[index] = await prepare_upload(file, content_type, db)
+            except HTTPException as e:
+                results[index].error = e.detail
+            except Exception:
+                # Fail only this file, so its siblings are neither cancelled nor left running.
+                logger.exception("Could not prepare bulk upload file %s", file.filename)
+                results[index].error = "Could not process the file."
+
+    try:
+        # 1. spool and check the files, a few at a time
+        await asyncio.gather(*(prepare(index, file) for index, file in enumerate(files)))
+        indexes = sorted(prepared)
+
+        # Files with the same content as an earlier one in the batch are stored once, with it.
+        shared: dict[int, list[int]] = {}
+        first_of: dict[str, int] = {}
+        for index in indexes:
+            image_path, temp_paths, upload = prepared[index]
+            if image_path is None:
+                continue
+            first = first_of.setdefault(upload["storage_key"], index)
+            if first != index:
+                remove_files(temp_paths)
+                prepared[index] = None, set(), upload
+                shared.setdefault(first, []).append(index)
+
+        # 2. insert all new images and update the owner's count and labels, in one write
+        try:
+            image_uids = await db.record_image_uploads(
+                user_uid=user_uid,
+                uploads=[
+                    {
+                        "title": titles[index],
+                        "file_name": files[index].filename,
+                        "labels": clean_labels(labels[index]),
+                        **prepared[index][2],
+                    }
+                    for index in indexes
+                ],
+            )
+        except APIError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error connecting to database.",
+            )
+
+        image_uid_of = dict(zip(indexes, image_uids))
+        shared_indexes = {index for sharing in shared.values() for index in sharing}
+
+        # 3. stream the new originals into storage, a few at a time, and queue their thumbnails
+        async def store(index: int) -> None:
+            image_uid = image_uid_of[index]
+            image_path, temp_paths, upload = prepared[index]
+            if image_path is not None:
+                storage_key, content_type = upload["storage_key"], upload["content_type"]
+                shared_uids = [image_uid_of[shared_index] for shared_index in shared.get(index, [])]
+                try:
+                    async with semaphore:
+                        await store_original(
+                            image_uid,
+                            storage_key,
+                            image_path,
+                            content_type,
+                            db_client,
+                            storage_client,
+                        )
+                    for shared_uid in shared_uids:
+                        await db.update_image_info(shared_uid, {"is_uploaded": True})
+                except (HTTPException, APIError) as e:
+                    # Fail only the files stored under this key, and leave no images behind
+                    # without their original.
+                    await discard_uploads(db, [image_uid, *shared_uids])
+                    error = (
+                        e.detail
+                        if isinstance(e, HTTPException)
+                        else "Error connecting to database."
+                    )
+                    for failed_index in (index, *shared.get(index, [])):
+                        results[failed_index].error = error
+                    return
+                queue_image_job(
+                    image_uid,
+                    storage_key,
+                    image_path,
+                    content_type,
+                    temp_paths,
+                    db_client,
+                    storage_client,
+                    shared_uids,
+                )
+                for shared_index in shared.get(index, []):
+                    results[shared_index].image_uid = image_uid_of[shared_index]
+            results[index].image_uid = image_uid
+
+        await asyncio.gather(*(store(index) for index in indexes if index not in shared_indexes))
+    finally:
+        for _, temp_paths, _ in prepared.values():
+            remove_files(temp_paths)
+
+    return BulkUploadResponse(results=results)
 
 
 @router.get("/{image_uid}", status_code=status.HTTP_200_OK)
@@ -117,35 +508,93 @@ async def get_original_image(
     image_uid: Annotated[str, Path(...)],
     db_client: Annotated[DatabaseClient, Depends(get_db_client)],
     storage_client: Annotated[StorageClient, Depends(get_storage_client)],
+    http_client: Annotated[httpx.AsyncClient, Depends(get_http_client)],
+    redirect: Annotated[Optional[bool], Query()] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    if_modified_since: Annotated[Optional[str], Header()] = None,
+    range_header: Annotated[Optional[str], Header(alias="Range")] = None,
+    if_range: Annotated[Optional[str], Header()] = None,
 ):
     """
     Retrieve the uploaded image by image UID. This endpoint is open to public.
 
+    Query Parameters:
+
+        - redirect (bool, optional)
+            Whether to redirect to a short-lived storage url rather than streaming the image
+            through the server. Defaults to the server's serving mode. Ignored when images are
+            kept on the server's own filesystem.
+
+    Header Parameters:
+
+        - If-None-Match / If-Modified-Since (optional)
+            Validators from a cached copy. Answered with 304 if the image has not changed.
+        - Range / If-Range (optional)
+            A single byte range to fetch, answered with 206. Multiple ranges are not supported
+            and get the whole image instead.
+
     Response:
 
-        - The requested image in bytes.
+        - The requested image in bytes, or a temporary redirect to it.
     """
     db = get_db_handler(db_client)
     try:
-        if not db.is_image_exists(image_uid):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
-        content_type = db.get_image_info(image_uid, keys=["content_type"]).get("content_type")
+        image_info = await db.find_image(
+            image_uid,
+            keys=[
+                "content_type",
+                "content_hash",
+                "updated_at",
+                "size",
+                "storage_key",
+                "is_uploaded",
+            ],
+        )
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error connecting to database.",
         )
+    # An image whose original never made it to storage is as good as missing.
+    if image_info is None or not image_info["is_uploaded"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    headers = cache_headers(
+        etag=make_etag(image_info["content_hash"]),
+        updated_at=image_info["updated_at"],
+        cache_control=ORIGINAL_CACHE_CONTROL,
+    )
+    if is_not_modified(headers, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
     storage = get_storage_handler(storage_client)
+    image_path = storage.get_original_path(image_info["storage_key"])
+    if image_path is not None:
+        return serve_file(image_path, image_info["content_type"], headers)
+
+    redirecting = should_redirect(redirect)
+    byte_range = None
+    if not redirecting and if_range_matches(headers, if_range):
+        byte_range = parse_range(range_header, image_info["size"])
+
     try:
-        image_url = storage.get_original_url(image_uid=image_uid)
-        r = requests.get(image_url, stream=True)
+        image_url = await run_in_threadpool(
+            storage.get_original_url, storage_key=image_info["storage_key"]
+        )
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error connecting to storage."
         )
 
-    return StreamingResponse(r.raw, media_type=content_type)
+    if redirecting:
+        return RedirectResponse(image_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    headers["Accept-Ranges"] = "bytes"
+    return await stream_url(
+        http_client,
+        image_url,
+        media_type=image_info["content_type"],
+        headers=headers,
+        byte_range=byte_range,
+    )
 
 
 @router.get("/thumbnail/{image_uid}", status_code=status.HTTP_200_OK)
@@ -153,38 +602,103 @@ async def get_thumbnail(
     image_uid: Annotated[str, Path(...)],
     db_client: Annotated[DatabaseClient, Depends(get_db_client)],
     storage_client: Annotated[StorageClient, Depends(get_storage_client)],
+    http_client: Annotated[httpx.AsyncClient, Depends(get_http_client)],
+    redirect: Annotated[Optional[bool], Query()] = None,
+    accept: Annotated[Optional[str], Header()] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    if_modified_since: Annotated[Optional[str], Header()] = None,
 ):
     """
     Retrieve the thumbnail of the uploaded image by image UID. Access token is required — this endpoint is only accessible to the user it belongs to.
 
+    Query Parameters:
+
+        - redirect (bool, optional)
+            Whether to redirect to a short-lived storage url rather than streaming the thumbnail
+            through the server. Defaults to the server's serving mode. Ignored when images are
+            kept on the server's own filesystem.
+
     Header Parameters:
 
         - Authorization: Bearer <access_token>
+        - Accept (optional)
+            Media types the client takes. The thumbnail is sent in the preferred one it is
+            stored in (WebP, JPEG or PNG), falling back to PNG.
+        - If-None-Match / If-Modified-Since (optional)
+            Validators from a cached copy. Answered with 304 if the thumbnail has not changed.
 
     Response:
 
-        - The thumbnail of the requested image in bytes.
+        - The thumbnail of the requested image in bytes, or a temporary redirect to it.
     """
+    redirecting = should_redirect(redirect)
     db = get_db_handler(db_client)
     try:
-        if not db.is_image_exists(image_uid):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+        image_info = await db.find_image(
+            image_uid,
+            keys=[
+                "content_hash",
+                "updated_at",
+                "thumbnail_types",
+                "storage_key",
+                "is_thumbnail_uploaded",
+            ],
+        )
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error connecting to database.",
         )
-
+    if image_info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    if not image_info["is_thumbnail_uploaded"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Thumbnail is not ready yet.",
+            headers={"Retry-After": str(IMAGE_QUEUE_RETRY_AFTER_SECONDS)},
+        )
+    # Only the encodings this image was stored in can be sent, in the server's preference.
+    stored_types = image_info.get("thumbnail_types") or ["image/png"]
+    available = [media_type for media_type in THUMBNAIL_MEDIA_TYPES if media_type in stored_types]
+    media_type = negotiate_media_type(accept, available or ["image/png"])
+    variant = "" if media_type == "image/png" else f"-{media_type.split('/')[1]}"
+    headers = cache_headers(
+        etag=make_etag(image_info["content_hash"], variant=f"-thumbnail{variant}"),
+        updated_at=image_info["updated_at"],
+        cache_control=THUMBNAIL_CACHE_CONTROL,
+    )
+    headers["Vary"] = "Accept"
+    if is_not_modified(headers, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     storage = get_storage_handler(storage_client)
+    storage_key = image_info["storage_key"]
+    # Local thumbnails are already a page-cache read away, so they skip the thumbnail cache.
+    thumbnail_path = storage.get_thumbnail_path(storage_key, media_type)
+    if thumbnail_path is not None:
+        return serve_file(thumbnail_path, media_type, headers)
+
+    # Cached bytes are only served once the image is known to be live, since a deletion clears
+    # the cache of the worker that handled it but not the memory tier of the others.
+    cache_key = (image_uid, media_type)
+    if not redirecting:
+        cached = await thumbnail_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached[0], media_type=media_type, headers=headers)
+
     try:
-        image_url = storage.get_thumbnail_url(image_uid)
-        r = requests.get(image_url)
+        image_url = await run_in_threadpool(storage.get_thumbnail_url, storage_key, media_type)
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error connecting to storage."
         )
 
-    return Response(r.content, media_type="image/png")
+    if redirecting:
+        return RedirectResponse(
+            image_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers={"Vary": "Accept"}
+        )
+    thumbnail = await fetch_url(http_client, image_url)
+    await thumbnail_cache.set(cache_key, thumbnail, {"media_type": media_type})
+    return Response(thumbnail, media_type=media_type, headers=headers)
 
 
 @router.get("/info/{image_uid}", status_code=status.HTTP_200_OK, response_model=ImageInfoResponse)
@@ -196,14 +710,212 @@ async def get_image_info(
     validate_token(access_token)
     db = get_db_handler(db_client)
     try:
-        if not db.is_image_exists(image_uid):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
-        image_info = db.get_image_info(
-            image_uid=image_uid, keys=["title", "file_name", "labels", "created_at", "updated_at"]
+        image_info = await db.find_image(image_uid=image_uid, keys=IMAGE_INFO_KEYS)
+    except APIError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to database.",
         )
+    if image_info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return ImageInfoResponse(**image_info)
+
+
+@router.post("/info/batch", status_code=status.HTTP_200_OK, response_model=ImageInfoBatchResponse)
+async def get_images_info(
+    request: Annotated[ImageInfoBatchRequest, Body(...)],
+    access_token: Annotated[str, Depends(get_access_token)],
+    db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+):
+    """
+    Retrieve the info of multiple images in one request. Access token is required.
+
+    Request body:
+
+        - image_uids (list[str])
+            UIDs of the images to look up. At most 100 per request.
+
+    Header Parameters:
+
+        - Authorization: Bearer <access_token>
+
+    Response:
+
+        - images (dict[str, ImageInfo])
+            Image UID mapped to its title, file name, labels and timestamps.
+        - missing (list[str])
+            Requested UIDs that cannot be found.
+    """
+    validate_token(access_token)
+    image_uids = list(dict.fromkeys(request.image_uids))
+    db = get_db_handler(db_client)
+    try:
+        images_info = await db.get_images_info(image_uids=image_uids, keys=IMAGE_INFO_KEYS)
+    except APIError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to database.",
+        )
+    return ImageInfoBatchResponse(
+        images={
+            image_uid: ImageInfoResponse(**images_info[image_uid])
+            for image_uid in image_uids
+            if image_uid in images_info
+        },
+        missing=[image_uid for image_uid in image_uids if image_uid not in images_info],
+    )
+
+
+async def find_own_image(
+    db: TableOperator, image_uid: str, user_uid: str, keys: Optional[list[str]] = None
+) -> dict:
+    """
+    Make sure a live image exists and belongs to the user. Images of other users are reported
+    as missing, so their UIDs cannot be probed.
+
+    Returns:
+        The requested keys of the image.
+    """
+    try:
+        image_info = await db.find_image(image_uid, keys=["user_uid", *(keys or [])])
+    except APIError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to database.",
+        )
+    if image_info is None or image_info["user_uid"] != user_uid:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return image_info
+
+
+@router.get(
+    "/status/{image_uid}", status_code=status.HTTP_200_OK, response_model=ImageStatusResponse
+)
+async def get_image_status(
+    image_uid: Annotated[str, Path(...)],
+    access_token: Annotated[str, Depends(get_access_token)],
+    db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+):
+    """
+    Retrieve how far the processing of an uploaded image has got. Access token is required — this endpoint is only accessible to the user it belongs to.
+
+    Header Parameters:
+
+        - Authorization: Bearer <access_token>
+
+    Response:
+
+        - is_uploaded (bool)
+            Whether the original image is stored.
+        - is_thumbnail_uploaded (bool)
+            Whether the thumbnails are stored.
+        - job (dict, optional)
+            The background job making the thumbnails, if this server process knows of it:
+            - state (str): queued, running, retrying, done, failed or dropped
+            - attempts (int): attempts made so far
+            - error (str): error of the last failed attempt
+    """
+    payload = validate_token(access_token)
+    db = get_db_handler(db_client)
+    image_info = await find_own_image(
+        db, image_uid, payload["sub"], keys=["is_uploaded", "is_thumbnail_uploaded"]
+    )
+    job = image_jobs.status(image_uid)
+    return ImageStatusResponse(
+        is_uploaded=image_info["is_uploaded"],
+        is_thumbnail_uploaded=image_info["is_thumbnail_uploaded"],
+        job=ImageJobStatus(**job) if job is not None else None,
+    )
+
+
+@router.patch("/info/{image_uid}", status_code=status.HTTP_200_OK, response_model=ImageInfoResponse)
+async def update_image_info(
+    image_uid: Annotated[str, Path(...)],
+    request: Annotated[ImageInfoUpdateRequest, Body(...)],
+    access_token: Annotated[str, Depends(get_access_token)],
+    db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+):
+    """
+    Update the title and/or labels of an image. Access token is required — this endpoint is only accessible to the user it belongs to.
+
+    Request body:
+
+        - title (str, optional)
+            New title of the image.
+        - labels (list[str], optional)
+            New labels of the image, replacing the current ones.
+
+    Header Parameters:
+
+        - Authorization: Bearer <access_token>
+
+    Response:
+
+        - The updated image info.
+    """
+    payload = validate_token(access_token)
+    db = get_db_handler(db_client)
+    await find_own_image(db, image_uid, payload["sub"])
+    try:
+        if request.title is not None:
+            await db.update_image_info(
+                image_uid=image_uid,
+                data={"title": request.title, "updated_at": datetime.now(UTC).isoformat()},
+            )
+        if request.labels is not None:
+            labels_cleaned = [label.strip() for label in request.labels if label.strip()]
+            if not await db.update_image_labels(image_uid, labels_cleaned):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+        image_info = await db.find_image(image_uid, keys=IMAGE_INFO_KEYS)
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error connecting to database.",
         )
+    if image_info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
     return ImageInfoResponse(**image_info)
+
+
+@router.delete("/{image_uid}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_image(
+    image_uid: Annotated[str, Path(...)],
+    access_token: Annotated[str, Depends(get_access_token)],
+    db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+    storage_client: Annotated[StorageClient, Depends(get_storage_client)],
+):
+    """
+    Delete an image along with its thumbnail. Access token is required — this endpoint is only accessible to the user it belongs to.
+
+    Images uploaded with the same content share their files, which are removed from storage
+    along with the last of them.
+
+    Header Parameters:
+
+        - Authorization: Bearer <access_token>
+
+    Response:
+
+        - No content.
+    """
+    payload = validate_token(access_token)
+    db = get_db_handler(db_client)
+    image_info = await find_own_image(db, image_uid, payload["sub"], keys=["storage_key"])
+    storage_key = image_info["storage_key"]
+    try:
+        deleted = await db.delete_image(image_uid)
+        references = await db.count_storage_references(storage_key) if deleted else None
+    except APIError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to database.",
+        )
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    await forget_cached_thumbnail(image_uid)
+    if references == 0:
+        storage = get_storage_handler(storage_client)
+        await run_in_threadpool(storage.delete_original, storage_key)
+        await run_in_threadpool(storage.delete_thumbnail, storage_key)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, status
+
+from app.dependencies.storage import signed_url_cache, thumbnail_cache
+from app.utils.auth import password_executor
+from app.utils.image import image_executor, image_jobs
+
+router = APIRouter()
+
+
+@router.get("", status_code=status.HTTP_200_OK)
+async def get_stats():
+    """
+    Retrieve runtime counters of this worker process. This endpoint is open to public.
+
+    Response:
+
+        - executors (dict)
+            Worker count, queue depth, and completed / failed / rejected job counts of each
+            executor.
+        - job_queues (dict)
+            Worker count, queued and retrying jobs, and completed / failed / retried counts of
+            each background job queue.
+        - caches (dict)
+            Size, hit / miss counts and hit ratio of each cache, per tier for tiered caches.
+    """
+    return {
+        "executors": {
+            image_executor.name: image_executor.stats(),
+            password_executor.name: password_executor.stats(),
+        },
+        "job_queues": {
+            image_jobs.name: image_jobs.stats(),
+        },
+        "caches": {
+            signed_url_cache.name: signed_url_cache.stats(),
+            thumbnail_cache.name: thumbnail_cache.stats(),
+        },
+    }
@@ -3,15 +3,18 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from postgrest.exceptions import APIError
 
-from app.dependencies.db import DatabaseClient, get_db_client, get_db_handler
+from app.dependencies.db import IMAGES_PER_PAGE, DatabaseClient, get_db_client, get_db_handler
 from app.models import User
 from app.schemas import (
     ImageQueryRequest,
     ImageQueryResponse,
+    LabelFacet,
+    LabelFacetsResponse,
     UserInfoQueryRequest,
     UserInfoResponse,
 )
 from app.utils.auth import get_access_token, validate_token
+from app.utils.pagination import decode_cursor, encode_cursor
 
 router = APIRouter()
 
@@ -41,7 +44,7 @@ async def get_user_info(
         - password (str): Hashed password.
         - avatar (str): Avatar URL.
         - image_count (int): Total images.
-        - labels (list[str]): Labels from uploaded images.
+        - labels (list[str]): Labels from uploaded images, most used first.
         - is_premium (bool): Whether the user has premium access.
 
     Header Parameters:
@@ -65,7 +68,12 @@ async def get_user_info(
             )
     db = get_db_handler(db_client)
     try:
-        user_data = db.get_user_info(user_uid=user_uid, keys=keys)
+        # Labels come from the label index rather than a column of the users row.
+        user_data = await db.get_user_info(
+            user_uid=user_uid, keys=[key for key in keys if key != "labels"]
+        )
+        if "labels" in keys:
+            user_data["labels"] = list(await db.get_label_counts(user_uid))
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -86,8 +94,11 @@ async def query_images(
 
     Query Parameters:
 
-        - page (int)
-            Page number for pagination. Each page returns up to 50 images.
+        - cursor (str, optional)
+            The next_cursor of the previous page. Omit it, along with page, for the first page.
+        - page (int, optional)
+            Page number for offset pagination, kept for compatibility. Ignored when a cursor is
+            given. Each page returns up to 30 images.
         - sort_by (str)
             Sort field. Options: "title", "created_at", "updated_at", "file_name".
         - sort_order (str)
@@ -103,21 +114,46 @@ async def query_images(
 
         - image_uid (list[str])
             A list of image UIDs matching the filters.
+        - next_cursor (str | None)
+            Cursor of the following page, if there may be one. Only returned when paginating by
+            cursor.
     """
     payload = validate_token(access_token)
     user_uid = payload.get("sub")
     if not user_uid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid access token")
     labels = [label.strip() for label in request.labels.split(",")] if request.labels else []
+    after = None
+    if request.cursor:
+        try:
+            after = decode_cursor(request.cursor, request.sort_by, request.sort_order)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
     db = get_db_handler(db_client)
+    next_cursor = None
     try:
-        image_uid = db.filter_images(
-            user_uid=user_uid,
-            page=request.page,
-            sort_by=request.sort_by,
-            sort_order=request.sort_order,
-            labels=labels,
-        )
+        labels = await db.plan_label_filter(user_uid, labels)
+        if labels is None:
+            image_uid = []
+        elif request.page is not None and after is None:
+            image_uid = await db.filter_images(
+                user_uid=user_uid,
+                page=request.page,
+                sort_by=request.sort_by,
+                sort_order=request.sort_order,
+                labels=labels,
+            )
+        else:
+            rows = await db.seek_images(
+                user_uid=user_uid,
+                sort_by=request.sort_by,
+                sort_order=request.sort_order,
+                labels=labels,
+                after=after,
+            )
+            image_uid = [row_uid for _, row_uid in rows]
+            if len(rows) == IMAGES_PER_PAGE:
+                next_cursor = encode_cursor(request.sort_by, request.sort_order, *rows[-1])
     except APIError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -126,4 +162,41 @@ async def query_images(
     if not image_uid:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No image can be found.")
 
-    return ImageQueryResponse(image_uid=image_uid)
+    return ImageQueryResponse(image_uid=image_uid, next_cursor=next_cursor)
+
+
+@router.get("/labels", status_code=status.HTTP_200_OK, response_model=LabelFacetsResponse)
+async def get_label_facets(
+    access_token: Annotated[str, Depends(get_access_token)],
+    db_client: Annotated[DatabaseClient, Depends(get_db_client)],
+):
+    """
+    Retrieve the labels of the user's images, with how many images carry each. Access token is required — this endpoint is only accessible to the user it belongs to.
+
+    Header Parameters:
+
+        - Authorization: Bearer <access_token>
+
+    Response:
+
+        - labels (list[dict])
+            Label facets, most used first. Each has:
+                - label (str)
+                - count (int): Number of images carrying the label.
+    """
+    payload = validate_token(access_token)
+    user_uid = payload.get("sub")
+    if not user_uid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid access token")
+    db = get_db_handler(db_client)
+    try:
+        counts = await db.get_label_counts(user_uid)
+    except APIError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error connecting to database.",
+        )
+
+    return LabelFacetsResponse(
+        labels=[LabelFacet(label=label, count=count) for label, count in counts.items()]
+    )
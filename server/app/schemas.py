@@ -1,6 +1,6 @@
 from typing import Literal, Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class SignupRequest(BaseModel):
@@ -72,7 +72,8 @@ class UserInfoResponse(BaseModel):
 
 
 class ImageQueryRequest(BaseModel):
-    page: int
+    page: Optional[int] = None
+    cursor: Optional[str] = None
     sort_by: Literal["title", "created_at", "updated_at", "file_name"]
     sort_order: Literal["desc", "asc"]
     labels: str
@@ -80,15 +81,61 @@ class ImageQueryRequest(BaseModel):
 
 class ImageQueryResponse(BaseModel):
     image_uid: list[str]
+    next_cursor: Optional[str] = None
+
+
+class LabelFacet(BaseModel):
+    label: str
+    count: int
+
+
+class LabelFacetsResponse(BaseModel):
+    labels: list[LabelFacet]
 
 
 class ImageUploadResponse(BaseModel):
     image_uid: str
 
 
+class BulkUploadResult(BaseModel):
+    file_name: Optional[str]
+    image_uid: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    results: list[BulkUploadResult]
+
+
 class ImageInfoResponse(BaseModel):
     title: str
     file_name: str
     labels: list[str]
     created_at: str
     updated_at: str
+
+
+class ImageJobStatus(BaseModel):
+    state: str
+    attempts: int
+    error: Optional[str] = None
+
+
+class ImageStatusResponse(BaseModel):
+    is_uploaded: bool
+    is_thumbnail_uploaded: bool
+    job: Optional[ImageJobStatus] = None
+
+
+class ImageInfoUpdateRequest(BaseModel):
+    title: Optional[str] = None
+    labels: Optional[list[str]] = None
+
+
+class ImageInfoBatchRequest(BaseModel):
+    image_uids: list[str] = Field(..., min_length=1, max_length=100)
+
+
+class ImageInfoBatchResponse(BaseModel):
+    images: dict[str, ImageInfoResponse]
+    missing: list[str]
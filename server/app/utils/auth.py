@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
 from typing import Annotated, Any
 
@@ -6,23 +7,50 @@ import jwt
 from fastapi import Header, HTTPException, status
 
 from app.config import (
+    BCRYPT_ROUNDS,
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES,
     JWT_ALGORITHM,
     JWT_REFRESH_TOKEN_EXPIRE_DAYS,
     JWT_SECRET,
+    PASSWORD_HASH_QUEUE_SIZE,
+    PASSWORD_HASH_WORKERS,
+)
+from app.utils.executor import BoundedExecutor
+
+# bcrypt lets go of the GIL while it hashes, so threads are enough to keep it off the event loop.
+password_executor = BoundedExecutor(
+    name="password",
+    executor_factory=ThreadPoolExecutor,
+    max_workers=PASSWORD_HASH_WORKERS,
+    queue_size=PASSWORD_HASH_QUEUE_SIZE,
 )
 
 
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+    """
+    Hash a password with bcrypt at a cost of BCRYPT_ROUNDS. CPU-bound; run it on
+    password_executor.
+    """
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt)
     return hashed_password.decode("utf-8")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Check a password against its bcrypt hash. As costly as hashing; run it on password_executor.
+    """
     return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
 
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Whether a bcrypt hash, formatted as $2b$<cost>$<salt and hash>, was made at another cost
+    than BCRYPT_ROUNDS.
+    """
+    return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+
+
 def create_access_token(user_uid: str) -> str:
     expires_delta = timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     now = datetime.now(UTC)
@@ -0,0 +1,297 @@
+"""
+In-process caches with LRU eviction and hit/miss counters.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.filesystem import write_atomic
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire after a per-entry time-to-live.
+
+    Expired entries are dropped when they are looked up; the least recently used entries are
+    evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
+
+
+class MemoryCache:
+    """
+    LRU cache of byte payloads bounded by their total size rather than their count.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[bytes, dict[str, Any]]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[tuple[bytes, dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, data: bytes, metadata: dict[str, Any]) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (data, metadata)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class DiskCache:
+    """
+    Cache of byte payloads stored as files in a directory, so that it survives restarts.
+
+    Each entry is a data file plus a JSON metadata file, both named after a hash of the key and
+    written atomically. Once the directory grows beyond `max_bytes`, the least recently used
+    entries are pruned.
+
+    The directory is shared by the workers of the server. Writers hold an exclusive lock on its
+    .lock file and keep the size of the whole directory in its .size file, so `max_bytes`
+    bounds the directory rather than what each worker wrote.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(directory, ".lock")
+        self._size_path = os.path.join(directory, ".size")
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            self._write_size(self._scan()[0])
+
+    def _path(self, key: Hashable) -> str:
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest())
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock excludes the other processes; the thread lock the other threads of this one.
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def get(self, key: Hashable) -> Optional[tuple[bytes, dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(f"{path}.json") as f:
+                metadata = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return data, metadata
+
+    def set(self, key: Hashable, data: bytes, metadata: dict[str, Any]) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        encoded_metadata = json.dumps(metadata).encode()
+        with self._locked():
+            size = self._read_size() - self._discard(path)
+            write_atomic(f"{path}.json", encoded_metadata)
+            write_atomic(path, data)
+            size += len(data) + len(encoded_metadata)
+            if size > self.max_bytes:
+                size = self._prune()
+            self._write_size(size)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._locked():
+            removed = self._discard(self._path(key))
+            if removed:
+                self._write_size(self._read_size() - removed)
+
+    def _discard(self, path: str) -> int:
+        removed = 0
+        for file in (path, f"{path}.json"):
+            try:
+                size = os.path.getsize(file)
+                os.remove(file)
+            except OSError:
+                continue
+            removed += size
+        return removed
+
+    def _scan(self) -> tuple[int, list[os.DirEntry]]:
+        """
+        Measure the entries actually in the directory, which also corrects a size file left
+        off by a worker that died mid-write.
+
+        Returns:
+            The total size of the entries, and their data files.
+        """
+        files = [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+        size = sum(entry.stat().st_size for entry in files)
+        return size, [entry for entry in files if "." not in entry.name]
+
+    def _prune(self) -> int:
+        size, data_files = self._scan()
+        data_files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in data_files:
+            if size <= self.max_bytes * 0.9:
+                break
+            size -= self._discard(entry.path)
+        return size
+
+    def _read_size(self) -> int:
+        try:
+            with open(self._size_path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return self._scan()[0]
+
+    def _write_size(self, size: int) -> None:
+        write_atomic(self._size_path, str(max(size, 0)).encode())
+
+    def stats(self) -> dict[str, int]:
+        with self._locked():
+            return {"bytes": self._read_size(), "max_bytes": self.max_bytes}
+
+
+class TieredCache:
+    """
+    Memory cache in front of an optional disk cache. Disk hits are promoted to memory.
+
+    Its methods are async: the memory tier is used in place, while the file operations of the
+    disk tier run in the threadpool so they do not block the event loop.
+    """
+
+    def __init__(self, name: str, memory: MemoryCache, disk: Optional[DiskCache] = None) -> None:
+        self.name = name
+        self.memory = memory
+        self.disk = disk
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        # Guards the hit counters; each tier has its own lock.
+        self._lock = threading.Lock()
+
+    async def get(self, key: Hashable) -> Optional[tuple[bytes, dict[str, Any]]]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            with self._lock:
+                self._memory_hits += 1
+            return entry
+        if self.disk is not None:
+            entry = await run_in_threadpool(self.disk.get, key)
+            if entry is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                self.memory.set(key, *entry)
+                return entry
+        with self._lock:
+            self._misses += 1
+        return None
+
+    async def set(self, key: Hashable, data: bytes, metadata: dict[str, Any]) -> None:
+        self.memory.set(key, data, metadata)
+        if self.disk is not None:
+            await run_in_threadpool(self.disk.set, key, data, metadata)
+
+    async def invalidate(self, key: Hashable) -> None:
+        self.memory.invalidate(key)
+        if self.disk is not None:
+            await run_in_threadpool(self.disk.invalidate, key)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            memory_hits, disk_hits, misses = self._memory_hits, self._disk_hits, self._misses
+        lookups = memory_hits + disk_hits + misses
+        return {
+            "memory": {
+                **self.memory.stats(),
+                "hits": memory_hits,
+                "hit_ratio": memory_hits / lookups if lookups else 0.0,
+            },
+            "disk": {
+                **(self.disk.stats() if self.disk is not None else {}),
+                "hits": disk_hits,
+                "hit_ratio": disk_hits / lookups if lookups else 0.0,
+            },
+            "misses": misses,
+        }
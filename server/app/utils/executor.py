@@ -0,0 +1,123 @@
+"""
+Bounded executors that keep CPU-heavy work off the event loop.
+"""
+
+import asyncio
+import threading
+from collections.abc import Callable
+from concurrent.futures import BrokenExecutor, Executor, Future
+from functools import partial
+from typing import Any, Optional
+
+
+class ExecutorSaturated(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """
+    Wrap a concurrent.futures executor with a cap on the number of jobs in flight.
+
+    Up to `max_workers` jobs run at once and up to `queue_size` more wait for a free worker.
+    Submitting beyond that raises ExecutorSaturated instead of queueing without bound, so the
+    caller can shed load early. A job holds its slot until it is done, even if the caller stops
+    waiting for it. A process pool broken by a dying worker fails its pending jobs and is
+    replaced by a fresh one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        executor_factory: Callable[..., Executor],
+        max_workers: int,
+        queue_size: int,
+    ) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Jobs are released from the executor's threads, as they finish.
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = self._executor_factory(max_workers=self.max_workers)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` in the executor and wait for its result.
+
+        Raises:
+            ExecutorSaturated: If every worker is busy and the queue is full.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.queue_size:
+                self._rejected += 1
+                raise ExecutorSaturated(f"{self.name} executor is saturated")
+            self._in_flight += 1
+        try:
+            executor, future = self._submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+                self._failed += 1
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenExecutor:
+            self._replace(executor)
+            raise
+
+    def _submit(self, job: Callable[[], Any]) -> tuple[Executor, Future]:
+        # Start lazily so the executor also works outside of the app lifespan, e.g. in scripts.
+        self.start()
+        executor = self._executor
+        try:
+            return executor, executor.submit(job)
+        except BrokenExecutor:
+            # Broken by an earlier job that has not been awaited yet.
+            self._replace(executor)
+            self.start()
+            return self._executor, self._executor.submit(job)
+
+    def _replace(self, executor: Executor) -> None:
+        """
+        Drop a broken executor, once, so the next job starts a fresh one.
+        """
+        if self._executor is not executor:
+            return
+        self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled():
+                return
+            if future.exception() is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_size": self.queue_size,
+                "running": min(self._in_flight, self.max_workers),
+                "queued": max(self._in_flight - self.max_workers, 0),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
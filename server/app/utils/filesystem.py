@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from app.config import FILESYSTEM_STORAGE_DIR
+
+_filesystem_root: Optional[Path] = None
+
+
+def start_filesystem_root() -> Path:
+    """
+    Resolve and create the storage root of this worker once.
+    """
+    global _filesystem_root
+    if _filesystem_root is None:
+        _filesystem_root = Path(FILESYSTEM_STORAGE_DIR).resolve()
+        _filesystem_root.mkdir(parents=True, exist_ok=True)
+    return _filesystem_root
+
+
+def close_filesystem_root() -> None:
+    global _filesystem_root
+    _filesystem_root = None
+
+
+def filesystem_root() -> Path:
+    """
+    Dependency to get the storage root, which is normally resolved in the app lifespan.
+    """
+    return start_filesystem_root()
+
+
+def write_atomic(path: str, data: Union[bytes, BinaryIO], fsync: bool = False) -> None:
+    """
+    Write to a temporary file next to the target and rename it into place, so readers see either
+    the old file or the complete new one. A file object is copied in chunks. Pass fsync=True
+    when the write must survive a crash.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,255 @@
+"""
+The HTTP client shared by every request of a worker, used to proxy objects from storage,
+and helpers for HTTP caching semantics.
+"""
+
+from collections.abc import Mapping
+from datetime import UTC, datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.config import (
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_READ_TIMEOUT_SECONDS,
+    HTTP_STREAM_CHUNK_SIZE,
+)
+
+PROXIED_HEADERS = ("content-length", "content-encoding", "content-range")
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def start_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Dependency to get the pooled HTTP client, which is normally started in the app lifespan.
+    """
+    return start_http_client()
+
+
+async def fetch_url(client: httpx.AsyncClient, url: str) -> bytes:
+    """
+    Download the whole body at `url`. Only meant for small objects such as thumbnails.
+    """
+    try:
+        response = await client.get(url)
+    except httpx.HTTPError:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY, detail="Error connecting to storage."
+        )
+    if response.status_code != status.HTTP_200_OK:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY, detail="Error connecting to storage."
+        )
+    return response.content
+
+
+async def stream_url(
+    client: httpx.AsyncClient,
+    url: str,
+    media_type: str,
+    headers: Optional[Mapping[str, str]] = None,
+    byte_range: Optional[tuple[int, int]] = None,
+) -> StreamingResponse:
+    """
+    Proxy the body at `url` chunk by chunk, without buffering it in memory. The upstream
+    connection is returned to the pool once the response has been sent.
+
+    If `byte_range` is given, only those bytes are requested from upstream and the response is
+    206 Partial Content, unless upstream ignores the range and sends the whole body.
+    """
+    request_headers = {}
+    if byte_range is not None:
+        # Ranges refer to the stored bytes, so they must not be compressed in transit.
+        request_headers = {
+            "Range": f"bytes={byte_range[0]}-{byte_range[1]}",
+            "Accept-Encoding": "identity",
+        }
+    try:
+        upstream = await client.send(
+            client.build_request("GET", url, headers=request_headers), stream=True
+        )
+    except httpx.HTTPError:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY, detail="Error connecting to storage."
+        )
+    if upstream.status_code not in (status.HTTP_200_OK, status.HTTP_206_PARTIAL_CONTENT):
+        await upstream.aclose()
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY, detail="Error connecting to storage."
+        )
+
+    response_headers = {
+        key: upstream.headers[key] for key in PROXIED_HEADERS if key in upstream.headers
+    }
+    response_headers.update(headers or {})
+    return StreamingResponse(
+        upstream.aiter_raw(HTTP_STREAM_CHUNK_SIZE),
+        status_code=upstream.status_code,
+        media_type=media_type,
+        headers=response_headers,
+        background=BackgroundTask(upstream.aclose),
+    )
+
+
+def make_etag(content_hash: Optional[str], variant: str = "") -> Optional[str]:
+    """
+    Build a strong ETag from the stored content hash, or None if the hash is unknown.
+    """
+    if not content_hash:
+        return None
+    return f'"{content_hash}{variant}"'
+
+
+def cache_headers(
+    etag: Optional[str], updated_at: Optional[str], cache_control: str
+) -> dict[str, str]:
+    headers = {"Cache-Control": cache_control}
+    if etag:
+        headers["ETag"] = etag
+    if updated_at:
+        last_modified = datetime.fromisoformat(updated_at).astimezone(UTC)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(
+    headers: Mapping[str, str], if_none_match: Optional[str], if_modified_since: Optional[str]
+) -> bool:
+    """
+    Evaluate the request preconditions against the validators in the response `headers`.
+    If-None-Match takes precedence over If-Modified-Since, as required by RFC 9110.
+    """
+    if if_none_match is not None:
+        etag = headers.get("ETag")
+        if etag is None:
+            return False
+        candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+        # If-None-Match uses the weak comparison function.
+        return "*" in candidates or etag in (
+            candidate.removeprefix("W/") for candidate in candidates
+        )
+    if if_modified_since is not None and "Last-Modified" in headers:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a Range header into the inclusive (first, last) byte positions of a single range.
+
+    Returns None when the whole representation should be sent instead: no Range header, a unit
+    other than bytes, a malformed value, or multiple ranges, which we choose not to support.
+    As RFC 9110 allows, such headers are ignored rather than rejected.
+
+    Raises:
+        HTTPException: 416 if the range does not overlap the representation.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header.removeprefix("bytes=").strip()
+    if "," in spec or "-" not in spec:
+        return None
+    first, _, last = (part.strip() for part in spec.partition("-"))
+    try:
+        if not first:
+            # Suffix range: the last N bytes.
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else max(start, size - 1)
+            if end < start:
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def if_range_matches(headers: Mapping[str, str], if_range: Optional[str]) -> bool:
+    """
+    Whether a Range request may be served given its If-Range precondition. If-Range holds
+    either an ETag, compared strongly, or an HTTP date that must equal Last-Modified.
+    """
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        return not if_range.startswith("W/") and if_range == headers.get("ETag")
+    return if_range == headers.get("Last-Modified")
+
+
+def negotiate_media_type(accept: Optional[str], available: list[str]) -> str:
+    """
+    Pick the media type to send out of `available`, which is in the server's order of
+    preference, according to the Accept header.
+
+    The highest quality value wins. Among equal ones a type the client names explicitly beats
+    one matched by a wildcard, and then the server's preference decides. If the client accepts
+    none of them, the last available type is sent anyway, as the fallback RFC 9110 allows.
+    """
+    if not accept:
+        return available[0]
+    ranges: dict[str, float] = {}
+    for part in accept.split(","):
+        media_range, *params = (item.strip() for item in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges[media_range.lower()] = quality
+
+    def rank(media_type: str) -> tuple[float, int]:
+        # (quality, specificity) of the most specific range that matches the type.
+        type_range = f"{media_type.split('/')[0]}/*"
+        if media_type in ranges:
+            return ranges[media_type], 2
+        if type_range in ranges:
+            return ranges[type_range], 1
+        return ranges.get("*/*", 0.0), 0
+
+    best = max(available, key=lambda media_type: (rank(media_type), -available.index(media_type)))
+    return best if rank(best)[0] > 0 else available[-1]
@@ -1,34 +1,106 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from io import BytesIO
+from typing import BinaryIO, Optional, Union
 
 from PIL import Image, ImageFile, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
 
+from app.config import (
+    IMAGE_JOB_HISTORY_SIZE,
+    IMAGE_JOB_MAX_ATTEMPTS,
+    IMAGE_JOB_RETRY_BASE_SECONDS,
+    IMAGE_JOB_SHUTDOWN_TIMEOUT_SECONDS,
+    IMAGE_JOB_WORKERS,
+    IMAGE_QUEUE_SIZE,
+    IMAGE_WORKERS,
+    JPEGTRAN_PATH,
+    THUMBNAIL_ENCODE_QUALITY,
+    THUMBNAIL_FORMATS,
+    THUMBNAIL_QUALITY,
+    TRANSCODE_POLICY,
+    UPLOAD_TMP_DIR,
+)
 from app.dependencies.db import DatabaseClient, get_db_handler
 from app.dependencies.storage import StorageClient, get_storage_handler
+from app.utils.executor import BoundedExecutor
+from app.utils.jobs import JobQueue
 
 SUPPORTED_FORMATS = {"PNG", "JPEG"}
+TRANSCODE_POLICIES = {"always", "deferred", "never"}
+if TRANSCODE_POLICY not in TRANSCODE_POLICIES:
+    raise ValueError(f"Unknown transcode policy: {TRANSCODE_POLICY}")
+JPEGTRAN = shutil.which(JPEGTRAN_PATH)
 THUMBNAIL_SIZE = (400, 225)
+# Quality tier -> (reducing_gap, resample filter). The source is first shrunk cheaply, by JPEG
+# DCT scaling while decoding and then by Image.reduce, to no less than reducing_gap times the
+# thumbnail size, and only that is resampled with the filter. The larger the gap, the closer
+# the result is to resampling the full image; past 3 the difference is not visible.
+THUMBNAIL_TIERS = {
+    "fast": (1.0, Image.Resampling.BILINEAR),
+    "balanced": (2.0, Image.Resampling.LANCZOS),
+    "max": (3.0, Image.Resampling.LANCZOS),
+}
+if THUMBNAIL_QUALITY not in THUMBNAIL_TIERS:
+    raise ValueError(f"Unknown thumbnail quality: {THUMBNAIL_QUALITY}")
+# Media type -> (Pillow format, save options) of each encoding a thumbnail can be stored in.
+THUMBNAIL_ENCODINGS = {
+    "image/png": ("PNG", {}),
+    "image/webp": ("WEBP", {"quality": THUMBNAIL_ENCODE_QUALITY, "method": 4}),
+    "image/jpeg": ("JPEG", {"quality": THUMBNAIL_ENCODE_QUALITY, "optimize": True}),
+}
+unknown_formats = set(THUMBNAIL_FORMATS) - THUMBNAIL_ENCODINGS.keys()
+if unknown_formats:
+    raise ValueError(f"Unknown thumbnail formats: {', '.join(sorted(unknown_formats))}")
+# Every thumbnail is stored as PNG, which also serves clients that accept none of the others.
+THUMBNAIL_MEDIA_TYPES = list(dict.fromkeys([*THUMBNAIL_FORMATS, "image/png"]))
+
+# Pillow work holds the GIL, so it runs in worker processes rather than threads.
+image_executor = BoundedExecutor(
+    name="image",
+    executor_factory=ProcessPoolExecutor,
+    max_workers=IMAGE_WORKERS,
+    queue_size=IMAGE_QUEUE_SIZE,
+)
+# Uploads are answered once the original is stored; thumbnails are made by these jobs.
+image_jobs = JobQueue(
+    name="image",
+    workers=IMAGE_JOB_WORKERS,
+    max_attempts=IMAGE_JOB_MAX_ATTEMPTS,
+    retry_base_seconds=IMAGE_JOB_RETRY_BASE_SECONDS,
+    history_size=IMAGE_JOB_HISTORY_SIZE,
+    shutdown_timeout_seconds=IMAGE_JOB_SHUTDOWN_TIMEOUT_SECONDS,
+)
 
 
 class UnsupportedFormat(Exception):
     pass
 
 
-def generate_thumbnail(image_bytes: bytes) -> bytes:
+def generate_thumbnail(image_path: str, quality: str = THUMBNAIL_QUALITY) -> dict[str, bytes]:
     """
-    Crop image to center 16:9 aspect ratio and resize if larger than THUMBNAIL_SIZE.
-    Supports PNG, JPEG.
+    Crop image to center 16:9 aspect ratio and resize if larger than THUMBNAIL_SIZE, then encode
+    it in each of THUMBNAIL_MEDIA_TYPES. Supports PNG, JPEG. Large JPEGs are decoded at a
+    reduced scale, see THUMBNAIL_TIERS.
 
     Returns:
-        - thumbnail_bytes: the thumbnail as raw bytes
+        - thumbnails: the thumbnail as raw bytes, by media type
     """
     try:
-        image = Image.open(BytesIO(image_bytes))
+        image = Image.open(image_path)
     except UnidentifiedImageError:
         raise UnsupportedFormat("Cannot identify image format.")
 
     if image.format.upper() not in SUPPORTED_FORMATS:
         raise UnsupportedFormat(f"Unsupported format: {image.format}")
 
+    reducing_gap, resample = THUMBNAIL_TIERS[quality]
     width, height = image.size
     target_aspect_ratio = THUMBNAIL_SIZE[0] / THUMBNAIL_SIZE[1]
 
@@ -46,15 +118,38 @@ def generate_thumbnail(image_bytes: bytes) -> bytes:
         right = width
         bottom = top + new_height
 
-    cropped = image.crop((left, top, right, bottom))
-
     # Resize only if the image is larger than THUMBNAIL_SIZE
-    if cropped.size[0] > THUMBNAIL_SIZE[0] or cropped.size[1] > THUMBNAIL_SIZE[1]:
-        cropped = cropped.resize(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    crop_width, crop_height = right - left, bottom - top
+    if crop_width <= THUMBNAIL_SIZE[0] and crop_height <= THUMBNAIL_SIZE[1]:
+        thumbnail = image.crop((left, top, right, bottom))
+    else:
+        # Let the JPEG decoder downscale by up to 8x, as long as the cropped area stays at least
+        # reducing_gap times the thumbnail size. A no-op for PNG.
+        scale = min(
+            crop_width / (THUMBNAIL_SIZE[0] * reducing_gap),
+            crop_height / (THUMBNAIL_SIZE[1] * reducing_gap),
+        )
+        if scale > 1:
+            image.draft(image.mode, (int(width / scale), int(height / scale)))
+        # Crop in the coordinates of the reduced image, as part of the resize.
+        x_scale, y_scale = image.size[0] / width, image.size[1] / height
+        box = (left * x_scale, top * y_scale, right * x_scale, bottom * y_scale)
+        thumbnail = image.resize(THUMBNAIL_SIZE, resample, box=box, reducing_gap=reducing_gap)
+
+    return {
+        media_type: encode_thumbnail(thumbnail, media_type) for media_type in THUMBNAIL_MEDIA_TYPES
+    }
 
-    buffer = BytesIO()
-    cropped.save(buffer, format="PNG")
 
+def encode_thumbnail(thumbnail: Image.Image, media_type: str) -> bytes:
+    image_format, options = THUMBNAIL_ENCODINGS[media_type]
+    if image_format == "JPEG" and thumbnail.mode not in ("RGB", "L"):
+        # JPEG has no alpha channel; transparent areas come out as they are stored.
+        thumbnail = thumbnail.convert("RGB")
+    elif image_format == "WEBP" and thumbnail.mode not in ("RGB", "RGBA"):
+        thumbnail = thumbnail.convert("RGBA" if thumbnail.has_transparency_data else "RGB")
+    buffer = BytesIO()
+    thumbnail.save(buffer, format=image_format, **options)
     return buffer.getvalue()
 
 
@@ -67,43 +162,262 @@ def is_streaming_optimized(image: ImageFile, content_type: str) -> bool:
         raise ValueError(f"Unsupported content type: {content_type}")
 
 
-def enable_image_streaming(image_bytes: bytes, content_type: str) -> bytes:
+def check_image(image_path: str) -> None:
+    """
+    Make sure a file is an image in one of SUPPORTED_FORMATS. Only the header is read.
     """
-    Convert image bytes into a progressive JPEG or interlaced PNG,
-    preserving transparency and format when appropriate.
+    try:
+        image = Image.open(image_path)
+    except UnidentifiedImageError:
+        raise UnsupportedFormat("Cannot identify image format.")
+    with image:
+        if image.format.upper() not in SUPPORTED_FORMATS:
+            raise UnsupportedFormat(f"Unsupported format: {image.format}")
+
+
+def needs_streaming_conversion(image_path: str, content_type: str) -> bool:
+    """
+    Whether an image still has to be converted for streaming. Only the header is read.
+
+    PNGs are always left as they are: Pillow cannot write interlaced PNGs, so re-saving one
+    would cost a full decode and encode for an identical file.
+    """
+    if content_type == "image/png":
+        return False
+    try:
+        image = Image.open(image_path)
+    except UnidentifiedImageError:
+        raise UnsupportedFormat("Cannot identify image format.")
+    with image:
+        return not is_streaming_optimized(image, content_type)
+
+
+def convert_to_progressive_jpeg(image_path: str, output_path: str) -> None:
+    """
+    Rewrite a baseline JPEG as a progressive one. jpegtran only reorders the stored DCT
+    coefficients, so the image is neither decoded nor quantized again. Without it, Pillow
+    re-encodes with the source's own quantization tables and subsampling, so the only loss is
+    rounding.
+    """
+    if JPEGTRAN is not None:
+        command = [JPEGTRAN, "-copy", "all", "-progressive", "-outfile", output_path, image_path]
+        if subprocess.run(command, capture_output=True).returncode == 0:
+            return
+    with Image.open(image_path) as image:
+        image.save(
+            output_path,
+            format="JPEG",
+            progressive=True,
+            quality="keep",
+            subsampling="keep",
+            exif=image.info.get("exif", b""),
+            icc_profile=image.info.get("icc_profile"),
+        )
+
+
+def enable_image_streaming(image_path: str, content_type: str) -> str:
+    """
+    Convert a baseline JPEG into a progressive one, losslessly when jpegtran is available. See
+    needs_streaming_conversion for which images are converted.
 
     Returns:
-        Converted image bytes.
+        Path of the converted image, written next to the source. The source path itself if it
+        needs no conversion.
     """
-    image = Image.open(BytesIO(image_bytes))
-    if is_streaming_optimized(image, content_type):
-        return image_bytes
+    if not needs_streaming_conversion(image_path, content_type):
+        return image_path
 
-    buffer = BytesIO()
-    if content_type == "image/jpeg":
-        image.save(buffer, format="JPEG", progressive=True)
-    elif content_type == "image/png":
-        image.save(buffer, format="PNG", interlace=True)
-    else:
-        raise ValueError(f"Unsupported content type: {content_type}")
+    output_path = f"{image_path}.stream"
+    convert_to_progressive_jpeg(image_path, output_path)
+    return output_path
 
-    return buffer.getvalue()
+
+def hash_file(path: str) -> str:
+    """
+    sha256 hex digest of a file, read in chunks.
+    """
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def process_original(
+    image_path: str,
+    content_type: str,
+    transcode: bool = True,
+    content_hash: Optional[str] = None,
+) -> tuple[str, str, int]:
+    """
+    Make sure the original is a supported image, convert it for streaming unless transcode is
+    False, and describe the result. Without transcoding, only the header is decoded. The image
+    is hashed only if content_hash, the hash of the original, is not given or no longer applies.
+
+    Returns:
+        - image_path: the image to be stored
+        - content_hash: sha256 hex digest of the image
+        - size: size of the image in bytes
+    """
+    check_image(image_path)
+    output_path = enable_image_streaming(image_path, content_type) if transcode else image_path
+    if content_hash is None or output_path != image_path:
+        content_hash = hash_file(output_path)
+    return output_path, content_hash, os.path.getsize(output_path)
+
+
+def process_upload(
+    image_path: str, content_type: str, transcode: bool = True
+) -> tuple[str, dict[str, bytes], str, int]:
+    """
+    Run every CPU-bound step of an upload in one go, so it can be submitted to the
+    image executor as a single job. Images are passed around as files, so only the decoded
+    image is held in memory, in the worker process.
+
+    Returns:
+        - image_path: the image converted for streaming, unless transcode is False
+        - thumbnails: the thumbnail as raw bytes, by media type
+        - content_hash: sha256 hex digest of the converted image
+        - size: size of the converted image in bytes
+    """
+    image_path, content_hash, size = process_original(image_path, content_type, transcode)
+    return image_path, generate_thumbnail(image_path), content_hash, size
+
+
+async def process_image(
+    image_uid: str,
+    storage_key: str,
+    image_path: str,
+    content_type: str,
+    transcode: bool,
+    db_client: DatabaseClient,
+    storage_client: StorageClient,
+    shared_uids: Sequence[str] = (),
+) -> None:
+    """
+    Background job that finishes an upload once its original is stored under storage_key:
+    convert the original for streaming and replace it in storage if transcode is True, then
+    generate the thumbnails and store them. shared_uids are other images uploaded with the same
+    content, which share the stored files and are finished along with it. Raises to be retried;
+    running it again after a failure is safe.
+    """
+    db = get_db_handler(db_client)
+    images_info = await db.get_images_info([image_uid, *shared_uids], ["is_thumbnail_uploaded"])
+    if all(image_info["is_thumbnail_uploaded"] for image_info in images_info.values()):
+        # Deleted in the meantime, or already done by an earlier attempt.
+        return
+
+    output_path, thumbnails, content_hash, size = await image_executor.submit(
+        process_upload, image_path, content_type, transcode
+    )
+    if output_path != image_path:
+        try:
+            with open(output_path, "rb") as image:
+                await upload_original(
+                    image,
+                    image_uid,
+                    storage_key,
+                    db_client,
+                    storage_client,
+                    content_type,
+                )
+        finally:
+            os.remove(output_path)
+        for uid in (image_uid, *shared_uids):
+            await db.update_image_info(uid, {"content_hash": content_hash, "size": size})
+    await upload_thumbnails(thumbnails, image_uid, storage_key, db_client, storage_client)
+    for uid in shared_uids:
+        await db.update_image_info(
+            uid,
+            {"thumbnail_types": list(thumbnails), "is_thumbnail_uploaded": True},
+        )
+
+
+async def reprocess_image(
+    image_uid: str,
+    storage_key: str,
+    content_type: str,
+    db_client: DatabaseClient,
+    storage_client: StorageClient,
+) -> None:
+    """
+    Background job that finishes an upload whose own job was lost: fetch the stored original
+    into a temporary file and run process_image on it.
+    """
+    fd, image_path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, prefix="reprocess-")
+    os.close(fd)
+    try:
+        storage = get_storage_handler(storage_client)
+        await run_in_threadpool(storage.download_original, storage_key, image_path)
+        await process_image(
+            image_uid,
+            storage_key,
+            image_path,
+            content_type,
+            TRANSCODE_POLICY == "deferred",
+            db_client,
+            storage_client,
+        )
+    finally:
+        os.remove(image_path)
+
+
+async def requeue_image_jobs(db_client: DatabaseClient, storage_client: StorageClient) -> int:
+    """
+    Queue a job for every stored image still without thumbnails. Jobs live in the process that
+    took the upload, so those pending at shutdown, or lost in a crash, are picked up here by the
+    app.requeue task.
+
+    Returns:
+        The number of jobs queued.
+    """
+    db = get_db_handler(db_client)
+    images = await db.find_unprocessed_images(["image_uid", "storage_key", "content_type"])
+    for image in images:
+        image_jobs.submit(
+            image["image_uid"],
+            partial(
+                reprocess_image,
+                image["image_uid"],
+                image["storage_key"],
+                image["content_type"],
+                db_client,
+                storage_client,
+            ),
+        )
+    return len(images)
 
 
-def upload_original(
-    file: bytes, image_uid: str, db_client: DatabaseClient, storage_client: StorageClient
+async def upload_original(
+    file: Union[bytes, BinaryIO],
+    image_uid: str,
+    storage_key: str,
+    db_client: DatabaseClient,
+    storage_client: StorageClient,
+    content_type: Optional[str] = None,
 ) -> None:
     db = get_db_handler(db_client)
-    content_type = db.get_image_info(image_uid=image_uid, keys=["content_type"]).get("content_type")
+    if content_type is None:
+        image_info = await db.get_image_info(image_uid=image_uid, keys=["content_type"])
+        content_type = image_info.get("content_type")
     storage = get_storage_handler(storage_client)
-    storage.upload_original(image_uid=image_uid, file=file, content_type=content_type)
-    db.update_image_info(image_uid=image_uid, data={"is_uploaded": True})
+    await run_in_threadpool(
+        storage.upload_original, storage_key=storage_key, file=file, content_type=content_type
+    )
+    await db.update_image_info(image_uid=image_uid, data={"is_uploaded": True})
 
 
-def upload_thumbnail(
-    file: bytes, image_uid: str, db_client: DatabaseClient, storage_client: StorageClient
+async def upload_thumbnails(
+    thumbnails: dict[str, bytes],
+    image_uid: str,
+    storage_key: str,
+    db_client: DatabaseClient,
+    storage_client: StorageClient,
 ) -> None:
     storage = get_storage_handler(storage_client)
-    storage.upload_thumbnail(image_uid=image_uid, file=file)
+    for media_type, thumbnail in thumbnails.items():
+        await run_in_threadpool(
+            storage.upload_thumbnail, storage_key=storage_key, file=thumbnail, media_type=media_type
+        )
     db = get_db_handler(db_client)
-    db.update_image_info(image_uid=image_uid, data={"is_thumbnail_uploaded": True})
+    await db.update_image_info(
+        image_uid=image_uid,
+        data={"thumbnail_types": list(thumbnails), "is_thumbnail_uploaded": True},
+    )
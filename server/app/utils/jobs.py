@@ -0,0 +1,172 @@
+"""
+In-process queue of background jobs, retried with exponential backoff.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+type Job = Callable[[], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    Run async jobs on `workers` tasks of the event loop, in the order they were submitted.
+
+    A job that raises is tried again after `retry_base_seconds`, doubling the delay each time,
+    until it has been attempted `max_attempts` times. A job waiting to be retried does not hold
+    up a worker. The state of the last `history_size` jobs is kept by key for status lookups.
+
+    Jobs live in this process only. Shutting down waits up to `shutdown_timeout_seconds` for
+    the queued jobs to run; those left over, and those waiting to be retried, are dropped after
+    their `finalize` is called.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        history_size: int,
+        shutdown_timeout_seconds: float,
+    ) -> None:
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.history_size = history_size
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._retries: dict[asyncio.TimerHandle, tuple] = {}
+        self._statuses: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._completed = 0
+        self._failed = 0
+        self._retried = 0
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [
+                asyncio.create_task(self._work(), name=f"{self.name}-job-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    async def shutdown(self) -> None:
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.shutdown_timeout_seconds)
+        except TimeoutError:
+            logger.warning("%s job queue shut down with jobs still pending", self.name)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        dropped = list(self._retries.values())
+        for handle in self._retries:
+            handle.cancel()
+        while not self._queue.empty():
+            dropped.append(self._queue.get_nowait())
+        for key, _, finalize, _ in dropped:
+            self._set_status(key, state="dropped")
+            if finalize is not None:
+                finalize()
+        self._queue = None
+        self._tasks = []
+        self._retries = {}
+        self._unfinished = 0
+        self._finished.set()
+
+    def submit(self, key: str, job: Job, finalize: Optional[Callable[[], None]] = None) -> None:
+        """
+        Queue `job` under `key`. `finalize` is called once the job has succeeded or has failed
+        for the last time, e.g. to remove files the job works on.
+        """
+        # Start lazily so the queue also works outside of the app lifespan, e.g. in scripts.
+        self.start()
+        self._set_status(key, state="queued", attempts=0, error=None)
+        self._unfinished += 1
+        self._finished.clear()
+        self._queue.put_nowait((key, job, finalize, 1))
+
+    async def join(self) -> None:
+        """
+        Wait until every job submitted so far has succeeded or failed for the last time,
+        including those waiting to be retried.
+        """
+        await self._finished.wait()
+
+    def status(self, key: str) -> Optional[dict[str, Any]]:
+        """
+        State of the last job queued under `key`: queued, running, retrying, done, failed or
+        dropped, with the number of attempts so far and the last error. None if it is not known
+        in this process.
+        """
+        status = self._statuses.get(key)
+        return dict(status) if status is not None else None
+
+    def _set_status(self, key: str, **status: Any) -> None:
+        self._statuses[key] = {**self._statuses.get(key, {}), **status, "updated_at": time.time()}
+        self._statuses.move_to_end(key)
+        while len(self._statuses) > self.history_size:
+            self._statuses.popitem(last=False)
+
+    async def _work(self) -> None:
+        while True:
+            key, job, finalize, attempt = await self._queue.get()
+            try:
+                await self._run(key, job, finalize, attempt)
+            finally:
+                self._queue.task_done()
+
+    async def _run(
+        self, key: str, job: Job, finalize: Optional[Callable[[], None]], attempt: int
+    ) -> None:
+        self._set_status(key, state="running", attempts=attempt)
+        try:
+            await job()
+        except Exception as e:
+            if attempt < self.max_attempts:
+                self._retried += 1
+                self._set_status(key, state="retrying", error=str(e))
+                delay = self.retry_base_seconds * 2 ** (attempt - 1)
+                self._schedule_retry(delay, (key, job, finalize, attempt + 1))
+                return
+            self._failed += 1
+            self._set_status(key, state="failed", error=str(e))
+            logger.exception("%s job %s failed after %d attempts", self.name, key, attempt)
+        else:
+            self._completed += 1
+            self._set_status(key, state="done", error=None)
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._finished.set()
+        if finalize is not None:
+            finalize()
+
+    def _schedule_retry(self, delay: float, entry: tuple) -> None:
+        def requeue() -> None:
+            del self._retries[handle]
+            self._queue.put_nowait(entry)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries[handle] = entry
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "retrying": len(self._retries),
+            "completed": self._completed,
+            "failed": self._failed,
+            "retried": self._retried,
+        }
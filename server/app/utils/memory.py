@@ -0,0 +1,46 @@
+import threading
+from collections import Counter
+from typing import Any, Optional
+
+
+class MemoryDatabase:
+    """
+    Tables kept in plain dicts, for benchmarks and tests that must not touch the network.
+
+    Rows are keyed by their UID. Users are also indexed by (email, auth_provider) and
+    (username, auth_provider), and images by owner and by storage key, like the production
+    indexes. Everything lives in one worker and is gone when it exits.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.users: dict[str, dict[str, Any]] = {}
+        self.images: dict[str, dict[str, Any]] = {}
+        self.users_by_email: dict[tuple[str, str], str] = {}
+        self.users_by_username: dict[tuple[str, str], str] = {}
+        self.images_by_user: dict[str, set[str]] = {}
+        self.images_by_storage_key: dict[str, set[str]] = {}
+        # Label index: user UID to the number of images carrying each label.
+        self.user_labels: dict[str, Counter[str]] = {}
+
+
+_memory_database: Optional[MemoryDatabase] = None
+
+
+def start_memory_database() -> MemoryDatabase:
+    global _memory_database
+    if _memory_database is None:
+        _memory_database = MemoryDatabase()
+    return _memory_database
+
+
+async def close_memory_database() -> None:
+    global _memory_database
+    _memory_database = None
+
+
+def memory_database() -> MemoryDatabase:
+    """
+    Dependency to get the shared in-memory database.
+    """
+    return start_memory_database()
@@ -0,0 +1,60 @@
+from typing import Optional
+
+import urllib3
+from minio import Minio
+
+from app.config import (
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_READ_TIMEOUT_SECONDS,
+    MINIO_ACCESS_KEY,
+    MINIO_ENDPOINT,
+    MINIO_MAX_POOL_CONNECTIONS,
+    MINIO_REGION,
+    MINIO_SECRET_KEY,
+    MINIO_SECURE,
+)
+
+_minio_client: Optional[Minio] = None
+_minio_http: Optional[urllib3.PoolManager] = None
+
+
+def start_minio_client() -> Minio:
+    """
+    Create the MinIO client of this worker once. The connection pool is sized for parallel part
+    uploads, which would otherwise wait on urllib3's default of 10 connections per host.
+    """
+    global _minio_client, _minio_http
+    if _minio_client is None:
+        _minio_http = urllib3.PoolManager(
+            maxsize=MINIO_MAX_POOL_CONNECTIONS,
+            timeout=urllib3.Timeout(
+                connect=HTTP_CONNECT_TIMEOUT_SECONDS, read=HTTP_READ_TIMEOUT_SECONDS
+            ),
+            retries=urllib3.Retry(
+                total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+            ),
+        )
+        _minio_client = Minio(
+            MINIO_ENDPOINT,
+            access_key=MINIO_ACCESS_KEY,
+            secret_key=MINIO_SECRET_KEY,
+            secure=MINIO_SECURE,
+            region=MINIO_REGION,
+            http_client=_minio_http,
+        )
+    return _minio_client
+
+
+def close_minio_client() -> None:
+    global _minio_client, _minio_http
+    if _minio_http is not None:
+        _minio_http.clear()
+    _minio_client = None
+    _minio_http = None
+
+
+def minio_client() -> Minio:
+    """
+    Dependency to get the shared MinIO client, which is normally started in the app lifespan.
+    """
+    return start_minio_client()
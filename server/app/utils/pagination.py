@@ -0,0 +1,38 @@
+"""
+Opaque cursors for keyset pagination.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any
+
+
+def encode_cursor(sort_by: str, sort_order: str, value: Any, image_uid: str) -> str:
+    """
+    Encode the position after the last image of a page: its sort value and UID, along with the
+    ordering the cursor belongs to.
+    """
+    payload = json.dumps([sort_by, sort_order, value, image_uid], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple[Any, str]:
+    """
+    Decode a cursor back into (sort value, image UID).
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for a different ordering.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort_by, cursor_sort_order, value, image_uid = json.loads(
+            base64.urlsafe_b64decode(padded)
+        )
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order) or not isinstance(
+        image_uid, str
+    ):
+        raise ValueError("Cursor does not match the requested ordering")
+    return value, image_uid
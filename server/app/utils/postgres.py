@@ -0,0 +1,46 @@
+from typing import Optional
+
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from app.config import (
+    POSTGRES_POOL_MAX_SIZE,
+    POSTGRES_POOL_MIN_SIZE,
+    POSTGRES_POOL_TIMEOUT_SECONDS,
+    POSTGRES_URL,
+)
+
+_postgres_pool: Optional[AsyncConnectionPool] = None
+
+
+def start_postgres_pool() -> AsyncConnectionPool:
+    """
+    Create the connection pool of this worker once. Connections are checked out per query and
+    returned right after, so they are shared by every request. An async pool can only connect
+    from the event loop, so it is created closed and opened by its first query.
+    """
+    global _postgres_pool
+    if _postgres_pool is None:
+        _postgres_pool = AsyncConnectionPool(
+            POSTGRES_URL,
+            min_size=POSTGRES_POOL_MIN_SIZE,
+            max_size=POSTGRES_POOL_MAX_SIZE,
+            timeout=POSTGRES_POOL_TIMEOUT_SECONDS,
+            kwargs={"row_factory": dict_row},
+            open=False,
+        )
+    return _postgres_pool
+
+
+async def close_postgres_pool() -> None:
+    global _postgres_pool
+    if _postgres_pool is not None:
+        await _postgres_pool.close()
+        _postgres_pool = None
+
+
+def postgres_pool() -> AsyncConnectionPool:
+    """
+    Dependency to get the shared connection pool, which is normally created in the app lifespan.
+    """
+    return start_postgres_pool()
@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+from app.config import SQLITE_PATH
+
+# Mirrors the production tables. Lists such as labels are stored as JSON arrays and booleans as integers.
+# The images indexes end with image_uid so keyset pagination can seek on them.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_uid TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    last_active TEXT NOT NULL,
+    auth_provider TEXT NOT NULL DEFAULT 'email',
+    password TEXT,
+    avatar TEXT,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    labels TEXT NOT NULL DEFAULT '[]',
+    is_premium INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_email_idx ON users (email, auth_provider);
+CREATE INDEX IF NOT EXISTS users_username_idx ON users (username, auth_provider);
+
+CREATE TABLE IF NOT EXISTS images (
+    image_uid TEXT PRIMARY KEY,
+    user_uid TEXT NOT NULL REFERENCES users (user_uid),
+    title TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    labels TEXT NOT NULL DEFAULT '[]',
+    thumbnail_types TEXT NOT NULL DEFAULT '["image/png"]',
+    storage_key TEXT,
+    is_uploaded INTEGER NOT NULL DEFAULT 1,
+    is_thumbnail_uploaded INTEGER NOT NULL DEFAULT 1,
+    is_deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS images_user_created_at_idx ON images (user_uid, created_at, image_uid);
+CREATE INDEX IF NOT EXISTS images_user_updated_at_idx ON images (user_uid, updated_at, image_uid);
+CREATE INDEX IF NOT EXISTS images_user_title_idx ON images (user_uid, title, image_uid);
+CREATE INDEX IF NOT EXISTS images_user_file_name_idx ON images (user_uid, file_name, image_uid);
+
+CREATE TABLE IF NOT EXISTS user_labels (
+    user_uid TEXT NOT NULL REFERENCES users (user_uid),
+    label TEXT NOT NULL,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_uid, label)
+);
+"""
+# Columns added to the tables above since they were first created, added to older databases
+# when they are opened.
+ADDED_COLUMNS = {
+    "images": {
+        "thumbnail_types": "TEXT NOT NULL DEFAULT '[\"image/png\"]'",
+        "is_uploaded": "INTEGER NOT NULL DEFAULT 1",
+        "is_thumbnail_uploaded": "INTEGER NOT NULL DEFAULT 1",
+        "storage_key": "TEXT",
+    },
+}
+# Statements filling in an added column on the rows that predate it. Images uploaded before
+# storage keys are stored under their own UID.
+BACKFILLS = {
+    ("images", "storage_key"): "UPDATE images SET storage_key = image_uid",
+}
+# Indexes on added columns, created once the columns exist.
+ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS images_storage_key_idx ON images (storage_key);
+"""
+
+
+class SQLiteDatabase:
+    """
+    A single SQLite connection shared by the worker's threads, one statement batch at a time.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {
+                row["name"] for row in self._connection.execute(f"PRAGMA table_info({table})")
+            }
+            for column, definition in columns.items():
+                if column not in existing:
+                    self._connection.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+                    )
+                    if (table, column) in BACKFILLS:
+                        self._connection.execute(BACKFILLS[(table, column)])
+        self._connection.executescript(ADDED_INDEXES)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            yield self._connection
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+_sqlite_database: Optional[SQLiteDatabase] = None
+
+
+def start_sqlite_database() -> SQLiteDatabase:
+    """
+    Open the database of this worker once and create the tables if they do not exist yet.
+    """
+    global _sqlite_database
+    if _sqlite_database is None:
+        _sqlite_database = SQLiteDatabase(SQLITE_PATH)
+    return _sqlite_database
+
+
+async def close_sqlite_database() -> None:
+    global _sqlite_database
+    if _sqlite_database is not None:
+        _sqlite_database.close()
+        _sqlite_database = None
+
+
+def sqlite_database() -> SQLiteDatabase:
+    """
+    Dependency to get the shared database, which is normally opened in the app lifespan.
+    """
+    return start_sqlite_database()
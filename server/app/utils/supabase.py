@@ -1,11 +1,53 @@
-from supabase import create_client
+from typing import Optional
 
-from app.config import SUPABASE_KEY, SUPABASE_URL
+from supabase import Client, ClientOptions, create_client
 
+from app.config import (
+    SUPABASE_KEY,
+    SUPABASE_POSTGREST_TIMEOUT_SECONDS,
+    SUPABASE_STORAGE_TIMEOUT_SECONDS,
+    SUPABASE_URL,
+)
 
-def supabase_client():
-    client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    try:
-        yield client
-    finally:
-        pass
+_supabase_client: Optional[Client] = None
+
+
+def start_supabase_client() -> Client:
+    """
+    Create the Supabase client of this worker once. Its HTTP sessions keep their connections
+    alive across requests, so requests no longer pay for a new client and new connections.
+    """
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = create_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=ClientOptions(
+                postgrest_client_timeout=SUPABASE_POSTGREST_TIMEOUT_SECONDS,
+                storage_client_timeout=SUPABASE_STORAGE_TIMEOUT_SECONDS,
+            ),
+        )
+    return _supabase_client
+
+
+def close_supabase_client() -> None:
+    global _supabase_client
+    if _supabase_client is not None:
+        _supabase_client.postgrest.aclose()
+        _supabase_client.storage.aclose()
+        _supabase_client = None
+
+
+async def close_supabase_database() -> None:
+    """
+    Close the shared client from the database side, whose handlers are async. Whichever of the
+    database and the storage closes it first wins, the other finds it already closed.
+    """
+    close_supabase_client()
+
+
+def supabase_client() -> Client:
+    """
+    Dependency to get the shared Supabase client, which is normally started in the app lifespan.
+    """
+    return start_supabase_client()
@@ -0,0 +1,137 @@
+"""
+Spooling of uploaded files to disk, so image bytes are never held in memory as a whole.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_TMP_DIR
+
+# Leading bytes every file of each supported content type starts with.
+MAGIC_NUMBERS = {
+    "image/png": b"\x89PNG\r\n\x1a\n",
+    "image/jpeg": b"\xff\xd8\xff",
+}
+# Room for the form fields and multipart boundaries around the file itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def upload_too_large(max_bytes: int = MAX_UPLOAD_BYTES) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload exceeds the limit of {max_bytes} bytes.",
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject request bodies larger than MAX_UPLOAD_BYTES while they are being received, instead of
+    after the whole body has been parsed. A declared Content-Length over the limit is refused
+    right away; otherwise the body is counted as it arrives. path_limits raises or lowers the
+    limit for requests to particular paths.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+        path_limits: Optional[dict[str, int]] = None,
+    ) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                await send_error(send, status.HTTP_400_BAD_REQUEST, "Invalid Content-Length.")
+                return
+            if declared > limit:
+                error = upload_too_large(max_bytes)
+                await send_error(send, error.status_code, error.detail)
+                return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                # FastAPI lets an HTTPException raised while reading the body through as is.
+                if received > limit:
+                    raise upload_too_large(max_bytes)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+async def send_error(send: Send, status_code: int, detail: str) -> None:
+    """
+    Answer a request with a JSON error before the app sees it, and close the connection so the
+    rest of the body is not read.
+    """
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"connection", b"close")],
+        }
+    )
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+async def spool_upload(file: UploadFile, content_type: str) -> tuple[str, int, str]:
+    """
+    Copy an uploaded file into a temporary file, one chunk at a time. The format is sniffed from
+    the first chunk, so a file that is not the image it claims to be is turned away before the
+    rest is copied, and the size is checked and the file hashed as the chunks go by.
+
+    Returns:
+        - path: the temporary file, to be removed by the caller
+        - size: size of the file in bytes
+        - content_hash: sha256 hex digest of the file
+    """
+    fd, path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, prefix="upload-")
+    size = 0
+    digest = hashlib.sha256()
+
+    def write(spool: BinaryIO, chunk: bytes) -> None:
+        # hashlib lets go of the GIL on large chunks, so both run off the event loop.
+        digest.update(chunk)
+        spool.write(chunk)
+
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if size == 0 and not chunk.startswith(MAGIC_NUMBERS[content_type]):
+                    raise HTTPException(
+                        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                        detail=f"File content is not {content_type}.",
+                    )
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise upload_too_large()
+                await run_in_threadpool(write, spool, chunk)
+        if size == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty file.")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
@@ -0,0 +1,29 @@
+-- Soft deletes a live image and takes it out of the owner's image_count and label index, in one
+-- transaction. Called by SupabaseTable.delete_image. Returns false if the image does not exist
+-- or has already been deleted. Requires user_labels.sql.
+CREATE OR REPLACE FUNCTION delete_image(
+    p_image_uid text,
+    p_updated_at timestamptz
+) RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_uid text;
+    v_labels text[];
+BEGIN
+    UPDATE images SET is_deleted = true, updated_at = p_updated_at
+    WHERE image_uid = p_image_uid AND is_deleted = false
+    RETURNING user_uid, coalesce(labels, '{}') INTO v_user_uid, v_labels;
+    IF NOT FOUND THEN
+        RETURN false;
+    END IF;
+
+    UPDATE user_labels SET image_count = image_count - 1
+    WHERE user_uid = v_user_uid AND label = ANY(v_labels);
+
+    UPDATE users SET image_count = image_count - 1
+    WHERE user_uid = v_user_uid;
+
+    RETURN true;
+END;
+$$;
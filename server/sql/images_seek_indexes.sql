@@ -0,0 +1,7 @@
+-- Indexes for keyset pagination of a user's images (GET /user/images with a cursor).
+-- Each one matches an ORDER BY <sort_by>, image_uid seek, so every page is a single index
+-- range scan no matter how deep it is.
+CREATE INDEX IF NOT EXISTS images_user_created_at_idx ON images (user_uid, created_at, image_uid);
+CREATE INDEX IF NOT EXISTS images_user_updated_at_idx ON images (user_uid, updated_at, image_uid);
+CREATE INDEX IF NOT EXISTS images_user_title_idx ON images (user_uid, title, image_uid);
+CREATE INDEX IF NOT EXISTS images_user_file_name_idx ON images (user_uid, file_name, image_uid);
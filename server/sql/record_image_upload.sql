@@ -0,0 +1,46 @@
+-- Records a newly uploaded image in one transaction, called by SupabaseTable.record_image_upload
+-- through PostgREST's rpc endpoint. The row locks taken by the upserts serialize concurrent
+-- uploads of the same user, so image_count and the label index never lose an update.
+-- Requires user_labels.sql, thumbnail_types.sql, upload_flags.sql and storage_keys.sql.
+DROP FUNCTION IF EXISTS record_image_upload(
+    text, text, text, text, text, bigint, text, text[], timestamptz
+);
+DROP FUNCTION IF EXISTS record_image_upload(
+    text, text, text, text, text, bigint, text, text[], text[], timestamptz
+);
+
+CREATE OR REPLACE FUNCTION record_image_upload(
+    p_image_uid text,
+    p_user_uid text,
+    p_title text,
+    p_file_name text,
+    p_content_type text,
+    p_size bigint,
+    p_content_hash text,
+    p_labels text[],
+    p_thumbnail_types text[],
+    p_storage_key text,
+    p_is_stored boolean,
+    p_created_at timestamptz
+) RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO images (
+        image_uid, user_uid, title, file_name, content_type, size, content_hash,
+        created_at, updated_at, labels, thumbnail_types, storage_key, is_uploaded,
+        is_thumbnail_uploaded, is_deleted
+    ) VALUES (
+        p_image_uid, p_user_uid, p_title, p_file_name, p_content_type, p_size, p_content_hash,
+        p_created_at, p_created_at, p_labels, p_thumbnail_types, p_storage_key, p_is_stored,
+        p_is_stored, false
+    );
+
+    INSERT INTO user_labels (user_uid, label, image_count)
+    SELECT DISTINCT p_user_uid, label, 1 FROM unnest(p_labels) AS label
+    ON CONFLICT (user_uid, label) DO UPDATE SET image_count = user_labels.image_count + 1;
+
+    UPDATE users
+    SET image_count = image_count + 1,
+        last_active = p_created_at
+    WHERE user_uid = p_user_uid;
+$$;
@@ -0,0 +1,50 @@
+-- Records a batch of uploaded images of one user in one transaction, called by
+-- SupabaseTable.record_image_uploads through PostgREST's rpc endpoint. p_images is a JSON array
+-- of image rows as built by build_new_image. Requires user_labels.sql, thumbnail_types.sql,
+-- upload_flags.sql and storage_keys.sql.
+CREATE OR REPLACE FUNCTION record_image_uploads(
+    p_user_uid text,
+    p_images jsonb
+) RETURNS void
+LANGUAGE sql
+AS $$
+    WITH new_images AS (
+        INSERT INTO images (
+            image_uid, user_uid, title, file_name, content_type, size, content_hash,
+            created_at, updated_at, labels, thumbnail_types, storage_key, is_uploaded,
+            is_thumbnail_uploaded, is_deleted
+        )
+        SELECT image_uid, p_user_uid, title, file_name, content_type, size, content_hash,
+               created_at, created_at, labels, thumbnail_types, storage_key, is_uploaded,
+               is_thumbnail_uploaded, false
+        FROM jsonb_to_recordset(p_images) AS x(
+            image_uid text,
+            title text,
+            file_name text,
+            content_type text,
+            size bigint,
+            content_hash text,
+            labels text[],
+            thumbnail_types text[],
+            storage_key text,
+            is_uploaded boolean,
+            is_thumbnail_uploaded boolean,
+            created_at timestamptz
+        )
+        RETURNING image_uid, created_at, labels
+    ), counted AS (
+        INSERT INTO user_labels (user_uid, label, image_count)
+        SELECT p_user_uid, label, count(DISTINCT new_images.image_uid)
+        FROM new_images, unnest(new_images.labels) AS label
+        GROUP BY label
+        ON CONFLICT (user_uid, label)
+        DO UPDATE SET image_count = user_labels.image_count + excluded.image_count
+    )
+    UPDATE users
+    SET image_count = users.image_count + batch.image_count,
+        last_active = batch.last_active
+    FROM (
+        SELECT count(*) AS image_count, max(created_at) AS last_active FROM new_images
+    ) AS batch
+    WHERE users.user_uid = p_user_uid AND batch.image_count > 0;
+$$;
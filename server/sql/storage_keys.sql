@@ -0,0 +1,10 @@
+-- Name under which each image's original and thumbnails are stored: the sha256 hex digest of the
+-- uploaded file, so images uploaded with the same content share one copy of the files. Images
+-- uploaded before this column was added are stored under their own UID.
+ALTER TABLE images ADD COLUMN IF NOT EXISTS storage_key text;
+UPDATE images SET storage_key = image_uid WHERE storage_key IS NULL;
+ALTER TABLE images ALTER COLUMN storage_key SET NOT NULL;
+
+-- Finds a stored copy of an upload's content, and counts the images still sharing it when one
+-- is deleted.
+CREATE INDEX IF NOT EXISTS images_storage_key_idx ON images (storage_key) WHERE is_deleted = false;
@@ -0,0 +1,4 @@
+-- Media types each image's thumbnail is stored in. Thumbnails uploaded before this column was
+-- added exist as PNG only, which is what the default records for them.
+ALTER TABLE images
+    ADD COLUMN IF NOT EXISTS thumbnail_types text[] NOT NULL DEFAULT '{image/png}';
@@ -0,0 +1,37 @@
+-- Replaces the labels of a live image and moves its counts in the owner's label index, in one
+-- transaction. Called by SupabaseTable.update_image_labels. Returns false if the image does not
+-- exist or has been deleted. Requires user_labels.sql.
+CREATE OR REPLACE FUNCTION update_image_labels(
+    p_image_uid text,
+    p_labels text[],
+    p_updated_at timestamptz
+) RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_uid text;
+    v_old_labels text[];
+BEGIN
+    SELECT user_uid, coalesce(labels, '{}') INTO v_user_uid, v_old_labels
+    FROM images WHERE image_uid = p_image_uid AND is_deleted = false
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN false;
+    END IF;
+
+    UPDATE images SET labels = p_labels, updated_at = p_updated_at
+    WHERE image_uid = p_image_uid;
+
+    UPDATE user_labels SET image_count = image_count - 1
+    WHERE user_uid = v_user_uid
+      AND label = ANY(v_old_labels)
+      AND NOT label = ANY(p_labels);
+
+    INSERT INTO user_labels (user_uid, label, image_count)
+    SELECT DISTINCT v_user_uid, label, 1 FROM unnest(p_labels) AS label
+    WHERE NOT label = ANY(v_old_labels)
+    ON CONFLICT (user_uid, label) DO UPDATE SET image_count = user_labels.image_count + 1;
+
+    RETURN true;
+END;
+$$;
@@ -0,0 +1,10 @@
+-- Whether the original and the thumbnails of each image are in storage. Uploads record the image
+-- first and set these once the files are stored; thumbnails are made by a background job.
+-- Images uploaded before these columns were added are all stored, as the defaults record.
+ALTER TABLE images
+    ADD COLUMN IF NOT EXISTS is_uploaded boolean NOT NULL DEFAULT true,
+    ADD COLUMN IF NOT EXISTS is_thumbnail_uploaded boolean NOT NULL DEFAULT true;
+
+-- Finds the images left without thumbnails, which the server queues again when it starts.
+CREATE INDEX IF NOT EXISTS images_unprocessed_idx ON images (image_uid)
+    WHERE is_uploaded AND NOT is_thumbnail_uploaded AND is_deleted = false;
@@ -0,0 +1,17 @@
+-- Per-user label index: how many live images of each user carry each label. Kept up to date by
+-- record_image_upload, update_image_labels and delete_image, and read for label facets and to
+-- plan label filters.
+CREATE TABLE IF NOT EXISTS user_labels (
+    user_uid text NOT NULL REFERENCES users (user_uid),
+    label text NOT NULL,
+    image_count integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_uid, label)
+);
+
+-- Backfill from the existing images. Safe to run again: counts are recomputed from scratch.
+INSERT INTO user_labels (user_uid, label, image_count)
+SELECT user_uid, label, count(DISTINCT image_uid)
+FROM images, unnest(labels) AS label
+WHERE is_deleted = false
+GROUP BY user_uid, label
+ON CONFLICT (user_uid, label) DO UPDATE SET image_count = excluded.image_count;
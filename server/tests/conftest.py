@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its configuration when it is imported, so the providers are chosen before any
+# test module imports it: the in-memory database and local storage, with nothing on the network.
+os.environ.update(
+    DATABASE_PROVIDER="memory",
+    STORAGE_PROVIDER="filesystem",
+    FILESYSTEM_STORAGE_DIR=tempfile.mkdtemp(prefix="termipics-storage-"),
+    UPLOAD_TMP_DIR=tempfile.mkdtemp(prefix="termipics-uploads-"),
+    THUMBNAIL_CACHE_DIR=tempfile.mkdtemp(prefix="termipics-thumbnails-"),
+    JWT_SECRET="test-secret",
+)
+
+from app.dependencies.db import MemoryTable, SQLiteTable, TableOperator  # noqa: E402
+from app.utils.memory import MemoryDatabase  # noqa: E402
+from app.utils.sqlite import SQLiteDatabase  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def db(request: pytest.FixtureRequest, tmp_path) -> TableOperator:
+    """
+    A handler on an empty database of each local backend.
+    """
+    if request.param == "memory":
+        yield MemoryTable(MemoryDatabase())
+        return
+    database = SQLiteDatabase(str(tmp_path / "termipics.db"))
+    yield SQLiteTable(database)
+    database.close()
+
+
+@pytest.fixture
+async def user_uid(db: TableOperator) -> str:
+    return await db.insert_new_user("alice@example.com", "alice", "email", hashed_password="x")
@@ -0,0 +1,152 @@
+from collections import Counter
+
+import pytest
+
+from app.dependencies.db import IMAGES_PER_PAGE, TableOperator
+
+pytestmark = pytest.mark.anyio
+
+
+async def upload(db: TableOperator, user_uid: str, labels: list[str], **kwargs) -> str:
+    return await db.record_image_upload(
+        user_uid, kwargs.pop("title", "title"), "a.png", "image/png", 1, labels, **kwargs
+    )
+
+
+async def assert_counts(db: TableOperator, user_uid: str, image_uids: list[str]) -> None:
+    """
+    The user's image_count and label index must agree with the live images.
+    """
+    live = await db.get_images_info(image_uids, ["labels"])
+    user = await db.get_user_info(["image_count"], user_uid=user_uid)
+    assert user["image_count"] == len(live)
+    expected = Counter(label for image in live.values() for label in set(image["labels"]))
+    assert await db.get_label_counts(user_uid) == dict(expected)
+
+
+async def test_upload_counts_image_and_labels(db: TableOperator, user_uid: str):
+    image_uids = [
+        await upload(db, user_uid, ["cat", "dog"]),
+        await upload(db, user_uid, ["cat", "cat"]),
+        await upload(db, user_uid, []),
+    ]
+
+    await assert_counts(db, user_uid, image_uids)
+    assert await db.get_label_counts(user_uid) == {"cat": 2, "dog": 1}
+
+
+async def test_bulk_upload_counts_like_single_uploads(db: TableOperator, user_uid: str):
+    image_uids = await db.record_image_uploads(
+        user_uid,
+        [
+            {
+                "title": f"title {i}",
+                "file_name": "a.png",
+                "content_type": "image/png",
+                "size": 1,
+                "labels": labels,
+            }
+            for i, labels in enumerate([["cat"], ["cat", "dog"], ["dog", "dog"]])
+        ],
+    )
+
+    assert len(image_uids) == 3
+    await assert_counts(db, user_uid, image_uids)
+    assert await db.get_label_counts(user_uid) == {"cat": 2, "dog": 2}
+
+
+async def test_relabel_moves_label_counts(db: TableOperator, user_uid: str):
+    first = await upload(db, user_uid, ["cat", "dog"])
+    second = await upload(db, user_uid, ["dog"])
+
+    assert await db.update_image_labels(first, ["dog", "bird", "bird"])
+
+    await assert_counts(db, user_uid, [first, second])
+    assert await db.get_label_counts(user_uid) == {"dog": 2, "bird": 1}
+    assert (await db.find_image(first, ["labels"]))["labels"] == ["dog", "bird"]
+
+
+async def test_relabel_of_missing_image_changes_nothing(db: TableOperator, user_uid: str):
+    image_uid = await upload(db, user_uid, ["cat"])
+    await db.delete_image(image_uid)
+
+    assert not await db.update_image_labels(image_uid, ["dog"])
+    assert not await db.update_image_labels("missing", ["dog"])
+    await assert_counts(db, user_uid, [image_uid])
+
+
+async def test_delete_uncounts_once(db: TableOperator, user_uid: str):
+    kept = await upload(db, user_uid, ["cat"])
+    deleted = await upload(db, user_uid, ["cat", "dog"])
+
+    assert await db.delete_image(deleted)
+    assert not await db.delete_image(deleted)
+
+    await assert_counts(db, user_uid, [kept, deleted])
+    assert await db.get_label_counts(user_uid) == {"cat": 1}
+    assert await db.find_image(deleted, ["labels"]) is None
+
+
+async def test_label_filter_plan(db: TableOperator, user_uid: str):
+    await upload(db, user_uid, ["cat", "dog"])
+    await upload(db, user_uid, ["dog"])
+
+    assert await db.plan_label_filter(user_uid, []) == []
+    assert await db.plan_label_filter(user_uid, ["zebra"]) is None
+    assert await db.plan_label_filter(user_uid, ["cat", "zebra", "dog", "cat"]) == ["dog", "cat"]
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+async def test_seek_pages_cover_every_image_once(db: TableOperator, user_uid: str, sort_order: str):
+    # Shared titles make the pages rely on image_uid to break ties.
+    image_uids = [
+        await upload(db, user_uid, ["cat"] if i % 2 else [], title=f"title {i % 5}")
+        for i in range(2 * IMAGES_PER_PAGE + 5)
+    ]
+
+    seen = []
+    after = None
+    while True:
+        rows = await db.seek_images(user_uid, "title", sort_order, None, after=after)
+        seen.extend(rows)
+        if len(rows) < IMAGES_PER_PAGE:
+            break
+        after = rows[-1]
+
+    assert sorted(image_uid for _, image_uid in seen) == sorted(image_uids)
+    assert seen == sorted(seen, reverse=sort_order == "desc")
+
+
+async def test_seek_is_not_shifted_by_new_uploads(db: TableOperator, user_uid: str):
+    for i in range(IMAGES_PER_PAGE + 5):
+        await upload(db, user_uid, [], title=f"title {i:02}")
+
+    first_page = await db.seek_images(user_uid, "title", "asc", None)
+    await upload(db, user_uid, [], title="title 00")
+    second_page = await db.seek_images(user_uid, "title", "asc", None, after=first_page[-1])
+
+    assert len(second_page) == 5
+    assert not {uid for _, uid in first_page} & {uid for _, uid in second_page}
+
+
+async def test_seek_filters_on_labels(db: TableOperator, user_uid: str):
+    cats = {await upload(db, user_uid, ["cat"]) for _ in range(3)}
+    await upload(db, user_uid, ["dog"])
+
+    rows = await db.seek_images(user_uid, "created_at", "desc", ["cat"])
+
+    assert {image_uid for _, image_uid in rows} == cats
+
+
+async def test_storage_references_count_live_images(db: TableOperator, user_uid: str):
+    other_uid = await db.insert_new_user("bob@example.com", "bob", "email", hashed_password="x")
+    first = await upload(db, user_uid, [], storage_key="shared", is_stored=True)
+    second = await upload(db, other_uid, [], storage_key="shared", is_stored=True)
+    await upload(db, user_uid, [], storage_key="other", is_stored=True)
+
+    assert await db.count_storage_references("shared") == 2
+    await db.delete_image(first)
+    assert await db.count_storage_references("shared") == 1
+    await db.delete_image(second)
+    assert await db.count_storage_references("shared") == 0
+    assert await db.count_storage_references("other") == 1
@@ -0,0 +1,27 @@
+import pytest
+
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("created_at", "desc", "2025-01-01T00:00:00+00:00", "image-uid")
+
+    assert decode_cursor(cursor, "created_at", "desc") == (
+        "2025-01-01T00:00:00+00:00",
+        "image-uid",
+    )
+
+
+def test_cursor_of_other_ordering_is_rejected():
+    cursor = encode_cursor("title", "asc", "a", "image-uid")
+
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "title", "desc")
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "created_at", "asc")
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "W10", encode_cursor("title", "asc", 1, 2)])
+def test_malformed_cursor_is_rejected(cursor: str):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "title", "asc")
@@ -0,0 +1,120 @@
+import io
+import time
+from functools import partial
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.config import FILESYSTEM_STORAGE_DIR
+from app.dependencies.db import IMAGES_PER_PAGE, get_db_client, get_db_handler
+from app.main import app
+from app.utils.auth import create_access_token
+
+
+@pytest.fixture
+def client() -> TestClient:
+    with TestClient(app) as client:
+        yield client
+
+
+def sign_up(client: TestClient, username: str) -> dict[str, str]:
+    db = get_db_handler(get_db_client())
+    user_uid = client.portal.call(
+        partial(db.insert_new_user, f"{username}@example.com", username, "email", "x")
+    )
+    return {"Authorization": f"Bearer {create_access_token(user_uid=user_uid)}"}
+
+
+def make_png(color: tuple[int, int, int]) -> bytes:
+    image = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(image, format="PNG")
+    return image.getvalue()
+
+
+def upload(client: TestClient, headers: dict[str, str], data: bytes, labels: str = "") -> str:
+    response = client.post(
+        "/image/upload",
+        files={"file": ("a.png", data, "image/png")},
+        data={"title": "title", "labels": labels},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    return response.json()["image_uid"]
+
+
+def wait_until_processed(client: TestClient, headers: dict[str, str], image_uid: str) -> None:
+    for _ in range(100):
+        response = client.get(f"/image/status/{image_uid}", headers=headers)
+        if response.json()["is_thumbnail_uploaded"]:
+            return
+        time.sleep(0.05)
+    pytest.fail(f"Image {image_uid} was not processed")
+
+
+def stored_files() -> set[Path]:
+    return {path for path in Path(FILESYSTEM_STORAGE_DIR).rglob("*") if path.is_file()}
+
+
+def test_shared_content_is_deleted_with_its_last_image(client: TestClient):
+    alice, bob = sign_up(client, "alice"), sign_up(client, "bob")
+    data = make_png((200, 30, 30))
+    before = stored_files()
+
+    first = upload(client, alice, data)
+    wait_until_processed(client, alice, first)
+    stored = stored_files()
+    second = upload(client, bob, data)
+    wait_until_processed(client, bob, second)
+
+    # The second upload reuses the stored original and thumbnails.
+    assert stored_files() == stored
+    assert client.delete(f"/image/{first}", headers=alice).status_code == 204
+    assert stored_files() == stored
+    assert client.get(f"/image/{second}").content == client.get(f"/image/{second}").content
+    assert client.get(f"/image/thumbnail/{second}", headers=bob).status_code == 200
+    assert client.delete(f"/image/{second}", headers=bob).status_code == 204
+    assert stored_files() == before
+    assert client.get(f"/image/{second}").status_code == 404
+
+
+def test_counts_follow_uploads_relabels_and_deletes(client: TestClient):
+    carol = sign_up(client, "carol")
+    first = upload(client, carol, make_png((30, 200, 30)), labels="cat,dog")
+    second = upload(client, carol, make_png((30, 30, 200)), labels="cat")
+
+    response = client.patch(f"/image/info/{first}", json={"labels": ["dog", "bird"]}, headers=carol)
+    assert response.status_code == 200
+    assert client.delete(f"/image/{second}", headers=carol).status_code == 204
+
+    labels = client.get("/user/labels", headers=carol).json()["labels"]
+    assert {facet["label"]: facet["count"] for facet in labels} == {"dog": 1, "bird": 1}
+    info = client.get("/user/info", params={"keys": "image_count,labels"}, headers=carol).json()
+    assert info["image_count"] == 1
+    assert sorted(info["labels"]) == ["bird", "dog"]
+
+
+def test_cursor_pages_through_every_image(client: TestClient):
+    dave = sign_up(client, "dave")
+    db = get_db_handler(get_db_client())
+    user_uid = client.portal.call(partial(db.get_user_uid, "email", username="dave"))
+    image_uids = {
+        client.portal.call(
+            partial(db.record_image_upload, user_uid, f"{i}", "a.png", "image/png", 1, [])
+        )
+        for i in range(IMAGES_PER_PAGE + 3)
+    }
+
+    seen = []
+    params = {"sort_by": "title", "sort_order": "asc", "labels": ""}
+    while True:
+        page = client.get("/user/images", params=params, headers=dave).json()
+        seen.extend(page["image_uid"])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+
+    assert len(seen) == len(image_uids) and set(seen) == image_uids
+    params["cursor"] = "not a cursor"
+    assert client.get("/user/images", params=params, headers=dave).status_code == 400